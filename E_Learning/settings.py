@@ -2,7 +2,7 @@
 
 from pathlib import Path, os
 from datetime import timedelta
-from decouple import config
+from decouple import Csv, config
 import pymysql
 pymysql.install_as_MySQLdb()
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -124,6 +124,55 @@ DATABASES = {
 }
 
 
+# Cache
+# Local memory by default; point REDIS_URL at a Redis server to share the
+# catalog cache between workers.
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'edulearn',
+        }
+    }
+
+# Seconds a cached catalog response lives; 0 disables the catalog cache.
+# Entries are also dropped whenever a Course, Module, Lesson or Category
+# changes, and enrollment counts are merged in live, so this mainly bounds how
+# stale ratings get. It is also how long per-course enrollment counts are cached.
+CATALOG_CACHE_TIMEOUT = config('CATALOG_CACHE_TIMEOUT', default=300, cast=int)
+
+# Write-behind buffer for POST /progress/ (courses.progress_buffer). Buffered
+# updates reach the database after at most MAX_DELAY seconds or once
+# MAX_ITEMS are pending. Needs a shared cache (REDIS_URL); it stays off on the
+# process-local LocMemCache used without one.
+PROGRESS_WRITE_BUFFER = config('PROGRESS_WRITE_BUFFER', default=False, cast=bool)
+PROGRESS_BUFFER_MAX_DELAY = config('PROGRESS_BUFFER_MAX_DELAY', default=5, cast=int)
+PROGRESS_BUFFER_MAX_ITEMS = config('PROGRESS_BUFFER_MAX_ITEMS', default=1000, cast=int)
+
+# Course thumbnail variants (courses.thumbnails): widths rendered as WebP and
+# JPEG, on a background thread unless turned off.
+THUMBNAIL_WIDTHS = config('THUMBNAIL_WIDTHS', default='160,320,640,960', cast=Csv(int))
+THUMBNAIL_VARIANTS_IN_BACKGROUND = config('THUMBNAIL_VARIANTS_IN_BACKGROUND', default=True, cast=bool)
+
+# Lesson resource downloads (courses.downloads). '' streams from Django;
+# 'x-accel-redirect' (nginx, internal location at RESOURCE_SENDFILE_PREFIX
+# aliased to MEDIA_ROOT) or 'x-sendfile' hands the transfer to the proxy.
+RESOURCE_SENDFILE = config('RESOURCE_SENDFILE', default='')
+RESOURCE_SENDFILE_PREFIX = config('RESOURCE_SENDFILE_PREFIX', default='/protected-media/')
+
+# Resumable lesson resource uploads (courses.uploads).
+UPLOAD_CHUNK_SIZE = config('UPLOAD_CHUNK_SIZE', default=8 * 1024 * 1024, cast=int)
+UPLOAD_MAX_SIZE = config('UPLOAD_MAX_SIZE', default=2 * 1024 ** 3, cast=int)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
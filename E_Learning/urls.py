@@ -4,6 +4,7 @@ from django.urls import path, include
 from courses.router import urls
 from django.conf import settings
 from django.conf.urls.static import static
+from django.http import HttpResponseNotFound
 from courses.views import CourseViewSet
 from assessments.urls import urls as assessment_urls
 from payments import views as payment_views
@@ -30,4 +31,11 @@ urlpatterns = [
     path('api/v1/courses/<int:pk>/toggle_lesson_progress/', CourseViewSet.as_view({'post': 'toggle_lesson_progress'})),
     path('api/v1/courses/<int:pk>/progress/', CourseViewSet.as_view({'get': 'progress'}), name='course-progress'),
     path('api/v1/courses/<int:pk>/enroll/', CourseViewSet.as_view({'post': 'enroll'}), name='course-enroll'),
+
+    # Lesson resources and course bundles are only served by
+    # /api/v1/lessons/<id>/resource/ and /api/v1/courses/<id>/bundle/.
+    path(f"{settings.MEDIA_URL.lstrip('/')}lessons/resources/<path:path>",
+         lambda request, path: HttpResponseNotFound()),
+    path(f"{settings.MEDIA_URL.lstrip('/')}bundles/<path:path>",
+         lambda request, path: HttpResponseNotFound()),
 ] + static(settings.MEDIA_URL, document_root = settings.MEDIA_ROOT)
@@ -2,6 +2,7 @@ from rest_framework import viewsets, permissions, status
 from django.db.models import Q
 
 from rest_framework.response import Response
+from courses.pagination import KeysetPagination
 from .models import Assessment, Question, Choice, UserAttempt, UserResponse
 from .serializers import (
     AssessmentSerializer,
@@ -52,6 +53,7 @@ class ChoiceViewSet(viewsets.ModelViewSet):
 class UserAttemptViewSet(viewsets.ModelViewSet):
     serializer_class = UserAttemptSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         return UserAttempt.objects.filter(user=self.request.user)
@@ -1,4 +1,5 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from .cloning import clone_course
 from .models import Category, Course, Module, Lesson, Enrollment, ReviewRating, UserProgress, Contact
 
 class LessonInline(admin.TabularInline):
@@ -23,9 +24,28 @@ class CourseAdmin(admin.ModelAdmin):
     list_filter = ('category', 'created_at')
     search_fields = ('title', 'description')
     inlines = [EnrollmentInline]
+    actions = ['clone_with_assessments', 'clone_without_assessments']
     
     # Remove ModuleInline from inlines
 
+    def clone_courses(self, request, queryset, include_assessments):
+        for course_id in queryset.values_list('pk', flat=True):
+            course, counts = clone_course(course_id, include_assessments=include_assessments)
+            self.message_user(
+                request,
+                f'Created "{course.title}" with {counts["modules"]} modules and '
+                f'{counts["lessons"]} lessons.',
+                messages.SUCCESS,
+            )
+
+    @admin.action(description="Clone selected courses with their assessments")
+    def clone_with_assessments(self, request, queryset):
+        self.clone_courses(request, queryset, include_assessments=True)
+
+    @admin.action(description="Clone selected courses without assessments")
+    def clone_without_assessments(self, request, queryset):
+        self.clone_courses(request, queryset, include_assessments=False)
+
 class CategoryAdmin(admin.ModelAdmin):
     list_display = ('name', 'slug')
     prepopulated_fields = {'slug': ('name',)}
@@ -0,0 +1,41 @@
+"""
+Token authentication for the hot write endpoints.
+
+JWTStatelessUserAuthentication trusts the token alone, so a deactivated or
+deleted account keeps working until its token expires.
+ActiveTokenUserAuthentication adds the account check back for one cache read:
+the active flag is cached per user and dropped whenever the user row is
+saved or deleted (see courses.signals).
+"""
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+
+from users.models import UserAccount
+
+ACTIVE_USER_TTL = 60 * 5
+
+
+def active_user_key(user_id):
+    return f'user-active:{user_id}'
+
+
+def user_is_active(user_id):
+    active = cache.get(active_user_key(user_id))
+    if active is None:
+        active = UserAccount.objects.filter(pk=user_id, is_active=True).exists()
+        cache.set(active_user_key(user_id), active, ACTIVE_USER_TTL)
+    return active
+
+
+def forget_user(user_id):
+    cache.delete(active_user_key(user_id))
+
+
+class ActiveTokenUserAuthentication(JWTStatelessUserAuthentication):
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+        if not user_is_active(user.pk):
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        return user
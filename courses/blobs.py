@@ -0,0 +1,143 @@
+"""
+Reference counts for blobs in ContentAddressedStorage (courses.storage).
+
+Blobs are shared, so a model row letting go of a file must not delete it.
+Instead StoredBlob.references counts the fields pointing at each blob:
+Course.thumbnail, Lesson.resources and the variants in
+Course.thumbnail_variants. Saves and deletes adjust the counts (see
+courses.signals), and code writing these fields with update() calls
+update_references() itself. ``manage.py collect_blobs`` recounts from the
+tables, then deletes blobs that are unreferenced and older than a grace
+period. An upload is stored before the row pointing at it is saved.
+"""
+import datetime
+import os
+import time
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Course, Lesson, ResourceUpload, StoredBlob
+from .storage import TEMP_DIR, blob_storage
+
+BLOB_FIELDS = {Course: ('thumbnail',), Lesson: ('resources',)}
+
+
+def variant_names(variants):
+    """Blob names in a Course.thumbnail_variants document ({format: {width: name}})."""
+    return [
+        name for entry in (variants or {}).values() if isinstance(entry, dict)
+        for name in entry.values()
+    ]
+
+
+def register_blob(name, digest, size):
+    """
+    Record a stored blob. Storing an existing one again restarts its grace
+    period, so collect_blobs() cannot purge it before the new row points at it.
+    """
+    StoredBlob.objects.bulk_create(
+        [StoredBlob(name=name, digest=digest, size=size)],
+        update_conflicts=True, unique_fields=['name'], update_fields=['created_at'],
+    )
+
+
+def blob_names(instance, variants=True):
+    """Names of the blobs a Course or Lesson instance points at."""
+    names = [getattr(instance, field).name for field in BLOB_FIELDS[type(instance)]]
+    if variants and isinstance(instance, Course):
+        names += variant_names(instance.thumbnail_variants)
+    return [name for name in names if name]
+
+
+def stored_blob_names(model, pk, variants=True):
+    variants = variants and model is Course
+    fields = BLOB_FIELDS[model] + (('thumbnail_variants',) if variants else ())
+    row = model.objects.filter(pk=pk).values_list(*fields).first()
+    if row is None:
+        return []
+    names = list(row[:len(BLOB_FIELDS[model])])
+    if variants:
+        names += variant_names(row[-1])
+    return [name for name in names if name]
+
+
+def update_references(old_names, new_names):
+    changes = Counter(new_names)
+    changes.subtract(Counter(old_names))
+    # One update per distinct change, however many names share it.
+    by_delta = {}
+    for name, delta in changes.items():
+        if delta:
+            by_delta.setdefault(delta, []).append(name)
+    for delta, names in by_delta.items():
+        StoredBlob.objects.filter(name__in=names).update(references=F('references') + delta)
+
+
+def referenced_names(names=None):
+    """Counter of references per blob name, from the tables themselves."""
+    counts = Counter()
+    for model, fields in BLOB_FIELDS.items():
+        for field in fields:
+            rows = model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+            if names is not None:
+                rows = rows.filter(**{f'{field}__in': names})
+            counts.update(rows.values_list(field, flat=True))
+    for variants in Course.objects.exclude(thumbnail_variants={}).values_list(
+        'thumbnail_variants', flat=True
+    ):
+        counts.update(name for name in variant_names(variants) if names is None or name in names)
+    return counts
+
+
+def recount_references():
+    """Reset every StoredBlob.references from the tables; returns how many were off."""
+    counts = referenced_names()
+    blobs = [
+        blob for blob in StoredBlob.objects.only('id', 'name', 'references')
+        if blob.references != counts.get(blob.name, 0)
+    ]
+    for blob in blobs:
+        blob.references = counts.get(blob.name, 0)
+    StoredBlob.objects.bulk_update(blobs, ['references'], batch_size=500)
+    return len(blobs)
+
+
+def collect_blobs(grace=datetime.timedelta(days=1)):
+    """
+    Delete blobs nobody references that are older than ``grace``, and stale
+    partial and chunked uploads. Returns ``(blobs_deleted, bytes_freed)``.
+    """
+    cutoff = timezone.now() - grace
+    candidates = {
+        blob.name: blob for blob in StoredBlob.objects.filter(
+            references__lte=0, created_at__lt=cutoff
+        )
+    }
+    # Re-check against the tables in case a reference appeared meanwhile.
+    still_used = referenced_names(list(candidates))
+    deleted, freed = 0, 0
+    for name, blob in candidates.items():
+        if still_used.get(name):
+            continue
+        with transaction.atomic():
+            # Only if nobody stored it again meanwhile (register_blob); an
+            # upload of the same content waits for this to commit.
+            if not StoredBlob.objects.filter(
+                pk=blob.pk, references__lte=0, created_at__lt=cutoff
+            ).delete()[0]:
+                continue
+            blob_storage.purge(name)
+        deleted += 1
+        freed += blob.size
+
+    # Abandoned chunked uploads (courses.uploads) and stale partial files.
+    ResourceUpload.objects.filter(updated_at__lt=cutoff).delete()
+    temp_dir = blob_storage.path(TEMP_DIR)
+    if os.path.isdir(temp_dir):
+        for entry in os.scandir(temp_dir):
+            if entry.stat().st_mtime < time.time() - grace.total_seconds():
+                os.unlink(entry.path)
+    return deleted, freed
@@ -0,0 +1,148 @@
+"""
+Offline course bundles.
+
+GET /courses/<id>/bundle/ sends an enrolled learner a zip with everything
+needed to follow the course offline:
+
+* ``outline.json``: the stored outline (courses.outline),
+* ``lessons/<lesson id>.html``: each lesson's rendered body,
+* ``resources/<lesson id>/<file name>``: each lesson's resource file, under
+  the name it was uploaded with.
+
+The first download writes the zip entry by entry straight into the
+response, so memory stays bounded by one block whatever the resources
+weigh, and keeps a copy under ``bundles/`` in the media storage. The copy
+is named after the course's content_version and updated_at, which move on
+every change to the course, its modules or lessons but not on enrollments
+or ratings, so finding it costs no lesson query; later downloads of
+unchanged content are plain file serving with Range support
+(courses.downloads). Lessons are only read while a bundle is built.
+Building a new bundle removes the course's older ones.
+"""
+import hashlib
+import html
+import os
+import time
+import uuid
+import zipfile
+
+from .models import Lesson
+from .outline import course_outline
+from .storage import blob_storage
+
+BUNDLE_DIR = 'bundles'
+BLOCK_SIZE = 64 * 1024
+
+
+class ZipSink:
+    """
+    Unseekable file for ZipFile: copies what is written to ``copy`` and
+    holds it until drained into the response.
+    """
+
+    def __init__(self, copy):
+        self.copy = copy
+        self.buffer = bytearray()
+
+    def write(self, data):
+        self.copy.write(data)
+        self.buffer += data
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        """The bytes written since the last drain, as zero or one chunk."""
+        if self.buffer:
+            data = bytes(self.buffer)
+            self.buffer.clear()
+            yield data
+
+
+def bundle_lessons(course_id):
+    return list(
+        Lesson.objects.filter(module__course_id=course_id)
+        .order_by('module__order', 'module_id', 'order', 'id')
+        .values_list('id', 'title', 'content_html', 'resources', 'resource_name')
+    )
+
+
+def bundle_name(course_id, content_version, updated_at):
+    digest = hashlib.sha256(f'{content_version}\0{updated_at.isoformat()}'.encode())
+    return f'{BUNDLE_DIR}/course-{course_id}-{digest.hexdigest()[:24]}.zip'
+
+
+def read_blocks(name):
+    with blob_storage.open(name, 'rb') as file:
+        yield from file.chunks(BLOCK_SIZE)
+
+
+def bundle_entries(course_id):
+    """
+    Yield ``(arcname, chunks, compress_type)`` for each file of the course's
+    bundle; nothing is read until the first entry is asked for.
+    """
+    outline = course_outline(course_id)
+    if outline is None:
+        return
+    yield 'outline.json', [outline[0]], zipfile.ZIP_DEFLATED
+    lessons = bundle_lessons(course_id)
+    for lesson_id, title, content_html, *_ in lessons:
+        page = (
+            '<!DOCTYPE html>\n<html><head><meta charset="utf-8">'
+            f'<title>{html.escape(title)}</title></head>\n'
+            f'<body>\n{content_html}\n</body></html>\n'
+        )
+        yield f'lessons/{lesson_id}.html', [page.encode()], zipfile.ZIP_DEFLATED
+    for lesson_id, _, _, resources, resource_name in lessons:
+        if resources and blob_storage.exists(resources):
+            filename = os.path.basename(resource_name or resources)
+            # Resources are mostly compressed already (PDF, zip, media).
+            yield (f'resources/{lesson_id}/{filename}',
+                   read_blocks(resources), zipfile.ZIP_STORED)
+
+
+def write_bundle(name, entries):
+    """
+    Write the zip to a temporary file, yielding its bytes as they are
+    produced, and move it into place as ``name`` once complete.
+    """
+    path = blob_storage.path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f'{path}.{uuid.uuid4().hex}.part'
+    complete = False
+    try:
+        with open(temp_path, 'wb') as copy:
+            sink = ZipSink(copy)
+            with zipfile.ZipFile(sink, 'w') as archive:
+                for arcname, chunks, compress_type in entries:
+                    info = zipfile.ZipInfo(arcname, time.localtime()[:6])
+                    info.compress_type = compress_type
+                    with archive.open(info, 'w', force_zip64=True) as entry:
+                        for chunk in chunks:
+                            entry.write(chunk)
+                            yield from sink.drain()
+                    yield from sink.drain()
+            yield from sink.drain()
+        os.replace(temp_path, path)
+        complete = True
+        remove_old_bundles(name)
+    finally:
+        if not complete:
+            # The client went away mid-download; the next one starts over.
+            try:
+                os.unlink(temp_path)
+            except FileNotFoundError:
+                pass
+
+
+def remove_old_bundles(name):
+    directory, current = os.path.split(blob_storage.path(name))
+    prefix = current.rsplit('-', 1)[0] + '-'
+    for entry in os.scandir(directory):
+        if entry.name.startswith(prefix) and entry.name.endswith('.zip') and entry.name != current:
+            try:
+                os.unlink(entry.path)
+            except FileNotFoundError:
+                pass
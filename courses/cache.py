@@ -0,0 +1,87 @@
+"""
+Versioned cache for the public course catalog.
+
+Every cached catalog response is stored under the current catalog version.
+Editing a Course, Module, Lesson or Category bumps the version (see
+``courses.signals``), which orphans all earlier entries at once instead of
+hunting down the keys that mention the edited row. Orphans simply expire.
+Enrollment counts are merged in per request (courses.enrollments), so
+enrolling leaves the version alone.
+
+Only the anonymous representation is cached; per-user fields are merged in
+by the view after the cache lookup.
+"""
+import hashlib
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+CATALOG_VERSION_KEY = 'catalog:version'
+PROCESS_LOCAL_CACHES = (LocMemCache, DummyCache)
+
+
+def cache_is_shared():
+    """Whether the default cache is seen by every worker and command process."""
+    return not isinstance(caches['default'], PROCESS_LOCAL_CACHES)
+
+
+def catalog_cache_timeout():
+    return getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300)
+
+
+def catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # Start from the clock rather than 1 so a version key that was
+        # evicted can never come back to a value old entries were stored under.
+        cache.add(CATALOG_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def _bump():
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        catalog_version()
+
+
+def bump_catalog_version():
+    # Bump now so nobody is served the old content, and again after commit so
+    # a response rebuilt from pre-commit rows in between is orphaned as well.
+    _bump()
+    transaction.on_commit(_bump)
+
+
+def catalog_cache_key(request, scope):
+    params = sorted(request.query_params.lists())
+    raw = f'{request.get_host()}|{request.path}|{params}'
+    digest = hashlib.md5(raw.encode()).hexdigest()
+    return f'catalog:{catalog_version()}:{scope}:{digest}'
+
+
+def get_catalog_entry(key):
+    return cache.get(key)
+
+
+def set_catalog_entry(key, data):
+    cache.set(key, data, catalog_cache_timeout())
+
+
+@contextmanager
+def cache_lock(key, timeout=30, wait=10):
+    """Mutex on cache.add; ``timeout`` frees the lock of a crashed holder."""
+    deadline = time.monotonic() + wait
+    while not cache.add(key, 1, timeout):
+        if time.monotonic() > deadline:
+            raise TimeoutError(f'could not acquire {key}')
+        time.sleep(0.005)
+    try:
+        yield
+    finally:
+        cache.delete(key)
@@ -0,0 +1,126 @@
+"""
+Deep copies of courses, e.g. one per cohort or term.
+
+clone_course() copies the modules and lessons, and optionally the
+assessments with their questions and choices. Each level is read with one
+query and written with one bulk_create, and the new ids are mapped from the
+old ones for the next level. The query count therefore depends on the depth of
+the tree, not on how many rows it has.
+
+Lessons keep their derived fields (courses.lesson_content), so nothing is
+re-rendered, and get new progress slots in one allocation. Files are not
+copied: the clone points at the same content-addressed blobs
+(courses.storage), whose reference counts go up by one per use.
+"""
+from django.db import transaction
+from django.db.models import Q
+
+from assessments.models import Assessment, Choice, Question
+from .blobs import update_references
+from .cache import bump_catalog_version
+from .completion import allocate_progress_slots
+from .models import Course, Lesson, Module
+from .outline import refresh_outline
+from .search import refresh_lesson_search_index
+from .transfer import BATCH_SIZE, insert
+
+COURSE_FIELDS = ('description', 'category_id', 'price', 'thumbnail', 'thumbnail_variants')
+
+
+def copied_fields(model, *skip):
+    """Column attnames of ``model`` copied as they are: all but the pk and ``skip``."""
+    return [
+        field.attname for field in model._meta.concrete_fields
+        if not field.primary_key and field.name not in skip
+    ]
+
+
+def copy_rows(model, rows, fields, links):
+    """Unsaved copies of ``rows`` (values() dicts) with ``links(row)`` set on each."""
+    return [model(**{field: row[field] for field in fields}, **links(row)) for row in rows]
+
+
+@transaction.atomic
+def clone_course(course_id, title=None, include_assessments=True):
+    """
+    Copy the course and return ``(course, counts)``, or None if it does not
+    exist. The copy is titled ``title`` or "<title> (copy)".
+    """
+    source = Course.objects.filter(pk=course_id).values('title', *COURSE_FIELDS).first()
+    if source is None:
+        return None
+    course = Course(title=title or f"{source['title']} (copy)",
+                    **{field: source[field] for field in COURSE_FIELDS})
+    course.save()  # One row; its signals index it and count the thumbnail blobs.
+
+    module_fields = copied_fields(Module, 'course')
+    module_rows = list(Module.objects.filter(course_id=course_id).order_by('id').values(
+        'id', *module_fields
+    ))
+    modules = copy_rows(Module, module_rows, module_fields, links=lambda row: {'course': course})
+    insert(Module, modules, Module.objects.filter(course=course))
+    module_map = {row['id']: module for row, module in zip(module_rows, modules)}
+
+    lesson_fields = copied_fields(Lesson, 'module', 'progress_slot', 'search_vector')
+    lesson_rows = list(Lesson.objects.filter(module__course_id=course_id).order_by('id').values(
+        'id', 'module_id', *lesson_fields
+    ))
+    lessons = copy_rows(Lesson, lesson_rows, lesson_fields,
+                        links=lambda row: {'module': module_map[row['module_id']]})
+    if lessons:
+        first = allocate_progress_slots(course.pk, len(lessons))
+        for slot, lesson in enumerate(lessons, first):
+            lesson.progress_slot = slot
+    insert(Lesson, lessons, Lesson.objects.filter(module__course=course))
+    lesson_map = {row['id']: lesson for row, lesson in zip(lesson_rows, lessons)}
+    update_references([], [lesson.resources.name for lesson in lessons if lesson.resources])
+
+    counts = {'modules': len(modules), 'lessons': len(lessons)}
+    if include_assessments:
+        counts.update(clone_assessments(course_id, course, module_map, lesson_map))
+
+    refresh_lesson_search_index(Lesson.objects.filter(module__course=course))
+    Course.refresh_lesson_counts(pk=course.pk)
+    transaction.on_commit(lambda: refresh_outline(course.pk))
+    bump_catalog_version()
+    course.refresh_from_db(fields=['lesson_count'])
+    return course, counts
+
+
+def clone_assessments(course_id, course, module_map, lesson_map):
+    """Copy the assessments of ``course_id`` to ``course``; returns the counts."""
+    assessment_fields = copied_fields(Assessment, 'course', 'module', 'lesson')
+    assessment_rows = list(Assessment.objects.filter(
+        Q(course_id=course_id) | Q(module__course_id=course_id)
+        | Q(lesson__module__course_id=course_id)
+    ).order_by('id').values('id', 'course_id', 'module_id', 'lesson_id', *assessment_fields))
+    assessments = copy_rows(Assessment, assessment_rows, assessment_fields, links=lambda row: {
+        'course': course if row['course_id'] == course_id else None,
+        'module': module_map.get(row['module_id']),
+        'lesson': lesson_map.get(row['lesson_id']),
+    })
+    insert(Assessment, assessments, Assessment.objects.filter(
+        Q(course=course) | Q(module__course=course) | Q(lesson__module__course=course)
+    ))
+    assessment_map = {row['id']: new for row, new in zip(assessment_rows, assessments)}
+
+    question_fields = copied_fields(Question, 'assessment')
+    question_rows = list(Question.objects.filter(assessment__in=list(assessment_map)).order_by(
+        'id'
+    ).values('id', 'assessment_id', *question_fields))
+    questions = copy_rows(Question, question_rows, question_fields,
+                          links=lambda row: {'assessment': assessment_map[row['assessment_id']]})
+    insert(Question, questions, Question.objects.filter(assessment__in=assessments))
+    question_map = {row['id']: new for row, new in zip(question_rows, questions)}
+
+    choice_fields = copied_fields(Choice, 'question')
+    choices = copy_rows(
+        Choice,
+        Choice.objects.filter(question__in=list(question_map)).order_by('id').values(
+            'question_id', *choice_fields
+        ),
+        choice_fields,
+        links=lambda row: {'question': question_map[row['question_id']]},
+    )
+    Choice.objects.bulk_create(choices, batch_size=BATCH_SIZE)
+    return {'assessments': len(assessments), 'questions': len(questions), 'choices': len(choices)}
@@ -0,0 +1,127 @@
+"""
+Compact lesson completion state.
+
+UserProgress keeps one row per (user, lesson). The same state is also kept as
+one CourseProgress row per (user, course) whose ``completed_bits`` has bit
+``Lesson.progress_slot`` set for every completed lesson, so a 300-lesson
+course costs a learner 38 bytes and reading it is a single-row lookup.
+The course player's completion set and the completed_count in
+/courses/<id>/progress/ are read from the bitset. UserProgress stays the
+source of the per-lesson rows the progress endpoints return (with their
+completion times) and of the progress summary.
+
+Slots are handed out per course by allocate_progress_slots() and never
+reused, so reordering lessons does not touch any bitset. UserProgress writes
+are mirrored into the bitset in the same transaction: saves and deletes by the
+handlers in courses.signals, bulk writes by calling record_completion().
+"""
+from bitarray import bitarray
+from bitarray.util import zeros
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .cache import catalog_cache_timeout, catalog_version
+from .models import Course, CourseProgress, Lesson
+
+
+def load_bits(raw):
+    bits = bitarray(endian='little')
+    bits.frombytes(bytes(raw or b''))
+    return bits
+
+
+def allocate_progress_slots(course_id, count=1):
+    """Reserve ``count`` consecutive slots in the course and return the first."""
+    with transaction.atomic():
+        # The update locks the course row until the new value has been read.
+        Course.objects.filter(pk=course_id).update(
+            next_progress_slot=F('next_progress_slot') + count
+        )
+        end = Course.objects.filter(pk=course_id).values_list(
+            'next_progress_slot', flat=True
+        ).get()
+    return end - count
+
+
+def lesson_slots_key(course_id):
+    return f'lesson-slots:{catalog_version()}:{course_id}'
+
+
+def lesson_slots(course_ids):
+    """
+    Return ``{course_id: {lesson_id: (slot, module_id)}}``. Cached under the
+    catalog version, which moves whenever a lesson is added, moved or deleted.
+    """
+    keys = {lesson_slots_key(course_id): course_id for course_id in set(course_ids)}
+    slots = {keys[key]: value for key, value in cache.get_many(keys).items()}
+
+    missing = {course_id: {} for course_id in keys.values() if course_id not in slots}
+    if missing:
+        rows = Lesson.objects.filter(
+            module__course_id__in=missing, progress_slot__isnull=False
+        ).values_list('id', 'progress_slot', 'module_id', 'module__course_id')
+        for lesson_id, slot, module_id, course_id in rows:
+            missing[course_id][lesson_id] = (slot, module_id)
+        cache.set_many(
+            {key: missing[course_id] for key, course_id in keys.items() if course_id in missing},
+            catalog_cache_timeout(),
+        )
+        slots.update(missing)
+    return slots
+
+
+def completed_lessons(bits, slots):
+    """``[(lesson_id, module_id)]`` whose bit is set, in slot order."""
+    bits = load_bits(bits)
+    done = [
+        (slot, lesson_id, module_id)
+        for lesson_id, (slot, module_id) in slots.items()
+        if slot < len(bits) and bits[slot]
+    ]
+    return [(lesson_id, module_id) for _, lesson_id, module_id in sorted(done)]
+
+
+def course_completion(user, course_id):
+    """
+    Return ``(record, [(lesson_id, module_id)])`` for the user's completed
+    lessons in the course; ``record`` is None if nothing was ever completed.
+    """
+    record = CourseProgress.objects.filter(user=user, course_id=course_id).first()
+    if record is None:
+        return None, []
+    return record, completed_lessons(record.completed_bits, lesson_slots([course_id])[course_id])
+
+
+def record_completion(user_id, course_id, changes):
+    """
+    Apply ``{slot: completed}`` to the user's bitset for the course. Clearing
+    bits never creates a record, so cascading deletes cannot resurrect one.
+    """
+    if not changes:
+        return
+    records = CourseProgress.objects.select_for_update().filter(
+        user_id=user_id, course_id=course_id
+    ).only('completed_bits')
+    with transaction.atomic(savepoint=False):
+        record = records.first()
+        if record is None:
+            if not any(changes.values()):
+                return
+            CourseProgress.objects.bulk_create(
+                [CourseProgress(user_id=user_id, course_id=course_id)], ignore_conflicts=True
+            )
+            record = records.first()
+
+        bits = load_bits(record.completed_bits)
+        size = max(changes) + 1
+        if len(bits) < size:
+            bits.extend(zeros(size - len(bits), endian='little'))
+        for slot, completed in changes.items():
+            bits[slot] = completed
+        CourseProgress.objects.filter(pk=record.pk).update(
+            completed_bits=bits.tobytes(),
+            completed_count=bits.count(),
+            updated_at=timezone.now(),
+        )
@@ -0,0 +1,107 @@
+"""
+HTTP validators (ETag / Last-Modified) for course content.
+
+Course.content_version and Course.updated_at are bumped whenever something in
+a course's shared representation changes (see courses.signals), so together
+with a cheap per-user signature they validate course, module and lesson
+responses without loading or serializing the tree. Enrollment counts and
+rating aggregates, which only the course detail shows, are taken from
+courses.enrollments and the course row.
+"""
+import hashlib
+
+from django.db.models import Count, Exists, Max, OuterRef, Q, Subquery
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from .enrollments import enrollment_counts
+from .models import Course, Module, Lesson, Enrollment, UserProgress
+from .positions import positions_touched
+
+
+def make_etag(*parts):
+    return '"%s"' % hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def course_validators(pk, user):
+    """
+    Return ``(etag_parts, last_modified)`` for the course detail response or
+    None if the course does not exist. There is no Last-Modified: enrolling
+    and un-completing a lesson leave no timestamp behind.
+    """
+    queryset = Course.objects.filter(pk=pk)
+    fields = ['content_version', 'updated_at', 'rating_count', 'rating_sum']
+    if user.is_authenticated:
+        progress = UserProgress.objects.filter(
+            user=user, course=OuterRef('pk')
+        ).order_by().values('course')
+        queryset = queryset.annotate(
+            user_enrolled=Exists(Enrollment.objects.filter(user=user, course=OuterRef('pk'))),
+            progress_rows=Subquery(progress.annotate(n=Count('id')).values('n')),
+            progress_done=Subquery(
+                progress.annotate(n=Count('id', filter=Q(completed=True))).values('n')
+            ),
+            progress_last_id=Subquery(progress.annotate(m=Max('id')).values('m')),
+            progress_last_at=Subquery(progress.annotate(m=Max('completed_at')).values('m')),
+        )
+        fields += [
+            'user_enrolled', 'progress_rows', 'progress_done',
+            'progress_last_id', 'progress_last_at',
+        ]
+    row = queryset.values_list(*fields).first()
+    if row is None:
+        return None
+    parts = ('course', pk, user.pk, enrollment_counts([int(pk)])[int(pk)]) + row
+    if user.is_authenticated:
+        # The outline carries the user's video resume positions.
+        return parts + (positions_touched(user.pk),), None
+    return parts, None
+
+
+def module_validators(pk):
+    row = Module.objects.filter(pk=pk).values_list(
+        'course__content_version', 'course__updated_at'
+    ).first()
+    if row is None:
+        return None
+    return ('module', pk) + row, row[1]
+
+
+def lesson_validators(pk):
+    # The lesson detail carries no resume position, so heartbeats leave it valid.
+    row = Lesson.objects.filter(pk=pk).values_list(
+        'module__course__content_version', 'module__course__updated_at'
+    ).first()
+    if row is None:
+        return None
+    return ('lesson', pk) + row, row[1]
+
+
+class ConditionalRetrieveMixin:
+    """
+    Answers If-None-Match / If-Modified-Since on retrieve with a 304 before
+    the object is loaded or serialized, and stamps ETag / Last-Modified on
+    full responses. Views using it define get_validators() returning
+    ``(etag_parts, last_modified_or_None)``, or None to fall through.
+    """
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = str(self.kwargs.get('pk', ''))
+        validators = self.get_validators() if pk.isdigit() else None
+        if validators is None:
+            return super().retrieve(request, *args, **kwargs)
+
+        etag_parts, last_modified = validators
+        etag = make_etag(request.accepted_renderer.format, *etag_parts)
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = super().retrieve(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if timestamp is not None:
+                response['Last-Modified'] = http_date(timestamp)
+            patch_cache_control(response, no_cache=True)
+        patch_vary_headers(response, ['Accept', 'Authorization'])
+        return response
@@ -0,0 +1,151 @@
+"""
+Serving protected lesson resources and course bundles.
+
+GET /lessons/<id>/resource/ and /courses/<id>/bundle/ check the enrollment
+and then either stream the file (FileResponse, with single-range Range /
+If-Range and ETag / Last-Modified validation) or, with RESOURCE_SENDFILE
+set, only answer with headers and leave the transfer to the front proxy:
+
+* ``x-accel-redirect`` (nginx): ``X-Accel-Redirect: RESOURCE_SENDFILE_PREFIX + name``
+  to an ``internal`` location aliased to MEDIA_ROOT,
+* ``x-sendfile`` (Apache mod_xsendfile, lighttpd): ``X-Sendfile: <absolute path>``.
+
+The proxy then handles ranges itself and the worker is free at once.
+"""
+import hashlib
+import os
+import re
+import unicodedata
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe
+
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeReader:
+    """The next ``length`` bytes of an open file, for FileResponse."""
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def sendfile_mode():
+    return getattr(settings, 'RESOURCE_SENDFILE', '')
+
+
+def file_validators(storage, name):
+    """``(size, etag, last_modified_timestamp_or_None)`` of a stored file."""
+    size = storage.size(name)
+    try:
+        modified = int(storage.get_modified_time(name).timestamp())
+    except NotImplementedError:
+        modified = None
+    etag = '"%s"' % hashlib.md5(f'{name}:{size}:{modified}'.encode()).hexdigest()
+    return size, etag, modified
+
+
+def requested_range(request, size, etag, modified):
+    """
+    ``(start, end)`` (inclusive) of a single satisfiable byte range, None to
+    send the whole file, or False if the range cannot be satisfied.
+    """
+    header = request.headers.get('Range', '')
+    match = RANGE.match(header.replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        # No, malformed or multi-range requests get the whole file.
+        return None
+    if_range = request.headers.get('If-Range')
+    if if_range and if_range != etag and parse_http_date_safe(if_range) != modified:
+        return None
+
+    first, last = match.groups()
+    if first == '':
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def content_disposition(filename):
+    """
+    Attachment header naming ``filename`` exactly in ``filename*`` and, for
+    clients that only read ``filename``, as the closest plain ASCII name.
+    """
+    name = os.path.basename(filename)
+    fallback = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode()
+    fallback = re.sub(r'[^\x20-\x7e]|["\\]', '_', fallback).strip()
+    stem, dot, extension = fallback.rpartition('.')
+    if not (stem if dot else extension):
+        # Nothing of the name survived, e.g. a name in another script.
+        fallback = f'download{dot}{extension}'
+    return "attachment; filename=\"%s\"; filename*=UTF-8''%s" % (fallback, quote(name))
+
+
+def serve_file(request, storage, name, content_type='', filename=''):
+    """
+    Response for a stored file with range and conditional support, offered
+    for download as ``filename`` (the stored name by default).
+    """
+    size, etag, modified = file_validators(storage, name)
+    content_type = content_type or 'application/octet-stream'
+
+    response = get_conditional_response(request, etag=etag, last_modified=modified)
+    if response is None:
+        mode = sendfile_mode()
+        if mode == 'x-accel-redirect':
+            response = HttpResponse(content_type=content_type)
+            prefix = getattr(settings, 'RESOURCE_SENDFILE_PREFIX', '/protected-media/')
+            response['X-Accel-Redirect'] = prefix + quote(name)
+        elif mode == 'x-sendfile':
+            response = HttpResponse(content_type=content_type)
+            response['X-Sendfile'] = storage.path(name)
+        else:
+            response = stream_file(request, storage, name, size, etag, modified, content_type)
+        response['Content-Disposition'] = content_disposition(filename or name)
+
+    response['ETag'] = etag
+    if modified is not None:
+        response['Last-Modified'] = http_date(modified)
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Authorization'])
+    return response
+
+
+def stream_file(request, storage, name, size, etag, modified, content_type):
+    byte_range = requested_range(request, size, etag, modified)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    file = storage.open(name, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+        response['Content-Length'] = size
+    else:
+        start, end = byte_range
+        file.seek(start)
+        response = FileResponse(RangeReader(file, end - start + 1), status=206,
+                                content_type=content_type)
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    return response
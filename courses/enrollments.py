@@ -0,0 +1,43 @@
+"""
+Per-course enrollment counts.
+
+Enrollment is the busiest write in the catalog, so it does not move the
+catalog version (courses.cache) or Course.content_version: that would throw
+away every cached catalog page, progress summary and lesson slot map on each
+sign-up. Counts are cached per course instead, dropped by courses.signals
+when an enrollment is added or removed, and merged into catalog responses
+and the course detail ETag on every request.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+
+from .cache import catalog_cache_timeout
+from .models import Enrollment
+
+
+def enrollment_count_key(course_id):
+    return f'enrollments:{course_id}'
+
+
+def enrollment_counts(course_ids):
+    """``{course_id: enrollments}``; uncached courses are counted in one query."""
+    keys = {enrollment_count_key(course_id): course_id for course_id in course_ids}
+    counts = {keys[key]: count for key, count in cache.get_many(keys).items()}
+    missing = [course_id for course_id in course_ids if course_id not in counts]
+    if missing:
+        counted = dict.fromkeys(missing, 0)
+        counted.update(Enrollment.objects.filter(course_id__in=missing).order_by().values(
+            'course_id'
+        ).annotate(n=Count('id')).values_list('course_id', 'n'))
+        cache.set_many({enrollment_count_key(course_id): count
+                        for course_id, count in counted.items()}, catalog_cache_timeout())
+        counts.update(counted)
+    return counts
+
+
+def invalidate_enrollment_count(course_id):
+    # Now, and again after commit so a count taken in between is dropped too.
+    key = enrollment_count_key(course_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
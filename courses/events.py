@@ -0,0 +1,137 @@
+"""
+Learning activity event log.
+
+Events are only ever inserted: POST /events/ validates a batch and writes
+it with one bulk_create, without looking anything up. On PostgreSQL
+courses_learningevent is range-partitioned by ``day``. Rows for a day with
+no partition yet land in the DEFAULT partition. ``manage.py
+rollup_learning_events`` creates the coming days' partitions, rolls
+finished days up into LearningEventDaily, and drops raw events past the
+retention window, a whole partition at a time.
+"""
+import datetime
+
+from django.db import connection, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import LearningEvent, LearningEventDaily
+
+# Older events are refused: their day may already be rolled up.
+MAX_EVENT_AGE = datetime.timedelta(days=2)
+MAX_BATCH = 500
+
+
+def uses_partitions():
+    return connection.vendor == 'postgresql'
+
+
+def ingest_events(user_id, events):
+    """
+    Store validated events (dicts with ``type`` and optional ``course``,
+    ``lesson``, ``assessment``, ``at`` and ``data``) for the user. Returns
+    the number stored.
+    """
+    now = timezone.now()
+    rows = []
+    for event in events:
+        occurred_at = min(event.get('at') or now, now)
+        rows.append(LearningEvent(
+            user_id=user_id,
+            type=event['type'],
+            course_id=event.get('course'),
+            lesson_id=event.get('lesson'),
+            assessment_id=event.get('assessment'),
+            data=event.get('data') or {},
+            occurred_at=occurred_at,
+            received_at=now,
+            day=occurred_at.date(),
+        ))
+    LearningEvent.objects.bulk_create(rows, batch_size=MAX_BATCH)
+    return len(rows)
+
+
+def partition_name(day):
+    return f'{LearningEvent._meta.db_table}_p{day:%Y%m%d}'
+
+
+def default_partition():
+    return f'{LearningEvent._meta.db_table}_default'
+
+
+def existing_partitions():
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT child.relname FROM pg_inherits '
+            'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+            'JOIN pg_class parent ON parent.oid = pg_inherits.inhparent '
+            'WHERE parent.relname = %s',
+            [LearningEvent._meta.db_table],
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+def ensure_partitions(first_day, days):
+    """
+    Create daily partitions from ``first_day`` for ``days`` days. Rows that
+    already landed in the DEFAULT partition for one of them are moved in.
+    Returns the names created. A no-op outside PostgreSQL.
+    """
+    if not uses_partitions():
+        return []
+    table = LearningEvent._meta.db_table
+    existing = existing_partitions()
+    created = []
+    for offset in range(days):
+        day = first_day + datetime.timedelta(days=offset)
+        name = partition_name(day)
+        if name in existing:
+            continue
+        start, end = day.isoformat(), (day + datetime.timedelta(days=1)).isoformat()
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)')
+            cursor.execute(
+                f'WITH moved AS (DELETE FROM {default_partition()} WHERE day = %s RETURNING *) '
+                f'INSERT INTO {name} SELECT * FROM moved',
+                [day],
+            )
+            cursor.execute(
+                f"ALTER TABLE {table} ATTACH PARTITION {name} "
+                f"FOR VALUES FROM ('{start}') TO ('{end}')"
+            )
+        created.append(name)
+    return created
+
+
+def rollup_day(day):
+    """(Re)compute LearningEventDaily for ``day``; returns the number of rows."""
+    totals = LearningEvent.objects.filter(day=day).values(
+        'type', 'course_id', 'lesson_id'
+    ).annotate(
+        events=Count('id'), learners=Count('user_id', distinct=True)
+    ).order_by()
+    with transaction.atomic():
+        LearningEventDaily.objects.filter(day=day).delete()
+        rows = LearningEventDaily.objects.bulk_create([
+            LearningEventDaily(
+                day=day,
+                type=total['type'],
+                course_id=total['course_id'],
+                lesson_id=total['lesson_id'],
+                events=total['events'],
+                learners=total['learners'],
+            )
+            for total in totals
+        ])
+    return len(rows)
+
+
+def drop_events_before(day):
+    """Delete raw events older than ``day``; whole partitions are dropped."""
+    if uses_partitions():
+        with connection.cursor() as cursor:
+            for name in sorted(existing_partitions()):
+                suffix = name.rsplit('_p', 1)[-1]
+                if suffix.isdigit() and datetime.datetime.strptime(suffix, '%Y%m%d').date() < day:
+                    cursor.execute(f'DROP TABLE {name}')
+    LearningEvent.objects.filter(day__lt=day).delete()
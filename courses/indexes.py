@@ -0,0 +1,21 @@
+"""
+Indexes that only exist on some databases.
+
+Course.search_vector and Lesson.search_vector are searched through GIN
+indexes on PostgreSQL. SQLite searches FTS5 mirrors of the same fields
+instead (courses.search), so there SearchVectorIndex produces no SQL and
+migrations, table rebuilds included, go through unchanged.
+"""
+from django.contrib.postgres.indexes import GinIndex
+
+
+class SearchVectorIndex(GinIndex):
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        if schema_editor.connection.vendor != 'postgresql':
+            return ''
+        return super().create_sql(model, schema_editor, using=using, **kwargs)
+
+    def remove_sql(self, model, schema_editor, **kwargs):
+        if schema_editor.connection.vendor != 'postgresql':
+            return ''
+        return super().remove_sql(model, schema_editor, **kwargs)
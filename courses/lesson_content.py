@@ -0,0 +1,125 @@
+"""
+Save-time processing of lesson fields.
+
+Lesson.save() runs prepare_lesson(), which stores everything derived from
+the editable fields so that serializers only read columns:
+
+* ``youtube_url`` -> ``video_id`` and ``video_embed_url`` (watch?v=, youtu.be,
+  shorts/, embed/ and live/ URLs; a start time in ``t`` or ``start`` is kept),
+* ``content`` (Markdown, HTML allowed) -> sanitized ``content_html``,
+* ``resources`` -> ``resource_size``, ``resource_content_type`` and, for a
+  new upload, its file name as ``resource_name``.
+
+``manage.py process_lessons`` backfills lessons saved before this existed.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import parse_qs, urlsplit
+
+import markdown
+import nh3
+
+YOUTUBE_HOSTS = {
+    'youtube.com', 'www.youtube.com', 'm.youtube.com', 'music.youtube.com',
+    'youtube-nocookie.com', 'www.youtube-nocookie.com',
+}
+YOUTUBE_PATH_PREFIXES = ('shorts', 'embed', 'live', 'v')
+VIDEO_ID = re.compile(r'^[A-Za-z0-9_-]{1,32}$')
+TIMESTAMP = re.compile(r'^(?:(\d+)h)?(?:(\d+)m)?(?:(\d+)s?)?$')
+MARKDOWN_EXTENSIONS = ['fenced_code', 'tables', 'sane_lists']
+# Every field prepare_lesson() may set.
+DERIVED_FIELDS = (
+    'video_id', 'video_embed_url', 'content_html',
+    'resource_size', 'resource_content_type', 'resource_name',
+)
+
+
+def parse_start(query):
+    """Seconds from ``t=1m30s``, ``t=90`` or ``start=90``, or None."""
+    value = (query.get('t') or query.get('start') or [''])[0]
+    match = TIMESTAMP.match(value)
+    if not value or not match:
+        return None
+    hours, minutes, seconds = (int(part or 0) for part in match.groups())
+    return hours * 3600 + minutes * 60 + seconds or None
+
+
+def parse_youtube_url(url):
+    """Return ``(video_id, start_seconds)`` for a YouTube URL, or ``(None, None)``."""
+    if not url:
+        return None, None
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or '').lower()
+    query = parse_qs(parts.query)
+    segments = [segment for segment in parts.path.split('/') if segment]
+
+    video_id = None
+    if host == 'youtu.be' and segments:
+        video_id = segments[0]
+    elif host in YOUTUBE_HOSTS:
+        if segments == ['watch']:
+            video_id = (query.get('v') or [None])[0]
+        elif len(segments) >= 2 and segments[0] in YOUTUBE_PATH_PREFIXES:
+            video_id = segments[1]
+    if not video_id or not VIDEO_ID.match(video_id):
+        return None, None
+    return video_id, parse_start(query)
+
+
+def embed_url(video_id, start=None):
+    url = f'https://www.youtube.com/embed/{video_id}'
+    return f'{url}?start={start}' if start else url
+
+
+def render_content(text):
+    """Markdown (raw HTML passes through) to sanitized HTML."""
+    html = markdown.markdown(text or '', extensions=MARKDOWN_EXTENSIONS)
+    return nh3.clean(html)
+
+
+def resource_metadata(resources):
+    """``(size, content_type)`` of a FieldFile, or ``(None, '')`` when empty."""
+    if not resources:
+        return None, ''
+    upload = getattr(resources, 'file', None) if not resources._committed else None
+    content_type = getattr(upload, 'content_type', None)
+    if not content_type:
+        content_type = mimetypes.guess_type(resources.name)[0] or 'application/octet-stream'
+    try:
+        size = resources.size
+    except OSError:
+        size = None
+    return size, content_type
+
+
+def prepare_lesson(lesson, update_fields=None):
+    """
+    Refresh the fields derived from the ones being saved (all of them when
+    ``update_fields`` is None); returns the names of the derived fields set.
+    """
+    def saving(name):
+        return update_fields is None or name in update_fields
+
+    changed = set()
+    if saving('youtube_url'):
+        video_id, start = parse_youtube_url(lesson.youtube_url)
+        lesson.video_id = video_id or ''
+        lesson.video_embed_url = embed_url(video_id, start) if video_id else ''
+        changed |= {'video_id', 'video_embed_url'}
+    if saving('content'):
+        lesson.content_html = render_content(lesson.content)
+        changed.add('content_html')
+    # Stored files are only measured once; uploads every time.
+    if saving('resources') and (
+        not lesson.resources or not lesson.resources._committed or lesson.resource_size is None
+    ):
+        lesson.resource_size, lesson.resource_content_type = resource_metadata(lesson.resources)
+        changed |= {'resource_size', 'resource_content_type'}
+        # Stored names are content hashes; keep what the file was called.
+        if not lesson.resources:
+            lesson.resource_name = ''
+        elif not lesson.resources._committed:
+            lesson.resource_name = os.path.basename(lesson.resources.name)
+        changed.add('resource_name')
+    return changed
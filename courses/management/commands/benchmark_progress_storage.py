@@ -0,0 +1,121 @@
+import random
+import statistics
+import time
+
+from bitarray.util import zeros
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from courses.completion import course_completion, lesson_slots
+from courses.models import Course, CourseProgress, Lesson, Module, UserProgress
+from users.models import UserAccount
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare UserProgress rows with CourseProgress bitsets on synthetic data: "
+        "storage size (PostgreSQL) and read latency. Everything is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--learners', type=int, default=1000)
+        parser.add_argument('--lessons', type=int, default=300)
+        parser.add_argument('--completion', type=float, default=0.5,
+                            help="Share of lessons each learner has completed.")
+        parser.add_argument('--reads', type=int, default=200)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(**options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, learners, lessons, completion, reads, **options):
+        course = Course.objects.create(title='Progress benchmark', description='')
+        module = Module.objects.create(course=course, title='Benchmark', order=0)
+        Lesson.objects.bulk_create(
+            [Lesson(module=module, title=f'Lesson {n}', content='', order=n, progress_slot=n)
+             for n in range(lessons)],
+            batch_size=1000,
+        )
+        lesson_ids = list(Lesson.objects.filter(module=module).order_by('progress_slot')
+                          .values_list('pk', flat=True))
+        UserAccount.objects.bulk_create(
+            [UserAccount(email=f'benchmark-{n}@example.invalid', name=f'Benchmark {n}')
+             for n in range(learners)],
+            batch_size=1000,
+        )
+        users = list(UserAccount.objects.filter(email__startswith='benchmark-')
+                     .values_list('pk', flat=True))
+
+        done = {user_id: random.sample(range(lessons), int(lessons * completion))
+                for user_id in users}
+        sizes = self.table_sizes()
+
+        started = time.perf_counter()
+        UserProgress.objects.bulk_create(
+            [UserProgress(user_id=user_id, course=course, module=module,
+                          lesson_id=lesson_ids[slot], completed=True)
+             for user_id, slots in done.items() for slot in slots],
+            batch_size=5000,
+        )
+        rows_write = time.perf_counter() - started
+
+        started = time.perf_counter()
+        records = []
+        for user_id, slots in done.items():
+            bits = zeros(lessons, endian='little')
+            for slot in slots:
+                bits[slot] = True
+            records.append(CourseProgress(user_id=user_id, course=course,
+                                          completed_bits=bits.tobytes(),
+                                          completed_count=bits.count()))
+        CourseProgress.objects.bulk_create(records, batch_size=5000)
+        bitset_write = time.perf_counter() - started
+
+        grown = {table: size - sizes[table] for table, size in self.table_sizes().items()}
+        row_count = sum(len(slots) for slots in done.values())
+
+        lesson_slots([course.pk])
+        sample = [random.choice(users) for _ in range(reads)]
+        row_reads, bitset_reads = [], []
+        for user_id in sample:
+            started = time.perf_counter()
+            list(UserProgress.objects.filter(user_id=user_id, course=course, completed=True)
+                 .values_list('lesson_id', 'module_id'))
+            row_reads.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            course_completion(user_id, course.pk)
+            bitset_reads.append(time.perf_counter() - started)
+
+        out = self.stdout.write
+        out(f"{learners} learners x {lessons} lessons, {completion:.0%} complete")
+        out(f"UserProgress:   {row_count} rows, written in {rows_write:.2f}s")
+        out(f"CourseProgress: {len(records)} rows, written in {bitset_write:.2f}s")
+        for table, size in grown.items():
+            out(f"  {table}: {size / 1024:.0f} KiB incl. indexes")
+        if not grown:
+            out("  (table sizes are only measured on PostgreSQL)")
+        out(f"Read one learner's course, {reads} samples (ms, mean / p95):")
+        for label, timings in (('rows', row_reads), ('bitset', bitset_reads)):
+            timings = sorted(t * 1000 for t in timings)
+            p95 = timings[int(len(timings) * 0.95) - 1] if len(timings) > 1 else timings[0]
+            out(f"  {label:<7} {statistics.mean(timings):.3f} / {p95:.3f}")
+
+    def table_sizes(self):
+        if connection.vendor != 'postgresql':
+            return {}
+        tables = [UserProgress._meta.db_table, CourseProgress._meta.db_table]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT relname, pg_total_relation_size(oid) FROM pg_class WHERE relname = ANY(%s)',
+                [tables],
+            )
+            return dict(cursor.fetchall())
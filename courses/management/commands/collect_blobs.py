@@ -0,0 +1,23 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from courses.blobs import collect_blobs, recount_references
+
+
+class Command(BaseCommand):
+    help = (
+        "Recount references to content-addressed uploads and delete the blobs "
+        "no course or lesson uses any more."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float, default=24,
+                            help="Keep unreferenced blobs younger than this (uploads in flight).")
+
+    def handle(self, *args, grace_hours, **options):
+        fixed = recount_references()
+        deleted, freed = collect_blobs(datetime.timedelta(hours=grace_hours))
+        self.stdout.write(self.style.SUCCESS(
+            f"Corrected {fixed} reference counts; deleted {deleted} blobs ({freed / 1024:.0f} KiB)."
+        ))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.transfer import dump_document, export_course
+
+
+class Command(BaseCommand):
+    help = (
+        "Write a course with its modules, lessons, assessments, questions and "
+        "choices as JSON or NDJSON (see courses.transfer)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('course_id', type=int)
+        parser.add_argument('--format', choices=['json', 'ndjson'], default='json')
+        parser.add_argument('--output', help="File to write; standard output by default.")
+
+    def handle(self, *args, course_id, format, output, **options):
+        document = export_course(course_id)
+        if document is None:
+            raise CommandError(f"Course {course_id} does not exist.")
+        text = dump_document(document, ndjson=format == 'ndjson')
+        if not output:
+            self.stdout.write(text, ending='')
+            return
+        with open(output, 'w', encoding='utf-8') as file:
+            file.write(text)
+        lessons = sum(len(module['lessons']) for module in document['course']['modules'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported course {course_id} ({lessons} lessons) to {output}."
+        ))
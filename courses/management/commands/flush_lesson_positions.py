@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from courses.positions import flush_positions
+
+
+class Command(BaseCommand):
+    help = (
+        "Persist video resume positions from the cache to LessonPosition. With "
+        "--interval, keep flushing every N seconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help="Seconds between flushes; 0 flushes once and exits.")
+
+    def handle(self, *args, interval, **options):
+        while True:
+            started = time.perf_counter()
+            written = flush_positions()
+            self.stdout.write(
+                f"Stored {written} positions in {time.perf_counter() - started:.3f}s."
+            )
+            if not interval:
+                return
+            time.sleep(interval)
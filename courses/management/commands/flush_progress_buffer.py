@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from courses.progress_buffer import buffer_stats, flush_progress_buffer
+
+
+class Command(BaseCommand):
+    help = (
+        "Write buffered progress updates to the database. With --interval, "
+        "keep flushing every N seconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help="Seconds between flushes; 0 flushes once and exits.")
+
+    def handle(self, *args, interval, **options):
+        while True:
+            written = flush_progress_buffer()
+            stats = buffer_stats()
+            self.stdout.write(
+                f"Flushed {written} rows; depth {stats['depth']}, "
+                f"last flush {stats.get('last_flush_seconds', 0)}s."
+            )
+            if not interval:
+                return
+            time.sleep(interval)
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from courses.models import Course
+from courses.thumbnails import generate_thumbnail_variants, needs_variants
+
+
+class Command(BaseCommand):
+    help = "Generate the thumbnail variants of courses whose variants are missing or stale."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help="Regenerate the variants of every course with a thumbnail.")
+
+    def handle(self, *args, force, **options):
+        if force:
+            Course.objects.exclude(thumbnail='').update(thumbnail_variants={})
+        courses = Course.objects.order_by('pk').only('id', 'thumbnail', 'thumbnail_variants')
+        generated = 0
+        for course in courses.iterator():
+            if needs_variants(course) and generate_thumbnail_variants(course.pk):
+                generated += 1
+        self.stdout.write(self.style.SUCCESS(f"Generated thumbnail variants for {generated} courses."))
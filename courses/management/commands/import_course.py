@@ -0,0 +1,40 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.transfer import CourseImportError, import_course, parse_ndjson
+
+
+class Command(BaseCommand):
+    help = (
+        "Create a course with its modules, lessons, assessments, questions and "
+        "choices from an export_course file, in one transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="JSON or NDJSON file; - reads standard input.")
+        parser.add_argument('--format', choices=['json', 'ndjson'],
+                            help="Defaults to ndjson for .ndjson/.jsonl files, json otherwise.")
+
+    def handle(self, *args, path, format, **options):
+        if format is None:
+            format = 'ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'json'
+        try:
+            if path == '-':
+                course, counts = self.load(sys.stdin, format)
+            else:
+                with open(path, encoding='utf-8') as file:
+                    course, counts = self.load(file, format)
+        except OSError as error:
+            raise CommandError(str(error))
+        except (CourseImportError, ValueError) as error:
+            raise CommandError(f"Cannot import {path}: {error}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported course {course.pk} with {counts['modules']} modules, "
+            f"{counts['lessons']} lessons and {counts['assessments']} assessments."
+        ))
+
+    def load(self, file, format):
+        document = parse_ndjson(file) if format == 'ndjson' else json.load(file)
+        return import_course(document)
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from courses.lesson_content import DERIVED_FIELDS, prepare_lesson
+from courses.models import Lesson
+from courses.outline import refresh_outline
+
+
+class Command(BaseCommand):
+    help = (
+        "Backfill the fields Lesson.save() derives: video id and embed URL, "
+        "rendered content and resource size, content type and name."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, batch_size, **options):
+        lessons = Lesson.objects.select_related('module').order_by('pk').only(
+            'id', 'content', 'youtube_url', 'resources', *DERIVED_FIELDS, 'module__course_id',
+        )
+        batch, course_ids, processed = [], set(), 0
+        for lesson in lessons.iterator(chunk_size=batch_size):
+            prepare_lesson(lesson)
+            batch.append(lesson)
+            course_ids.add(lesson.module.course_id)
+            if len(batch) >= batch_size:
+                processed += self.write(batch)
+                batch = []
+        processed += self.write(batch)
+
+        # bulk_update sends no signals, so the stored outlines are rebuilt here.
+        for course_id in sorted(course_ids):
+            refresh_outline(course_id)
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {processed} lessons in {len(course_ids)} courses."
+        ))
+
+    def write(self, lessons):
+        with transaction.atomic():
+            Lesson.objects.bulk_update(lessons, DERIVED_FIELDS)
+        return len(lessons)
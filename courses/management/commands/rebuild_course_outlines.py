@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from courses.models import Course
+from courses.outline import refresh_outline
+
+
+class Command(BaseCommand):
+    help = "Rebuild the stored module/lesson outline of every course (or of the given ones)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('course_ids', nargs='*', type=int)
+
+    def handle(self, *args, course_ids, **options):
+        courses = Course.objects.order_by('pk')
+        if course_ids:
+            courses = courses.filter(pk__in=course_ids)
+        rebuilt = 0
+        for course_id in courses.values_list('pk', flat=True).iterator():
+            if refresh_outline(course_id) is not None:
+                rebuilt += 1
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the outline of {rebuilt} courses."))
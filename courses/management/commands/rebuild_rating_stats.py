@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from courses.models import Course
+from courses.ratings import refresh_rating_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute every course's rating count, sum and histogram from ReviewRating."
+
+    def handle(self, *args, **options):
+        refresh_rating_stats()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt rating aggregates for {Course.objects.count()} courses."
+        ))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from courses.models import Course, Lesson
+from courses.search import refresh_search_index, refresh_lesson_search_index
+
+
+class Command(BaseCommand):
+    help = "Recompute the course and lesson full-text search indexes from scratch."
+
+    def handle(self, *args, **options):
+        refresh_search_index()
+        refresh_lesson_search_index()
+        self.stdout.write(self.style.SUCCESS(
+            f"Reindexed {Course.objects.count()} courses and {Lesson.objects.count()} lessons."
+        ))
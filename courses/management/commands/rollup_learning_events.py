@@ -0,0 +1,41 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from courses.events import MAX_EVENT_AGE, drop_events_before, ensure_partitions, rollup_day
+
+
+class Command(BaseCommand):
+    help = (
+        "Maintain the learning event log: create the coming days' partitions, "
+        "roll recent days up into LearningEventDaily and drop raw events past "
+        "the retention window. Meant to run daily."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=datetime.date.fromisoformat,
+                            help="Roll up this day (YYYY-MM-DD) only.")
+        parser.add_argument('--partitions-ahead', type=int, default=7)
+        parser.add_argument('--keep-days', type=int, default=90,
+                            help="Raw events older than this are dropped; 0 keeps everything.")
+
+    def handle(self, *args, date, partitions_ahead, keep_days, **options):
+        today = timezone.now().date()
+        created = ensure_partitions(today, partitions_ahead)
+        if created:
+            self.stdout.write(f"Created partitions: {', '.join(created)}")
+
+        if date:
+            days = [date]
+        else:
+            # Events may arrive up to MAX_EVENT_AGE late, so recent days are
+            # recomputed on every run.
+            days = [today - datetime.timedelta(days=n)
+                    for n in range(MAX_EVENT_AGE.days + 1, 0, -1)]
+        for day in days:
+            self.stdout.write(f"{day}: {rollup_day(day)} rollup rows")
+
+        if keep_days and not date:
+            drop_events_before(today - datetime.timedelta(days=keep_days))
+        self.stdout.write(self.style.SUCCESS("Learning events rolled up."))
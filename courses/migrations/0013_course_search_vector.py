@@ -0,0 +1,53 @@
+# Generated by Django 5.1.6 on 2026-10-18 09:12
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+import courses.indexes
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            "UPDATE courses_course c SET search_vector = "
+            "setweight(to_tsvector('english', coalesce(c.title, '')), 'A') || "
+            "setweight(to_tsvector('english', coalesce("
+            "(SELECT name FROM courses_category WHERE id = c.category_id), '')), 'B') || "
+            "setweight(to_tsvector('english', coalesce(c.description, '')), 'C')"
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE courses_course_fts "
+            "USING fts5(title, category, description, tokenize='porter unicode61')"
+        )
+        schema_editor.execute(
+            "INSERT INTO courses_course_fts (rowid, title, category, description) "
+            "SELECT c.id, c.title, coalesce(cat.name, ''), c.description "
+            "FROM courses_course c LEFT JOIN courses_category cat ON cat.id = c.category_id"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS courses_course_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0012_contact'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=courses.indexes.SearchVectorIndex(fields=['search_vector'], name='courses_course_search_gin'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
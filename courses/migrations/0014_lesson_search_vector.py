@@ -0,0 +1,50 @@
+# Generated by Django 5.1.6 on 2026-10-18 11:40
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+import courses.indexes
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            "UPDATE courses_lesson SET search_vector = "
+            "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+            "setweight(to_tsvector('english', coalesce(content, '')), 'B')"
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE courses_lesson_fts "
+            "USING fts5(title, content, tokenize='porter unicode61')"
+        )
+        schema_editor.execute(
+            "INSERT INTO courses_lesson_fts (rowid, title, content) "
+            "SELECT id, title, content FROM courses_lesson"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS courses_lesson_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0013_course_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lesson',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='lesson',
+            index=courses.indexes.SearchVectorIndex(fields=['search_vector'], name='courses_lesson_search_gin'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
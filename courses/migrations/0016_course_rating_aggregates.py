@@ -0,0 +1,64 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:30
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def backfill_rating_stats(apps, schema_editor):
+    Course = apps.get_model('courses', 'Course')
+    ReviewRating = apps.get_model('courses', 'ReviewRating')
+    buckets = {
+        f'rating_{star}_count': Count('id', filter=Q(rating__gte=star - 0.5, rating__lt=star + 0.5))
+        for star in range(1, 6)
+    }
+    stats = ReviewRating.objects.order_by().values('course').annotate(
+        rating_count=Count('id'), rating_sum=Sum('rating'), **buckets
+    )
+    for row in stats:
+        Course.objects.filter(pk=row.pop('course')).update(**row)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0015_course_content_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='rating_sum',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_rating_stats, migrations.RunPython.noop),
+    ]
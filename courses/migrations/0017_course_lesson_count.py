@@ -0,0 +1,30 @@
+# Generated by Django 5.1.6 on 2026-10-18 14:10
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_lesson_count(apps, schema_editor):
+    Course = apps.get_model('courses', 'Course')
+    Lesson = apps.get_model('courses', 'Lesson')
+    lessons = Lesson.objects.filter(
+        module__course=OuterRef('pk')
+    ).order_by().values('module__course').annotate(n=Count('id')).values('n')
+    Course.objects.update(lesson_count=Coalesce(Subquery(lessons), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0016_course_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='lesson_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_lesson_count, migrations.RunPython.noop),
+    ]
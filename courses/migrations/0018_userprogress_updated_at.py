@@ -0,0 +1,25 @@
+# Generated by Django 5.1.6 on 2026-10-18 15:02
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_updated_at(apps, schema_editor):
+    UserProgress = apps.get_model('courses', 'UserProgress')
+    UserProgress.objects.filter(completed_at__isnull=False).update(updated_at=F('completed_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0017_course_lesson_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprogress',
+            name='updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 5.1.6 on 2026-10-18 15:40
+
+from itertools import groupby
+
+import django.db.models.deletion
+from bitarray.util import zeros
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_course_progress(apps, schema_editor):
+    Course = apps.get_model('courses', 'Course')
+    CourseProgress = apps.get_model('courses', 'CourseProgress')
+    Lesson = apps.get_model('courses', 'Lesson')
+    UserProgress = apps.get_model('courses', 'UserProgress')
+
+    # Existing lessons get their slots in outline order.
+    for course_id in Course.objects.values_list('pk', flat=True).iterator():
+        lessons = list(Lesson.objects.filter(module__course_id=course_id).order_by(
+            'module__order', 'module_id', 'order', 'id'
+        ).only('pk'))
+        for slot, lesson in enumerate(lessons):
+            lesson.progress_slot = slot
+        Lesson.objects.bulk_update(lessons, ['progress_slot'], batch_size=500)
+        Course.objects.filter(pk=course_id).update(next_progress_slot=len(lessons))
+
+    slots = dict(Lesson.objects.values_list('pk', 'progress_slot'))
+    rows = UserProgress.objects.filter(completed=True).order_by(
+        'user_id', 'lesson__module__course_id'
+    ).values_list('user_id', 'lesson__module__course_id', 'lesson_id')
+
+    records = []
+    for (user_id, course_id), group in groupby(rows.iterator(), key=lambda row: row[:2]):
+        group_slots = [slots[lesson_id] for _, _, lesson_id in group]
+        bits = zeros(max(group_slots) + 1, endian='little')
+        for slot in group_slots:
+            bits[slot] = True
+        records.append(CourseProgress(
+            user_id=user_id,
+            course_id=course_id,
+            completed_bits=bits.tobytes(),
+            completed_count=bits.count(),
+        ))
+        if len(records) == 1000:
+            CourseProgress.objects.bulk_create(records)
+            records = []
+    CourseProgress.objects.bulk_create(records)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0018_userprogress_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='next_progress_slot',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='progress_slot',
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='CourseProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('completed_bits', models.BinaryField(default=b'')),
+                ('completed_count', models.PositiveIntegerField(default=0)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='courses.course')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'course')},
+            },
+        ),
+        migrations.RunPython(backfill_course_progress, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 5.1.6 on 2026-10-18 16:50
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+PARTITIONED_TABLE = """
+CREATE TABLE courses_learningevent (
+    id bigserial NOT NULL,
+    type varchar(32) NOT NULL,
+    data jsonb NOT NULL,
+    occurred_at timestamp with time zone NOT NULL,
+    received_at timestamp with time zone NOT NULL,
+    day date NOT NULL,
+    assessment_id bigint NULL,
+    course_id bigint NULL,
+    lesson_id bigint NULL,
+    user_id bigint NOT NULL,
+    PRIMARY KEY (id, day)
+) PARTITION BY RANGE (day);
+CREATE TABLE courses_learningevent_default PARTITION OF courses_learningevent DEFAULT;
+CREATE INDEX learningevent_day_type ON courses_learningevent (day, type);
+CREATE INDEX learningevent_user_day ON courses_learningevent (user_id, day);
+CREATE INDEX courses_learningevent_assessment_id ON courses_learningevent (assessment_id);
+CREATE INDEX courses_learningevent_course_id ON courses_learningevent (course_id);
+CREATE INDEX courses_learningevent_lesson_id ON courses_learningevent (lesson_id);
+"""
+
+
+def create_event_table(apps, schema_editor):
+    # PostgreSQL gets a table partitioned by day (partitions are managed by
+    # rollup_learning_events); the primary key has to include the partition
+    # key. Elsewhere it is a plain table.
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(PARTITIONED_TABLE)
+    else:
+        schema_editor.create_model(apps.get_model('courses', 'LearningEvent'))
+
+
+def drop_event_table(apps, schema_editor):
+    schema_editor.delete_model(apps.get_model('courses', 'LearningEvent'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assessments', '0002_alter_assessment_lesson'),
+        ('courses', '0020_lessonposition'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='LearningEvent',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('type', models.CharField(choices=[('lesson_opened', 'Lesson opened'), ('lesson_completed', 'Lesson completed'), ('quiz_started', 'Quiz started'), ('quiz_submitted', 'Quiz submitted'), ('video_watched', 'Video watched')], max_length=32)),
+                        ('data', models.JSONField(blank=True, default=dict)),
+                        ('occurred_at', models.DateTimeField()),
+                        ('received_at', models.DateTimeField()),
+                        ('day', models.DateField()),
+                        ('assessment', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='assessments.assessment')),
+                        ('course', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='courses.course')),
+                        ('lesson', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='courses.lesson')),
+                        ('user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+                    ],
+                    options={
+                        'indexes': [models.Index(fields=['day', 'type'], name='learningevent_day_type'), models.Index(fields=['user', 'day'], name='learningevent_user_day')],
+                    },
+                ),
+            ],
+        ),
+        migrations.RunPython(create_event_table, drop_event_table),
+        migrations.CreateModel(
+            name='LearningEventDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('type', models.CharField(choices=[('lesson_opened', 'Lesson opened'), ('lesson_completed', 'Lesson completed'), ('quiz_started', 'Quiz started'), ('quiz_submitted', 'Quiz submitted'), ('video_watched', 'Video watched')], max_length=32)),
+                ('events', models.PositiveIntegerField()),
+                ('learners', models.PositiveIntegerField()),
+                ('course', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='courses.course')),
+                ('lesson', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='courses.lesson')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day', 'course'], name='learningeventdaily_day_course')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0021_learning_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseOutline',
+            fields=[
+                ('course', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='outline', serialize=False, to='courses.course')),
+                ('document', models.BinaryField()),
+                ('slots', models.JSONField(default=list)),
+                ('generated_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0022_course_outline'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lesson',
+            name='content_html',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='resource_content_type',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='resource_size',
+            field=models.PositiveBigIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='video_embed_url',
+            field=models.URLField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='video_id',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32),
+        ),
+    ]
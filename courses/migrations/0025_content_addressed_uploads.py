@@ -0,0 +1,35 @@
+# Generated by Django 5.1.6 on 2026-10-18 19:05
+
+import courses.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0024_course_thumbnail_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('digest', models.CharField(db_index=True, max_length=64)),
+                ('size', models.PositiveBigIntegerField()),
+                ('references', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='course',
+            name='thumbnail',
+            field=models.ImageField(blank=True, null=True, storage=courses.storage.get_blob_storage, upload_to='course_thumbnails/'),
+        ),
+        migrations.AlterField(
+            model_name='lesson',
+            name='resources',
+            field=models.FileField(blank=True, null=True, storage=courses.storage.get_blob_storage, upload_to='lessons/resources/'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.6 on 2026-10-18 20:15
+
+import posixpath
+
+from django.db import migrations, models
+
+
+def backfill_resource_name(apps, schema_editor):
+    # The best name left for existing files is the stored one.
+    Lesson = apps.get_model('courses', 'Lesson')
+    lessons = Lesson.objects.exclude(resources='').exclude(resources__isnull=True).only(
+        'id', 'resources'
+    )
+    batch = []
+    for lesson in lessons.iterator(chunk_size=500):
+        lesson.resource_name = posixpath.basename(lesson.resources.name)[:255]
+        batch.append(lesson)
+        if len(batch) >= 500:
+            Lesson.objects.bulk_update(batch, ['resource_name'])
+            batch = []
+    Lesson.objects.bulk_update(batch, ['resource_name'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0026_resourceupload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lesson',
+            name='resource_name',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(backfill_resource_name, migrations.RunPython.noop),
+    ]
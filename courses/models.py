@@ -1,7 +1,15 @@
+import uuid
+
 from django.db import models
+from django.db.models.functions import Coalesce
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 from users.models import UserAccount
+from .indexes import SearchVectorIndex
+from .lesson_content import prepare_lesson
+from .storage import get_blob_storage
 
 class Category(models.Model):
     name = models.CharField(max_length=255)
@@ -23,11 +31,81 @@ class Course(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
-    thumbnail = models.ImageField(upload_to='course_thumbnails/', null=True, blank=True)
+    thumbnail = models.ImageField(
+        upload_to='course_thumbnails/', storage=get_blob_storage, null=True, blank=True
+    )
+    # Bumped together with updated_at whenever a module, lesson or other
+    # related row shown in the course representation changes; enrollments
+    # and ratings leave it alone.
+    content_version = models.PositiveIntegerField(default=1, editable=False)
+    # Number of lessons across all modules, kept current by courses.signals.
+    lesson_count = models.PositiveIntegerField(default=0, editable=False)
+    # Rating aggregates maintained by courses.ratings.
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.FloatField(default=0, editable=False)
+    rating_1_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_2_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_3_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_4_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_5_count = models.PositiveIntegerField(default=0, editable=False)
+    # Weighted full-text document, maintained by courses.search (PostgreSQL only).
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Next free Lesson.progress_slot; handed out by courses.completion.
+    next_progress_slot = models.PositiveIntegerField(default=0, editable=False)
+    # Resized WebP/JPEG copies of the thumbnail, written by courses.thumbnails.
+    thumbnail_variants = models.JSONField(default=dict, blank=True, editable=False)
+
+    class Meta:
+        indexes = [SearchVectorIndex(fields=['search_vector'], name='courses_course_search_gin')]
+
+    # The columns above that their modules change in place with update() and
+    # F(). Saving a loaded course leaves them alone instead of writing the
+    # values it was loaded with back over concurrent changes.
+    MAINTAINED_FIELDS = frozenset({
+        'content_version', 'lesson_count', 'rating_count', 'rating_sum',
+        'rating_1_count', 'rating_2_count', 'rating_3_count', 'rating_4_count',
+        'rating_5_count', 'search_vector', 'next_progress_slot', 'thumbnail_variants',
+    })
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        if (not self._state.adding and kwargs.get('update_fields') is None
+                and not kwargs.get('force_insert')):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.MAINTAINED_FIELDS
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
+    @property
+    def average_rating(self):
+        return self.rating_sum / self.rating_count if self.rating_count else 0
+
+    @property
+    def rating_histogram(self):
+        return {str(star): getattr(self, f'rating_{star}_count') for star in range(1, 6)}
+
+    @classmethod
+    def refresh_lesson_counts(cls, **lookups):
+        lessons = Lesson.objects.filter(
+            module__course=models.OuterRef('pk')
+        ).order_by().values('module__course').annotate(n=models.Count('id')).values('n')
+        cls.objects.filter(**lookups).update(
+            lesson_count=Coalesce(models.Subquery(lessons), 0)
+        )
+
+    @classmethod
+    def touch(cls, **lookups):
+        """Mark the matching courses as changed without loading them."""
+        cls.objects.filter(**lookups).update(
+            content_version=models.F('content_version') + 1,
+            updated_at=timezone.now(),
+        )
+
 class Module(models.Model):
     course = models.ForeignKey(Course, related_name='modules', on_delete=models.CASCADE)
     title = models.CharField(max_length=255)
@@ -51,15 +129,38 @@ class Lesson(models.Model):
         null=True,
         help_text="Format: https://www.youtube.com/watch?v=VIDEO_ID"
     )
-    resources = models.FileField(upload_to='lessons/resources/', null=True, blank=True)
+    resources = models.FileField(
+        upload_to='lessons/resources/', storage=get_blob_storage, null=True, blank=True
+    )
     order = models.PositiveIntegerField()
+    # Weighted full-text document, maintained by courses.search (PostgreSQL only).
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Bit index of this lesson in CourseProgress.completed_bits. Unique within
+    # the course and never reused, so reordering lessons leaves bitsets valid.
+    progress_slot = models.PositiveIntegerField(null=True, editable=False)
+    # Derived on save by courses.lesson_content; serializers read only these.
+    video_id = models.CharField(max_length=32, blank=True, default='', editable=False)
+    video_embed_url = models.URLField(blank=True, default='', editable=False)
+    content_html = models.TextField(blank=True, default='', editable=False)
+    resource_size = models.PositiveBigIntegerField(null=True, editable=False)
+    resource_content_type = models.CharField(max_length=100, blank=True, default='', editable=False)
+    # The uploaded file's own name; the stored one is its hash (courses.storage).
+    resource_name = models.CharField(max_length=255, blank=True, default='', editable=False)
 
     class Meta:
         ordering = ['order']
+        indexes = [SearchVectorIndex(fields=['search_vector'], name='courses_lesson_search_gin')]
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        derived = prepare_lesson(self, update_fields)
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, *derived}
+        super().save(*args, **kwargs)
+
     def clean(self):
         if self.youtube_url and 'youtube.com/watch?v=' in self.youtube_url:
             if not self.youtube_url.startswith(('http://', 'https://')):
@@ -68,17 +169,8 @@ class Lesson(models.Model):
 
     @property
     def video(self):
-            if self.youtube_url:
-                # Handle various YouTube URL formats
-                video_id = None
-                if 'watch?v=' in self.youtube_url:
-                    video_id = self.youtube_url.split('watch?v=')[-1].split('&')[0]
-                elif 'youtu.be/' in self.youtube_url:
-                    video_id = self.youtube_url.split('youtu.be/')[-1]
-                
-                if video_id:
-                    return f'https://www.youtube.com/embed/{video_id}'
-            return self.youtube_url
+        # Non-YouTube URLs are passed through as they are.
+        return self.video_embed_url or self.youtube_url
 
     
 class Enrollment(models.Model):
@@ -108,6 +200,9 @@ class UserProgress(models.Model):
     lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE)
     completed = models.BooleanField(default=False)
     completed_at = models.DateTimeField(null=True, blank=True)
+    # When this row last changed. Batch sync stores the client's event time
+    # here and uses it to resolve conflicts (last writer wins).
+    updated_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         unique_together = ('user', 'lesson')
@@ -115,6 +210,162 @@ class UserProgress(models.Model):
         def __str__(self):
             return f"{self.lesson.title} - {self.lesson.title}"
 
+    def save(self, *args, **kwargs):
+        self.updated_at = timezone.now()
+        if 'update_fields' in kwargs and kwargs['update_fields'] is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'updated_at'}
+        super().save(*args, **kwargs)
+
+class CourseProgress(models.Model):
+    """
+    A learner's completed lessons in one course as a bitset indexed by
+    Lesson.progress_slot. Kept in step with UserProgress by courses.completion.
+    """
+    user = models.ForeignKey(UserAccount, on_delete=models.CASCADE)
+    course = models.ForeignKey(Course, on_delete=models.CASCADE)
+    completed_bits = models.BinaryField(default=b'')
+    completed_count = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('user', 'course')
+
+    def __str__(self):
+        return f"{self.user_id} - {self.course_id} ({self.completed_count})"
+
+class LessonPosition(models.Model):
+    """Where a learner left off in a lesson's video; written by courses.positions."""
+    user = models.ForeignKey(UserAccount, on_delete=models.CASCADE)
+    lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE)
+    position = models.FloatField(help_text="Seconds from the start of the video")
+    duration = models.FloatField(null=True, blank=True)
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('user', 'lesson')
+
+    def __str__(self):
+        return f"{self.user_id} - {self.lesson_id} @ {self.position:.0f}s"
+
+class StoredBlob(models.Model):
+    """
+    A file in ContentAddressedStorage and how many model fields point at it
+    (courses.blobs). Unreferenced blobs are deleted by collect_blobs.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    digest = models.CharField(max_length=64, db_index=True)
+    size = models.PositiveBigIntegerField()
+    references = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.references})"
+
+class ResourceUpload(models.Model):
+    """A resumable, chunked upload of a lesson resource (courses.uploads)."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(UserAccount, on_delete=models.CASCADE)
+    lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE, related_name='+')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    # SHA-256 of the whole file, if the client declared one.
+    checksum = models.CharField(max_length=64, blank=True)
+    received = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def chunk_count(self):
+        return max(-(-self.size // self.chunk_size), 1)
+
+    def __str__(self):
+        return f"{self.filename} ({len(self.received)}/{self.chunk_count})"
+
+class CourseOutline(models.Model):
+    """
+    The course's module/lesson outline as ready-to-send JSON bytes, rebuilt
+    by courses.outline whenever a module or lesson changes.
+    """
+    course = models.OneToOneField(
+        Course, on_delete=models.CASCADE, primary_key=True, related_name='outline'
+    )
+    document = models.BinaryField()
+    # Lesson.progress_slot of each lesson, in outline order.
+    slots = models.JSONField(default=list)
+    generated_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Outline of {self.course_id}"
+
+class LearningEvent(models.Model):
+    """
+    Append-only learner activity, ingested in batches by courses.events.
+    References carry no database constraints, so ingest never waits on a
+    lookup and events outlive what they point at. On PostgreSQL the table
+    is partitioned by ``day``.
+    """
+    LESSON_OPENED = 'lesson_opened'
+    LESSON_COMPLETED = 'lesson_completed'
+    QUIZ_STARTED = 'quiz_started'
+    QUIZ_SUBMITTED = 'quiz_submitted'
+    VIDEO_WATCHED = 'video_watched'
+    TYPES = [
+        (LESSON_OPENED, 'Lesson opened'),
+        (LESSON_COMPLETED, 'Lesson completed'),
+        (QUIZ_STARTED, 'Quiz started'),
+        (QUIZ_SUBMITTED, 'Quiz submitted'),
+        (VIDEO_WATCHED, 'Video watched'),
+    ]
+
+    user = models.ForeignKey(
+        UserAccount, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+'
+    )
+    type = models.CharField(max_length=32, choices=TYPES)
+    course = models.ForeignKey(
+        Course, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name='+'
+    )
+    lesson = models.ForeignKey(
+        Lesson, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name='+'
+    )
+    assessment = models.ForeignKey(
+        'assessments.Assessment', on_delete=models.DO_NOTHING, db_constraint=False,
+        null=True, related_name='+'
+    )
+    data = models.JSONField(default=dict, blank=True)
+    occurred_at = models.DateTimeField()
+    received_at = models.DateTimeField()
+    day = models.DateField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['day', 'type'], name='learningevent_day_type'),
+            models.Index(fields=['user', 'day'], name='learningevent_user_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.type} @ {self.occurred_at}"
+
+class LearningEventDaily(models.Model):
+    """Per-day event totals, rolled up from LearningEvent by rollup_learning_events."""
+    day = models.DateField()
+    type = models.CharField(max_length=32, choices=LearningEvent.TYPES)
+    course = models.ForeignKey(
+        Course, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name='+'
+    )
+    lesson = models.ForeignKey(
+        Lesson, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name='+'
+    )
+    events = models.PositiveIntegerField()
+    learners = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [models.Index(fields=['day', 'course'], name='learningeventdaily_day_course')]
+
+    def __str__(self):
+        return f"{self.day} {self.type}: {self.events}"
+
 class ReviewRating(models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
     user = models.ForeignKey(UserAccount, on_delete=models.CASCADE)
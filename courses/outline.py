@@ -0,0 +1,85 @@
+"""
+Precomputed course outlines.
+
+The module/lesson outline of a course (ids, titles, order, video embed URL,
+whether a lesson has resources, lesson count) changes far less often than it
+is read, so it is stored once as JSON bytes in CourseOutline and sent as is.
+
+Module and Lesson changes drop the stored outline at once and rebuild it
+after commit (see courses.signals); a read that finds none builds and stores
+it. ``manage.py rebuild_course_outlines`` rebuilds every outline.
+"""
+import hashlib
+import json
+
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from .models import Course, CourseOutline, Lesson, Module
+
+
+def build_outline(course_id):
+    """Return ``(document_bytes, slots)`` for the course, or None if it does not exist."""
+    if not Course.objects.filter(pk=course_id).exists():
+        return None
+    modules = Module.objects.filter(course_id=course_id).order_by('order', 'id').only(
+        'id', 'title', 'order', 'course_id'
+    ).prefetch_related(Prefetch(
+        'lessons',
+        queryset=Lesson.objects.order_by('order', 'id').only(
+            'id', 'title', 'order', 'youtube_url', 'video_embed_url', 'resources',
+            'progress_slot', 'module_id',
+        ),
+    ))
+    document = {'course': course_id, 'lesson_count': 0, 'modules': []}
+    slots = []
+    for module in modules:
+        lessons = []
+        for lesson in module.lessons.all():
+            lessons.append({
+                'id': lesson.id,
+                'title': lesson.title,
+                'order': lesson.order,
+                'video': lesson.video,
+                'has_resources': bool(lesson.resources),
+            })
+            slots.append(lesson.progress_slot)
+        document['lesson_count'] += len(lessons)
+        document['modules'].append({
+            'id': module.id, 'title': module.title, 'order': module.order, 'lessons': lessons,
+        })
+    return json.dumps(document, separators=(',', ':')).encode(), slots
+
+
+def refresh_outline(course_id):
+    """Rebuild and store the course's outline; returns ``(document_bytes, slots)`` or None."""
+    built = build_outline(course_id)
+    if built is None:
+        return None
+    document, slots = built
+    CourseOutline.objects.bulk_create(
+        [CourseOutline(course_id=course_id, document=document, slots=slots,
+                       generated_at=timezone.now())],
+        update_conflicts=True,
+        unique_fields=['course'],
+        update_fields=['document', 'slots', 'generated_at'],
+    )
+    return built
+
+
+def drop_outline(course_id):
+    CourseOutline.objects.filter(course_id=course_id).delete()
+
+
+def course_outline(course_id):
+    """``(document_bytes, slots)``, built and stored first if missing; None if no course."""
+    stored = CourseOutline.objects.filter(course_id=course_id).values_list(
+        'document', 'slots'
+    ).first()
+    if stored is not None:
+        return bytes(stored[0]), stored[1]
+    return refresh_outline(course_id)
+
+
+def outline_etag(document):
+    return '"%s"' % hashlib.md5(document).hexdigest()
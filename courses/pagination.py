@@ -0,0 +1,39 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class ViewPageSizeCapMixin:
+    """Let a view lower the page size cap with a ``max_page_size`` attribute."""
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.max_page_size = min(
+            getattr(view, 'max_page_size', self.max_page_size), self.max_page_size
+        )
+        return super().paginate_queryset(queryset, request, view)
+
+
+class KeysetPagination(ViewPageSizeCapMixin, CursorPagination):
+    """
+    For the large, growing lists: the catalog and per-user records. Pages are
+    addressed by an opaque cursor on the primary key, so a deep page costs the
+    same index range scan as the first one. The cursor imposes its own order
+    (newest first), so lists with a meaningful order, such as a course's
+    modules and lessons, do not use it.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = '-id'
+
+
+class CatalogPagination(ViewPageSizeCapMixin, PageNumberPagination):
+    """
+    Offset pagination for screens that show page numbers, and for ranked
+    results whose order cannot be expressed as a keyset.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class LessonSearchPagination(CatalogPagination):
+    max_page_size = 50
@@ -0,0 +1,121 @@
+"""
+Data for the course player: everything the SPA needs to open a lesson.
+
+GET /courses/<id>/player/?lesson=<id> replaces separate calls to the course
+detail, progress, lesson quizzes and has_rated. Its budget is five queries,
+whatever the size of the course; the response is assembled from four:
+
+1. the course with the user's enrollment, rating, completion bitset, staff
+   and active flags, and the stored outline (courses.outline),
+2. the current lesson with its body,
+3. the lesson's quizzes, questions and choices as one LEFT JOIN; answers
+   (Choice.is_correct) are never selected,
+4. stored resume positions, only for lessons with none in the cache.
+
+Only a course whose outline has not been stored yet costs a few more.
+
+The endpoint authenticates from the token alone, so the staff and active
+flags are read from the user row in query 1 rather than from the token.
+"""
+import json
+
+from django.db.models import Exists, OuterRef, Subquery
+
+from assessments.models import Assessment
+from users.models import UserAccount
+from .completion import load_bits
+from .models import Course, CourseOutline, CourseProgress, Enrollment, Lesson, ReviewRating
+from .outline import course_outline
+
+
+def player_course(user_id, course_id):
+    """
+    The course row plus the user's enrollment, rating, completion bits and
+    staff and active flags, and the stored outline, or None.
+    """
+    own = {'user_id': user_id, 'course': OuterRef('pk')}
+    outline = CourseOutline.objects.filter(course=OuterRef('pk'))
+    return Course.objects.filter(pk=course_id).annotate(
+        is_enrolled=Exists(Enrollment.objects.filter(**own)),
+        user_is_staff=Exists(UserAccount.objects.filter(pk=user_id, is_staff=True)),
+        user_is_active=Exists(UserAccount.objects.filter(pk=user_id, is_active=True)),
+        user_rating=Subquery(ReviewRating.objects.filter(**own).values('rating')[:1]),
+        completed_bits=Subquery(CourseProgress.objects.filter(**own).values('completed_bits')[:1]),
+        outline_document=Subquery(outline.values('document')[:1]),
+        outline_slots=Subquery(outline.values('slots')[:1]),
+    ).values(
+        'id', 'title', 'description', 'lesson_count', 'content_version',
+        'is_enrolled', 'user_is_staff', 'user_is_active', 'user_rating', 'completed_bits',
+        'outline_document', 'outline_slots',
+    ).first()
+
+
+def player_outline(course):
+    """
+    ``(modules, completed_ids)`` from the stored outline in ``course`` (see
+    player_course), with a ``completed`` flag on every lesson, and the
+    completed lesson ids in outline order.
+    """
+    document, slots = course['outline_document'], course['outline_slots']
+    if document is None:
+        document, slots = course_outline(course['id'])
+    bits = load_bits(course['completed_bits'])
+    modules = json.loads(bytes(document))['modules']
+    lessons = (lesson for module in modules for lesson in module['lessons'])
+    completed_ids = []
+    for lesson, slot in zip(lessons, slots):
+        lesson['completed'] = slot is not None and slot < len(bits) and bits[slot]
+        if lesson['completed']:
+            completed_ids.append(lesson['id'])
+    return modules, completed_ids
+
+
+def current_lesson(course_id, lesson_id):
+    return Lesson.objects.filter(pk=lesson_id, module__course_id=course_id).only(
+        'id', 'title', 'content', 'content_html', 'youtube_url', 'video_id', 'video_embed_url',
+        'resources', 'resource_size', 'resource_content_type', 'resource_name', 'order',
+        'module_id',
+    ).first()
+
+
+def lesson_quizzes(lesson_id):
+    """The lesson's quizzes with their questions and choices, without answers."""
+    rows = Assessment.objects.filter(
+        lesson_id=lesson_id, assessment_type='quiz'
+    ).order_by(
+        'id', 'questions__order', 'questions__id', 'questions__choices__id'
+    ).values(
+        'id', 'title', 'duration', 'passing_score', 'max_attempts',
+        'questions__id', 'questions__text', 'questions__question_type',
+        'questions__marks', 'questions__order',
+        'questions__choices__id', 'questions__choices__text',
+    )
+    quizzes = {}
+    questions = {}
+    for row in rows:
+        quiz = quizzes.setdefault(row['id'], {
+            'id': row['id'],
+            'title': row['title'],
+            'duration': row['duration'],
+            'passing_score': row['passing_score'],
+            'max_attempts': row['max_attempts'],
+            'questions': [],
+        })
+        if row['questions__id'] is None:
+            continue
+        if row['questions__id'] not in questions:
+            questions[row['questions__id']] = {
+                'id': row['questions__id'],
+                'text': row['questions__text'],
+                'question_type': row['questions__question_type'],
+                'marks': row['questions__marks'],
+                'order': row['questions__order'],
+                'choices': [],
+            }
+            quiz['questions'].append(questions[row['questions__id']])
+        if row['questions__choices__id'] is not None:
+            questions[row['questions__id']]['choices'].append({
+                'id': row['questions__choices__id'],
+                'text': row['questions__choices__text'],
+            })
+    return list(quizzes.values())
@@ -0,0 +1,203 @@
+"""
+Video resume positions.
+
+POST /lessons/<id>/position/ is a heartbeat the player sends every few
+seconds. It never writes to the database: the latest position goes to the
+cache under position:<user>:<lesson>, and the lesson joins the user's dirty
+set. Only a user whose set was empty is appended to a log of numbered slots
+(one incr plus one set), so the log gains one key per user between flushes,
+not one per heartbeat. ``manage.py flush_lesson_positions`` walks the log in
+batches, takes each user's dirty set and upserts LessonPosition rows. Reads
+prefer the cached value and fall back to the stored row.
+
+The flush command cannot see a cache local to one process (LocMemCache), so
+there each heartbeat is upserted straight into LessonPosition instead.
+
+Heartbeats go through the regular JWT authentication, which turns away
+deactivated accounts, and are only taken from learners enrolled in the
+course (or staff); the check is cached for LESSON_ACCESS_TTL seconds.
+Positions are shown by the course outline and the player. The lesson detail
+leaves them out, so its ETag does not move with every heartbeat.
+
+A flush only consumes slots up to the sequence number it saw on its
+previous run, so a heartbeat that has taken a number but not yet written
+its slot is never skipped.
+"""
+import datetime
+
+from django.core.cache import cache
+from django.db.models import Exists, Max, OuterRef
+from django.utils import timezone
+
+from users.models import UserAccount
+from .cache import cache_is_shared, cache_lock
+from .models import Enrollment, Lesson, LessonPosition
+
+SEQ_KEY = 'position:seq'
+MARK_KEY = 'position:mark'
+FLUSHED_KEY = 'position:flushed'
+FLUSH_LOCK = 'position:flush-lock'
+# Cached positions outlive a stopped flusher by this long.
+POSITION_TTL = 60 * 60 * 24
+# Enrollment checks of heartbeats are reused for this long.
+LESSON_ACCESS_TTL = 60
+
+
+def position_key(user_id, lesson_id):
+    return f'position:{user_id}:{lesson_id}'
+
+
+def slot_key(number):
+    return f'position:slot:{number}'
+
+
+def dirty_key(user_id):
+    return f'position:dirty:{user_id}'
+
+
+def user_lock(user_id):
+    return cache_lock(f'position:lock:{user_id}', timeout=5, wait=1)
+
+
+def touched_key(user_id):
+    return f'position:touched:{user_id}'
+
+
+def lesson_access(user, lesson_id):
+    """
+    None if the lesson does not exist, else whether ``user`` may record
+    positions in it: enrolled in its course, or staff.
+    """
+    key = f'lesson-access:{user.pk}:{lesson_id}'
+    access = cache.get(key)
+    if access is None:
+        enrolled = Lesson.objects.filter(pk=lesson_id).annotate(is_enrolled=Exists(
+            Enrollment.objects.filter(user=user, course=OuterRef('module__course'))
+        )).values_list('is_enrolled', flat=True).first()
+        # Stored as a tuple: a cached None would read as a miss.
+        access = (enrolled is not None, bool(enrolled) or user.is_staff)
+        cache.set(key, access, LESSON_ACCESS_TTL)
+    exists, allowed = access
+    return allowed if exists else None
+
+
+def next_slot():
+    try:
+        return cache.incr(SEQ_KEY)
+    except ValueError:
+        cache.add(SEQ_KEY, 0, None)
+        return cache.incr(SEQ_KEY)
+
+
+def record_position(user_id, lesson_id, position, duration=None):
+    now = timezone.now()
+    if not cache_is_shared():
+        store_positions([(user_id, lesson_id, position, duration, now)])
+        return
+    try:
+        with user_lock(user_id):
+            dirty = cache.get(dirty_key(user_id)) or set()
+            entries = {
+                position_key(user_id, lesson_id): (position, duration, now.timestamp()),
+                dirty_key(user_id): dirty | {lesson_id},
+                touched_key(user_id): now.timestamp(),
+            }
+            if not dirty:
+                entries[slot_key(next_slot())] = user_id
+            cache.set_many(entries, POSITION_TTL)
+    except TimeoutError:
+        # Another heartbeat of this user holds the lock; the next one brings
+        # the position up to date.
+        pass
+
+
+def positions_touched(user_id):
+    """Time of the user's last heartbeat, for validators of responses that show positions."""
+    if not cache_is_shared():
+        return LessonPosition.objects.filter(user_id=user_id).aggregate(
+            at=Max('updated_at')
+        )['at']
+    return cache.get(touched_key(user_id))
+
+
+def take_dirty(user_ids):
+    """Remove and return the ``(user_id, lesson_id)`` pairs marked dirty for ``user_ids``."""
+    pairs = set()
+    for user_id in user_ids:
+        with user_lock(user_id):
+            lesson_ids = cache.get(dirty_key(user_id)) or set()
+            cache.delete(dirty_key(user_id))
+        pairs.update((user_id, lesson_id) for lesson_id in lesson_ids)
+    return pairs
+
+
+def resume_positions(user_id, lesson_ids):
+    """Return ``{lesson_id: seconds}`` for the lessons the user has started."""
+    keys = {position_key(user_id, lesson_id): lesson_id for lesson_id in lesson_ids}
+    positions = {
+        keys[key]: value[0] for key, value in cache.get_many(keys).items()
+    }
+    missing = [lesson_id for lesson_id in lesson_ids if lesson_id not in positions]
+    if missing:
+        positions.update(LessonPosition.objects.filter(
+            user_id=user_id, lesson_id__in=missing
+        ).values_list('lesson_id', 'position'))
+    return positions
+
+
+def flush_positions(batch_size=1000):
+    """Persist cached positions logged since the last flush; returns rows written."""
+    written = 0
+    with cache_lock(FLUSH_LOCK):
+        current = cache.get(SEQ_KEY, 0)
+        flushed = cache.get(FLUSHED_KEY, 0)
+        mark = cache.get(MARK_KEY, 0)
+        if current < flushed:
+            # The sequence was lost (cache restart); start over.
+            flushed = mark = 0
+
+        for start in range(flushed + 1, mark + 1, batch_size):
+            numbers = range(start, min(start + batch_size, mark + 1))
+            slot_keys = [slot_key(number) for number in numbers]
+            user_ids = set(cache.get_many(slot_keys).values())
+            written += write_positions(take_dirty(user_ids))
+            cache.delete_many(slot_keys)
+            cache.set(FLUSHED_KEY, numbers[-1], None)
+
+        cache.set(MARK_KEY, current, None)
+    return written
+
+
+def write_positions(pairs):
+    values = cache.get_many([position_key(*pair) for pair in pairs])
+    # Skip lessons and users deleted since the heartbeat.
+    lessons = set(Lesson.objects.filter(
+        pk__in={lesson_id for _, lesson_id in pairs}
+    ).values_list('pk', flat=True))
+    users = set(UserAccount.objects.filter(
+        pk__in={user_id for user_id, _ in pairs}
+    ).values_list('pk', flat=True))
+    entries = []
+    for user_id, lesson_id in pairs:
+        value = values.get(position_key(user_id, lesson_id))
+        if value is None or lesson_id not in lessons or user_id not in users:
+            continue
+        position, duration, at = value
+        entries.append((user_id, lesson_id, position, duration,
+                        datetime.datetime.fromtimestamp(at, datetime.timezone.utc)))
+    return store_positions(entries)
+
+
+def store_positions(entries):
+    """Upsert ``(user_id, lesson_id, position, duration, updated_at)`` entries."""
+    LessonPosition.objects.bulk_create(
+        [
+            LessonPosition(user_id=user_id, lesson_id=lesson_id, position=position,
+                           duration=duration, updated_at=at)
+            for user_id, lesson_id, position, duration, at in entries
+        ],
+        update_conflicts=True,
+        unique_fields=['user', 'lesson'],
+        update_fields=['position', 'duration', 'updated_at'],
+    )
+    return len(entries)
@@ -0,0 +1,200 @@
+"""
+Per-course completion summary for a learner.
+
+The summary for every enrolled course comes from one grouped query: the
+user's enrollments joined to their own UserProgress rows, with the
+denormalized Course.lesson_count as the denominator and correlated subqueries
+for the next incomplete lesson. Results are cached per user and dropped when
+the user's progress or enrollments change (see courses.signals) or when the
+catalog version moves.
+"""
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, Exists, FilteredRelation, Max, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from .cache import catalog_cache_timeout, catalog_version
+from .completion import lesson_slots, record_completion
+from .models import Enrollment, Lesson, Module, UserProgress
+
+
+def progress_summary_key(user_id):
+    return f'progress-summary:{catalog_version()}:{user_id}'
+
+
+def invalidate_progress_summary(user_id):
+    cache.delete(progress_summary_key(user_id))
+
+
+def build_progress_summary(user):
+    completed_by_user = UserProgress.objects.filter(
+        user=user, lesson=OuterRef('pk'), completed=True
+    )
+    next_lesson = Lesson.objects.filter(
+        module__course=OuterRef('course_id')
+    ).exclude(
+        Exists(completed_by_user)
+    ).order_by('module__order', 'module_id', 'order', 'id')
+
+    rows = Enrollment.objects.filter(user=user).annotate(
+        own_progress=FilteredRelation(
+            'course__userprogress', condition=Q(course__userprogress__user=user)
+        ),
+    ).values(
+        'course_id', 'course__title', 'course__lesson_count'
+    ).annotate(
+        completed=Count('own_progress', filter=Q(own_progress__completed=True)),
+        last_activity=Max('own_progress__completed_at'),
+        next_lesson_id=Subquery(next_lesson.values('id')[:1]),
+        next_lesson_title=Subquery(next_lesson.values('title')[:1]),
+    ).order_by('course_id')
+
+    summary = []
+    for row in rows:
+        total = row['course__lesson_count']
+        completed = min(row['completed'], total)
+        summary.append({
+            'course_id': row['course_id'],
+            'course_title': row['course__title'],
+            'total_lessons': total,
+            'completed_lessons': completed,
+            'percentage': round(completed * 100 / total, 1) if total else 0,
+            'last_activity': row['last_activity'],
+            'next_lesson': {
+                'id': row['next_lesson_id'],
+                'title': row['next_lesson_title'],
+            } if row['next_lesson_id'] else None,
+        })
+    return summary
+
+
+def progress_summary(user):
+    key = progress_summary_key(user.pk)
+    summary = cache.get(key)
+    if summary is None:
+        summary = build_progress_summary(user)
+        cache.set(key, summary, catalog_cache_timeout())
+    return summary
+
+
+def sync_progress(user, course_id, items):
+    """
+    Apply a batch of offline progress events for one course.
+
+    ``items`` are validated dicts with ``lessonId``, ``completed`` and
+    ``completed_at`` (the client's event time). Events for the same lesson
+    are collapsed to the newest, and an event only replaces the stored row
+    if it is at least as new as the row's ``updated_at`` (last writer wins).
+    Returns one ``(status, stored_row_or_None)`` per item, in order.
+    """
+    now = timezone.now()
+    events = []
+    for item in items:
+        # A clock running ahead must not let a device win every later conflict.
+        happened_at = min(item.get('completed_at') or now, now)
+        events.append((item['lessonId'], bool(item['completed']), happened_at))
+
+    newest = {}
+    for index, (lesson_id, _, happened_at) in enumerate(events):
+        if lesson_id not in newest or happened_at >= events[newest[lesson_id]][2]:
+            newest[lesson_id] = index
+
+    with transaction.atomic():
+        # Course membership and the current row's timestamp in one query.
+        lessons = {
+            row['id']: row for row in Lesson.objects.filter(
+                id__in=newest, module__course_id=course_id
+            ).annotate(
+                stored_at=Subquery(
+                    UserProgress.objects.filter(
+                        user=user, lesson=OuterRef('pk')
+                    ).values('updated_at')[:1]
+                ),
+            ).values('id', 'module_id', 'progress_slot', 'stored_at')
+        }
+
+        statuses = {}
+        rows = []
+        for lesson_id, index in newest.items():
+            lesson = lessons.get(lesson_id)
+            if lesson is None:
+                statuses[index] = 'not_found'
+                continue
+            _, completed, happened_at = events[index]
+            if lesson['stored_at'] and lesson['stored_at'] > happened_at:
+                statuses[index] = 'stale'
+                continue
+            statuses[index] = 'applied'
+            rows.append(UserProgress(
+                user=user,
+                course_id=course_id,
+                module_id=lesson['module_id'],
+                lesson_id=lesson_id,
+                completed=completed,
+                completed_at=happened_at if completed else None,
+                updated_at=happened_at,
+            ))
+
+        if rows:
+            UserProgress.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=['user', 'lesson'],
+                update_fields=['completed', 'completed_at', 'updated_at'],
+            )
+            record_completion(user.pk, course_id, {
+                lessons[row.lesson_id]['progress_slot']: row.completed
+                for row in rows if lessons[row.lesson_id]['progress_slot'] is not None
+            })
+            # bulk_create sends no signals. Drop the summary now and again
+            # after commit, in case it was rebuilt from pre-commit rows.
+            invalidate_progress_summary(user.pk)
+            transaction.on_commit(lambda: invalidate_progress_summary(user.pk))
+
+    stored = {row.lesson_id: row for row in rows}
+    results = []
+    for index, (lesson_id, _, _) in enumerate(events):
+        status = statuses.get(index, 'superseded')
+        results.append((status, stored.get(lesson_id) if status == 'applied' else None))
+    return results
+
+
+def toggle_progress(user, course_id, lesson_id):
+    """
+    Flip ``user``'s completion of the lesson in one statement and return
+    ``(progress_id, completed, module_id)``, or None if the lesson is not in
+    the course. The first toggle inserts a completed row; concurrent toggles
+    queue on the row lock instead of overwriting each other.
+    """
+    progress_table = UserProgress._meta.db_table
+    now = timezone.now()
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            # Lesson-to-course membership is the SELECT's WHERE clause, so a
+            # foreign lesson inserts nothing and returns no row.
+            cursor.execute(
+                f'INSERT INTO {progress_table} '
+                '(user_id, course_id, module_id, lesson_id, completed, completed_at, updated_at) '
+                'SELECT %s, m.course_id, l.module_id, l.id, TRUE, %s, %s '
+                f'FROM {Lesson._meta.db_table} l JOIN {Module._meta.db_table} m ON m.id = l.module_id '
+                'WHERE l.id = %s AND m.course_id = %s '
+                'ON CONFLICT (user_id, lesson_id) DO UPDATE SET '
+                f'completed = NOT {progress_table}.completed, '
+                f'completed_at = CASE WHEN {progress_table}.completed THEN NULL '
+                'ELSE EXCLUDED.completed_at END, '
+                'updated_at = EXCLUDED.updated_at '
+                'RETURNING id, completed, module_id',
+                [user.pk, now, now, lesson_id, course_id],
+            )
+            row = cursor.fetchone()
+        if row is None:
+            return None
+
+        progress_id, completed, module_id = row[0], bool(row[1]), row[2]
+        # Raw SQL sends no signals; mirror the bit and drop the summary here.
+        slot = lesson_slots([course_id])[course_id].get(lesson_id)
+        if slot is not None:
+            record_completion(user.pk, course_id, {slot[0]: completed})
+        invalidate_progress_summary(user.pk)
+        transaction.on_commit(lambda: invalidate_progress_summary(user.pk))
+    return progress_id, completed, module_id
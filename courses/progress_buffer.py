@@ -0,0 +1,278 @@
+"""
+Write-behind buffer for progress updates (off unless PROGRESS_WRITE_BUFFER).
+
+POST /progress/ stores the new state in the cache and answers right away.
+Updates are collapsed per (user, lesson), so a burst of clicks on the same
+lesson costs one row write. Pending updates are written with one batched
+upsert by flush_progress_buffer(), which runs
+
+* on the write that finds PROGRESS_BUFFER_MAX_ITEMS updates pending,
+* on any course or progress request (FlushBufferedProgressMixin), read or
+  write, that finds the oldest update older than PROGRESS_BUFFER_MAX_DELAY
+  seconds,
+* from ``manage.py flush_progress_buffer --interval N`` for idle periods,
+* for one user before any other progress request of theirs
+  (FlushBufferedProgressMixin), so users always read their own writes.
+
+Each user's pending updates sit under their own key and lock, so toggles
+of different users do not wait for each other; the shared set of buffered
+users is only locked when a user's first update joins it, and the item
+count is a cache counter. When the buffer is full, or a lock cannot be
+had within a second, writes go straight to the database instead. The
+buffer lives in the default cache, which has to be shared by all workers
+(REDIS_URL). On a cache local to one process (LocMemCache, DummyCache) the
+buffer stays off whatever PROGRESS_WRITE_BUFFER says: each worker would only
+see, and flush, its own updates.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import cache_is_shared, cache_lock
+from .completion import lesson_slots, record_completion
+from .models import UserProgress
+from .progress import invalidate_progress_summary
+
+logger = logging.getLogger(__name__)
+
+USERS_KEY = 'progress-buffer:users'
+ITEMS_KEY = 'progress-buffer:items'
+OLDEST_KEY = 'progress-buffer:oldest'
+USERS_LOCK = 'progress-buffer:lock'
+FLUSH_LOCK = 'progress-buffer:flush-lock'
+METRICS_KEY = 'progress-buffer:metrics'
+
+_warned_local_cache = False
+
+
+def buffer_enabled():
+    global _warned_local_cache
+    if not getattr(settings, 'PROGRESS_WRITE_BUFFER', False):
+        return False
+    if not cache_is_shared():
+        if not _warned_local_cache:
+            logger.warning('PROGRESS_WRITE_BUFFER is ignored: the default cache is local '
+                           'to each process; configure a shared one (REDIS_URL).')
+            _warned_local_cache = True
+        return False
+    return True
+
+
+def max_delay():
+    return getattr(settings, 'PROGRESS_BUFFER_MAX_DELAY', 5)
+
+
+def max_items():
+    return getattr(settings, 'PROGRESS_BUFFER_MAX_ITEMS', 1000)
+
+
+def user_key(user_id):
+    return f'progress-buffer:user:{user_id}'
+
+
+def user_lock(user_id):
+    return cache_lock(f'progress-buffer:lock:{user_id}', timeout=5, wait=1)
+
+
+def count_items(delta):
+    if not delta:
+        return
+    try:
+        cache.incr(ITEMS_KEY, delta)
+    except ValueError:
+        cache.add(ITEMS_KEY, 0, None)
+        cache.incr(ITEMS_KEY, delta)
+
+
+def buffer_progress(user_id, course_id, module_id, lesson_id, completed):
+    """
+    Queue the new state of a lesson. Returns False, without queuing, when
+    the buffer is full or its locks are busy; the caller then writes to the
+    database itself.
+    """
+    now = timezone.now()
+    try:
+        with user_lock(user_id):
+            pending = cache.get(user_key(user_id)) or {}
+            if lesson_id not in pending:
+                if cache.get(ITEMS_KEY, 0) >= max_items():
+                    return False
+                if not pending:
+                    # Only a user's first pending update takes the shared lock.
+                    with cache_lock(USERS_LOCK, timeout=5, wait=1):
+                        cache.set(USERS_KEY, (cache.get(USERS_KEY) or set()) | {user_id}, None)
+                count_items(1)
+            pending[lesson_id] = (course_id, module_id, completed, now)
+            cache.set(user_key(user_id), pending, None)
+            cache.add(OLDEST_KEY, time.time(), None)
+    except TimeoutError:
+        return False
+
+    flush_if_due()
+    return True
+
+
+def flush_if_due():
+    """
+    Flush the whole buffer if it holds PROGRESS_BUFFER_MAX_ITEMS updates or
+    the oldest is older than PROGRESS_BUFFER_MAX_DELAY seconds.
+    """
+    state = cache.get_many([ITEMS_KEY, OLDEST_KEY])
+    oldest = state.get(OLDEST_KEY)
+    if oldest is None:
+        return
+    if state.get(ITEMS_KEY, 0) >= max_items() or time.time() - oldest >= max_delay():
+        try:
+            flush_progress_buffer()
+        except TimeoutError:
+            # Someone else is flushing; the next flush picks this one up.
+            pass
+
+
+def pending_for(user_id):
+    return cache.get(user_key(user_id)) or {}
+
+
+def take_pending(user_ids=None):
+    """Remove and return ``{user_id: {lesson_id: update}}`` from the buffer."""
+    with cache_lock(USERS_LOCK):
+        if user_ids is None:
+            # Cleared first: an update queued after this sets it again.
+            cache.delete(OLDEST_KEY)
+        buffered = cache.get(USERS_KEY) or set()
+        users = buffered if user_ids is None else buffered & set(user_ids)
+        cache.set(USERS_KEY, buffered - users, None)
+    # A user who queues again meanwhile finds updates still pending and
+    # does not rejoin USERS_KEY; they are taken below.
+    taken = {}
+    for user_id in users:
+        with user_lock(user_id):
+            taken[user_id] = cache.get(user_key(user_id)) or {}
+            cache.delete(user_key(user_id))
+    count_items(-sum(len(updates) for updates in taken.values()))
+    return taken
+
+
+def restore_pending(taken):
+    """Put back updates a failed flush took, unless newer ones arrived since."""
+    restored = 0
+    for user_id, updates in taken.items():
+        with user_lock(user_id):
+            pending = cache.get(user_key(user_id)) or {}
+            if not pending:
+                with cache_lock(USERS_LOCK):
+                    cache.set(USERS_KEY, (cache.get(USERS_KEY) or set()) | {user_id}, None)
+            for lesson_id, update in updates.items():
+                if lesson_id not in pending:
+                    pending[lesson_id] = update
+                    restored += 1
+            cache.set(user_key(user_id), pending, None)
+    count_items(restored)
+    cache.add(OLDEST_KEY, time.time(), None)
+
+
+def write_progress(taken):
+    rows = []
+    changes = {}
+    for user_id, updates in taken.items():
+        slots = lesson_slots({course_id for course_id, _, _, _ in updates.values()})
+        for lesson_id, (course_id, module_id, completed, at) in updates.items():
+            rows.append(UserProgress(
+                user_id=user_id,
+                course_id=course_id,
+                module_id=module_id,
+                lesson_id=lesson_id,
+                completed=completed,
+                completed_at=at if completed else None,
+                updated_at=at,
+            ))
+            slot = slots[course_id].get(lesson_id)
+            if slot is not None:
+                changes.setdefault((user_id, course_id), {})[slot[0]] = completed
+
+    with transaction.atomic():
+        UserProgress.objects.bulk_create(
+            rows,
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=['user', 'lesson'],
+            update_fields=['completed', 'completed_at', 'updated_at'],
+        )
+        for (user_id, course_id), bits in changes.items():
+            record_completion(user_id, course_id, bits)
+    for user_id in taken:
+        invalidate_progress_summary(user_id)
+    return len(rows)
+
+
+def flush_progress_buffer(user_ids=None):
+    """
+    Write pending updates (of ``user_ids`` only, if given) to the database
+    and return the number of rows written. Flushes are serialised, so an
+    older update can never land after a newer one for the same lesson.
+    """
+    started = time.perf_counter()
+    with cache_lock(FLUSH_LOCK):
+        taken = take_pending(user_ids)
+        if not taken:
+            return 0
+        try:
+            written = write_progress(taken)
+        except Exception:
+            restore_pending(taken)
+            raise
+    elapsed = time.perf_counter() - started
+
+    metrics = cache.get(METRICS_KEY) or {'flushes': 0, 'rows_flushed': 0}
+    metrics.update(
+        flushes=metrics['flushes'] + 1,
+        rows_flushed=metrics['rows_flushed'] + written,
+        last_flush_at=timezone.now(),
+        last_flush_rows=written,
+        last_flush_seconds=round(elapsed, 4),
+    )
+    cache.set(METRICS_KEY, metrics, None)
+    logger.info('Flushed %s buffered progress rows in %.3fs', written, elapsed)
+    return written
+
+
+def flush_user_progress(user_id):
+    """Flush ``user_id``'s pending updates, if there are any."""
+    if buffer_enabled() and pending_for(user_id):
+        flush_progress_buffer([user_id])
+
+
+def buffer_stats():
+    state = cache.get_many([USERS_KEY, ITEMS_KEY, OLDEST_KEY])
+    oldest = state.get(OLDEST_KEY)
+    return {
+        'enabled': buffer_enabled(),
+        'depth': state.get(ITEMS_KEY, 0),
+        'users': len(state.get(USERS_KEY, ())),
+        'oldest_age_seconds': round(time.time() - oldest, 3) if oldest else None,
+        'max_items': max_items(),
+        'max_delay_seconds': max_delay(),
+        **(cache.get(METRICS_KEY) or {}),
+    }
+
+
+class FlushBufferedProgressMixin:
+    """
+    Flushes the buffer once it is overdue, and the requesting user's
+    buffered progress before the action runs, so every read and toggle sees
+    it. Actions listed in ``buffered_progress_actions`` are the buffered
+    writes themselves.
+    """
+    buffered_progress_actions = ()
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if not buffer_enabled():
+            return
+        flush_if_due()
+        if request.user.is_authenticated and self.action not in self.buffered_progress_actions:
+            flush_user_progress(request.user.pk)
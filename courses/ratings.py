@@ -0,0 +1,85 @@
+"""
+Per-course rating aggregates.
+
+Course.rating_count, rating_sum and the rating_<n>_count histogram columns
+are kept in step with ReviewRating so that reading a course's rating costs no
+query. Ratings written through the API go through upsert_rating(), which
+adjusts the aggregates by the difference in the same transaction. Anything
+else (admin edits, deletes) is recomputed by refresh_rating_stats().
+Neither touches Course.content_version: the course detail validators read
+the aggregates themselves (courses.conditional), and module, lesson and
+bundle responses do not show them.
+"""
+from django.db import transaction
+from django.db.models import Count, F, FloatField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Course, ReviewRating
+
+STARS = range(1, 6)
+
+
+def star_bucket(rating):
+    """Histogram bucket of a rating: 1.0-1.49 -> 1, ..., 4.5-5.0 -> 5."""
+    return min(max(int(rating + 0.5), 1), 5)
+
+
+def upsert_rating(user, course_id, rating):
+    """
+    Create or replace ``user``'s rating of the course and update the
+    course's aggregates. Returns the saved ReviewRating.
+    """
+    with transaction.atomic():
+        # Serialises raters of the same course, so the previous value read
+        # below cannot change before the aggregates are adjusted.
+        Course.objects.select_for_update().filter(pk=course_id).values_list('pk').first()
+        previous = ReviewRating.objects.filter(
+            user=user, course_id=course_id
+        ).values_list('rating', 'created_at').first()
+
+        review = ReviewRating(user=user, course_id=course_id, rating=rating)
+        ReviewRating.objects.bulk_create(
+            [review],
+            update_conflicts=True,
+            unique_fields=['user', 'course'],
+            update_fields=['rating', 'updated_at'],
+        )
+
+        changes = {
+            'rating_sum': F('rating_sum') + rating,
+            f'rating_{star_bucket(rating)}_count': F(f'rating_{star_bucket(rating)}_count') + 1,
+        }
+        if previous is None:
+            changes['rating_count'] = F('rating_count') + 1
+        else:
+            old_rating, review.created_at = previous
+            old_bucket = star_bucket(old_rating)
+            changes['rating_sum'] = changes['rating_sum'] - old_rating
+            if old_bucket != star_bucket(rating):
+                changes[f'rating_{old_bucket}_count'] = F(f'rating_{old_bucket}_count') - 1
+            else:
+                del changes[f'rating_{old_bucket}_count']
+        Course.objects.filter(pk=course_id).update(**changes)
+    return review
+
+
+def refresh_rating_stats(courses=None):
+    """Recompute the aggregates of ``courses`` (a queryset; all if None)."""
+    if courses is None:
+        courses = Course.objects.all()
+
+    ratings = ReviewRating.objects.filter(course=OuterRef('pk')).order_by().values('course')
+    changes = {
+        'rating_count': Coalesce(Subquery(ratings.annotate(n=Count('id')).values('n')), 0),
+        'rating_sum': Coalesce(
+            Subquery(ratings.annotate(total=Sum('rating')).values('total')),
+            Value(0.0),
+            output_field=FloatField(),
+        ),
+    }
+    for star in STARS:
+        in_bucket = Q(rating__gte=star - 0.5, rating__lt=star + 0.5)
+        changes[f'rating_{star}_count'] = Coalesce(
+            Subquery(ratings.annotate(n=Count('id', filter=in_bucket)).values('n')), 0
+        )
+    courses.update(**changes)
@@ -10,4 +10,6 @@ router.register('lessons', LessonViewSet, basename='lessons')
 router.register('progress', UserProgressViewSet, basename='progress')
 router.register('enrollments', EnrollmentViewSet, basename='enrollments')
 router.register('contacts', ContactViewSet, basename='contacts')
+router.register('events', LearningEventViewSet, basename='events')
+router.register('uploads', ResourceUploadViewSet, basename='uploads')
 urls = router.urls
\ No newline at end of file
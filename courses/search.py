@@ -0,0 +1,231 @@
+"""
+Full-text search over courses and lessons.
+
+On PostgreSQL every course keeps a weighted tsvector in
+``Course.search_vector`` (title A, category name B, description C) and every
+lesson one in ``Lesson.search_vector`` (title A, content B), both behind GIN
+indexes (courses.indexes). On SQLite the same fields are mirrored into FTS5
+tables so local development and tests go through the same API; matches are
+ranked with bm25() inside the query, so results page like any queryset. Both are kept current by the
+handlers in ``courses.signals``; ``manage.py rebuild_search_index`` recomputes
+everything.
+"""
+import re
+
+from django.contrib.postgres.search import (
+    SearchHeadline, SearchQuery, SearchRank, SearchVector
+)
+from django.db import connection
+from django.db.models import F, FloatField, OuterRef, Subquery
+from django.db.models.expressions import RawSQL
+
+from .models import Category, Course, Lesson
+
+SEARCH_CONFIG = 'english'
+FTS_TABLE = 'courses_course_fts'
+LESSON_FTS_TABLE = 'courses_lesson_fts'
+# bm25() column weights for title, category, description (mirrors A > B > C).
+FTS_WEIGHTS = (10.0, 4.0, 1.0)
+# bm25() column weights for lesson title, content (mirrors A > B).
+LESSON_FTS_WEIGHTS = (10.0, 1.0)
+
+HIGHLIGHT_START = '<mark>'
+HIGHLIGHT_STOP = '</mark>'
+SNIPPET_WORDS = 24
+
+
+def uses_postgres():
+    return connection.vendor == 'postgresql'
+
+
+def search_terms(text):
+    """Split free text into word tokens that are safe to put in a query."""
+    return re.findall(r'\w+', (text or '').lower())
+
+
+def prefix_tsquery(terms):
+    return SearchQuery(
+        ' & '.join(f'{term}:*' for term in terms),
+        search_type='raw',
+        config=SEARCH_CONFIG,
+    )
+
+
+def fts_match(terms):
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def fts_search(queryset, table, weights, terms):
+    """
+    Filter ``queryset`` down to the rows whose FTS5 mirror in ``table``
+    matches ``terms``, best bm25() score first. Matching and ranking stay in
+    SQL, so the database paginates over every match.
+    """
+    match = fts_match(terms)
+    row_id = f'"{queryset.model._meta.db_table}"."id"'
+    rank = RawSQL(
+        f'SELECT -bm25({table}, {", ".join(["%s"] * len(weights))}) FROM {table} '
+        f'WHERE {table} MATCH %s AND rowid = {row_id}',
+        [*weights, match],
+        output_field=FloatField(),
+    )
+    return queryset.filter(
+        pk__in=RawSQL(f'SELECT rowid FROM {table} WHERE {table} MATCH %s', [match])
+    ).annotate(search_rank=rank).order_by('-search_rank', 'id')
+
+
+def course_search_vector():
+    category_name = Category.objects.filter(pk=OuterRef('category_id')).values('name')
+    return (
+        SearchVector('title', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(Subquery(category_name), weight='B', config=SEARCH_CONFIG)
+        + SearchVector('description', weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def refresh_search_index(courses=None):
+    """Recompute the search document of ``courses`` (a queryset; all if None)."""
+    if courses is None:
+        courses = Course.objects.all()
+
+    if uses_postgres():
+        courses.update(search_vector=course_search_vector())
+        return
+
+    rows = courses.values_list('id', 'title', 'category__name', 'description')
+    with connection.cursor() as cursor:
+        for row in rows.iterator():
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [row[0]])
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, category, description) '
+                'VALUES (%s, %s, %s, %s)',
+                [row[0], row[1], row[2] or '', row[3]],
+            )
+
+
+def remove_from_search_index(course_ids):
+    if uses_postgres():
+        # The vector lives on the course row and goes away with it.
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+            [[course_id] for course_id in course_ids],
+        )
+
+
+def search_courses(queryset, text):
+    """
+    Filter ``queryset`` down to courses matching ``text`` and order them by
+    relevance. Every word is matched as a prefix, so "pyth" finds "Python".
+    An empty query returns ``queryset`` unchanged.
+    """
+    terms = search_terms(text)
+    if not terms:
+        return queryset
+
+    if uses_postgres():
+        query = prefix_tsquery(terms)
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query),
+        ).order_by('-search_rank', 'id')
+
+    return fts_search(queryset, FTS_TABLE, FTS_WEIGHTS, terms)
+
+
+def lesson_search_vector():
+    return (
+        SearchVector('title', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('content', weight='B', config=SEARCH_CONFIG)
+    )
+
+
+def refresh_lesson_search_index(lessons=None):
+    """Recompute the search document of ``lessons`` (a queryset; all if None)."""
+    if lessons is None:
+        lessons = Lesson.objects.all()
+
+    if uses_postgres():
+        lessons.update(search_vector=lesson_search_vector())
+        return
+
+    # Copy row to row inside SQLite so lesson bodies never pass through Python.
+    lesson_table = Lesson._meta.db_table
+    ids = list(lessons.values_list('pk', flat=True))
+    with connection.cursor() as cursor:
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(
+                f'DELETE FROM {LESSON_FTS_TABLE} WHERE rowid IN ({placeholders})', chunk
+            )
+            cursor.execute(
+                f'INSERT INTO {LESSON_FTS_TABLE} (rowid, title, content) '
+                f'SELECT id, title, content FROM {lesson_table} WHERE id IN ({placeholders})',
+                chunk,
+            )
+
+
+def remove_lessons_from_search_index(lesson_ids):
+    if uses_postgres():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'DELETE FROM {LESSON_FTS_TABLE} WHERE rowid = %s',
+            [[lesson_id] for lesson_id in lesson_ids],
+        )
+
+
+def search_lessons(queryset, text):
+    """
+    Filter ``queryset`` down to lessons whose title or content matches
+    ``text``, best matches first. An empty query matches nothing.
+    """
+    terms = search_terms(text)
+    if not terms:
+        return queryset.none()
+
+    if uses_postgres():
+        query = prefix_tsquery(terms)
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query),
+        ).order_by('-search_rank', 'id')
+
+    return fts_search(queryset, LESSON_FTS_TABLE, LESSON_FTS_WEIGHTS, terms)
+
+
+def lesson_snippets(lesson_ids, text):
+    """
+    Return ``{lesson_id: snippet}`` with the words matching ``text``
+    highlighted. The excerpt is cut by the database, so only the snippet,
+    never the lesson body, is fetched.
+    """
+    terms = search_terms(text)
+    if not terms or not lesson_ids:
+        return {}
+
+    if uses_postgres():
+        return dict(
+            Lesson.objects.filter(pk__in=lesson_ids).annotate(
+                snippet=SearchHeadline(
+                    'content',
+                    prefix_tsquery(terms),
+                    config=SEARCH_CONFIG,
+                    start_sel=HIGHLIGHT_START,
+                    stop_sel=HIGHLIGHT_STOP,
+                    max_words=SNIPPET_WORDS,
+                    min_words=SNIPPET_WORDS // 2,
+                ),
+            ).values_list('pk', 'snippet')
+        )
+
+    placeholders = ', '.join(['%s'] * len(lesson_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid, snippet({LESSON_FTS_TABLE}, 1, %s, %s, %s, %s) '
+            f'FROM {LESSON_FTS_TABLE} WHERE {LESSON_FTS_TABLE} MATCH %s '
+            f'AND rowid IN ({placeholders})',
+            [HIGHLIGHT_START, HIGHLIGHT_STOP, '…', SNIPPET_WORDS,
+             fts_match(terms), *lesson_ids],
+        )
+        return dict(cursor.fetchall())
@@ -1,7 +1,17 @@
+import json
+
+from django.urls import reverse
+from django.utils import timezone
 from rest_framework.serializers import ModelSerializer
 from rest_framework import serializers
-from .models import Category, Course, Module, Lesson, UserProgress, Enrollment, ReviewRating, Contact
-from django.db.models import Avg
+from .models import (
+    Category, Course, Module, Lesson, LearningEvent, ResourceUpload, UserProgress, Enrollment,
+    ReviewRating, Contact
+)
+from .events import MAX_BATCH, MAX_EVENT_AGE
+from .ratings import upsert_rating
+from .thumbnails import thumbnail_srcset
+from .uploads import max_upload_size
 
 class CategorySerializer(ModelSerializer):
     class Meta:
@@ -9,13 +19,18 @@ class CategorySerializer(ModelSerializer):
         fields = '__all__'
 
 class LessonSerializer(ModelSerializer):
-    video = serializers.CharField(read_only=True)  # Renamed field
+    video = serializers.CharField(read_only=True)  # Embed URL stored on save
+    # Seconds into the video for the requesting user, from context['resume_positions'];
+    # left out without it.
+    resume_position = serializers.SerializerMethodField()
     
     class Meta:
         model = Lesson
         fields = [
-            'id', 'title', 'content', 'youtube_url', 
-            'video', 'resources', 'order'  # Updated field name
+            'id', 'title', 'content', 'content_html', 'youtube_url', 
+            'video', 'video_id', 'resources', 'resource_size',
+            'resource_content_type', 'resource_name', 'order',  # Updated field name
+            'resume_position'
         ]
         extra_kwargs = {
             'youtube_url': {
@@ -23,6 +38,43 @@ class LessonSerializer(ModelSerializer):
             }
         }
 
+    def get_resume_position(self, obj):
+        return self.context.get('resume_positions', {}).get(obj.id)
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Resource files are only handed out by the enrollment-checked endpoint.
+        if data.get('resources'):
+            url = reverse('lessons-resource', args=[instance.pk])
+            request = self.context.get('request')
+            data['resources'] = request.build_absolute_uri(url) if request else url
+        if 'resume_positions' not in self.context:
+            del data['resume_position']
+        return data
+
+class LessonPositionSerializer(serializers.Serializer):
+    position = serializers.FloatField(min_value=0)
+    duration = serializers.FloatField(min_value=0, required=False, allow_null=True)
+
+class LessonSearchResultSerializer(ModelSerializer):
+    """Lesson search hit: breadcrumb plus a highlighted excerpt, no body."""
+    module = serializers.SerializerMethodField()
+    course = serializers.SerializerMethodField()
+    snippet = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Lesson
+        fields = ['id', 'title', 'order', 'module', 'course', 'snippet']
+
+    def get_module(self, obj):
+        return {"id": obj.module_id, "title": obj.module.title}
+
+    def get_course(self, obj):
+        return {"id": obj.module.course_id, "title": obj.module.course.title}
+
+    def get_snippet(self, obj):
+        return self.context.get('snippets', {}).get(obj.id, '')
+
 class ModuleSerializer(ModelSerializer):
     lessons = LessonSerializer(many=True, read_only=True)
     
@@ -30,42 +82,72 @@ class ModuleSerializer(ModelSerializer):
         model = Module
         fields = ['id', 'title', 'description', 'order', 'lessons']
 
-class CourseSerializer(ModelSerializer):
-    average_rating = serializers.SerializerMethodField()
+class CourseSummarySerializer(ModelSerializer):
+    """Catalog card representation used by list/search; no module tree."""
+    average_rating = serializers.FloatField(read_only=True)
     is_enrolled = serializers.SerializerMethodField()
-    modules = ModuleSerializer(many=True, read_only=True)
     category = CategorySerializer()
-    enrollments_count = serializers.IntegerField(
-        source='enrollments.count', 
-        read_only=True
-    )
-    user_progress = serializers.SerializerMethodField()
+    enrollments_count = serializers.SerializerMethodField()
+    thumbnail_srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = Course
         fields = [
-            'id', 'title', 'description', 'category', 
-            'price', 'thumbnail', 'created_at', 'modules',
-            'enrollments_count', 'is_enrolled', 'user_progress', 'average_rating'
+            'id', 'title', 'category', 'price', 'thumbnail', 'thumbnail_srcset',
+            'enrollments_count', 'is_enrolled', 'average_rating', 'rating_count'
         ]
 
-    def get_user_progress(self, obj):
+    def get_context_user(self):
+        # CourseViewSet passes 'user' explicitly so it can build the shared,
+        # cacheable payload as anonymous for any request.
+        if 'user' in self.context:
+            return self.context['user']
         request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return UserProgressSerializer(
-                UserProgress.objects.filter(user=request.user, course=obj),
-                many=True
-            ).data
-        return []
+        return request.user if request else None
 
+    # enrollments_count, is_enrolled and user_progress_list are
+    # annotated/prefetched by CourseViewSet.get_queryset; the queries
+    # below are only a fallback for courses loaded some other way.
     def get_is_enrolled(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return obj.enrollments.filter(user=request.user).exists()
+        user = self.get_context_user()
+        if user and user.is_authenticated:
+            if hasattr(obj, 'is_enrolled'):
+                return obj.is_enrolled
+            return obj.enrollments.filter(user=user).exists()
         return False
-    
-    def get_average_rating(self, obj):
-        return obj.reviewrating_set.aggregate(Avg('rating'))['rating__avg'] or 0
+
+    def get_enrollments_count(self, obj):
+        if hasattr(obj, 'enrollments_count'):
+            return obj.enrollments_count
+        return obj.enrollments.count()
+
+    def get_thumbnail_srcset(self, obj):
+        request = self.context.get('request')
+        return thumbnail_srcset(obj, request.build_absolute_uri if request else str)
+
+class CourseSerializer(CourseSummarySerializer):
+    modules = ModuleSerializer(many=True, read_only=True)
+    user_progress = serializers.SerializerMethodField()
+    rating_histogram = serializers.DictField(child=serializers.IntegerField(), read_only=True)
+
+    class Meta(CourseSummarySerializer.Meta):
+        fields = [
+            'id', 'title', 'description', 'category', 
+            'price', 'thumbnail', 'thumbnail_srcset', 'created_at', 'modules',
+            'enrollments_count', 'is_enrolled', 'user_progress', 'average_rating',
+            'rating_count', 'rating_histogram'
+        ]
+
+    def get_user_progress(self, obj):
+        user = self.get_context_user()
+        if user and user.is_authenticated:
+            progress = getattr(obj, 'user_progress_list', None)
+            if progress is None:
+                progress = UserProgress.objects.filter(
+                    user=user, course=obj
+                ).select_related('module')
+            return UserProgressSerializer(progress, many=True).data
+        return []
 
 class CourseCreateSerializer(ModelSerializer):
     class Meta:
@@ -77,14 +159,74 @@ class CourseCreateSerializer(ModelSerializer):
 class UserProgressSerializer(ModelSerializer):
     lesson = serializers.SerializerMethodField()
     module = serializers.StringRelatedField()
-    course = serializers.IntegerField(source='course.id', read_only=True)
+    course = serializers.IntegerField(source='course_id', read_only=True)
 
     class Meta:
         model = UserProgress
         fields = ['id', 'course', 'completed', 'completed_at', 'lesson', 'module']
 
     def get_lesson(self, obj):
-        return {"id": obj.lesson.id}
+        return {"id": obj.lesson_id}
+
+class ProgressSyncItemSerializer(serializers.Serializer):
+    lessonId = serializers.IntegerField()
+    completed = serializers.BooleanField(default=True)
+    completed_at = serializers.DateTimeField(required=False, allow_null=True)
+
+
+class ProgressSyncSerializer(serializers.Serializer):
+    courseId = serializers.IntegerField()
+    items = serializers.ListField(
+        child=serializers.JSONField(), allow_empty=False, max_length=500
+    )
+
+class LearningEventSerializer(serializers.Serializer):
+    type = serializers.ChoiceField(choices=LearningEvent.TYPES)
+    course = serializers.IntegerField(required=False, allow_null=True, min_value=1)
+    lesson = serializers.IntegerField(required=False, allow_null=True, min_value=1)
+    assessment = serializers.IntegerField(required=False, allow_null=True, min_value=1)
+    at = serializers.DateTimeField(required=False, allow_null=True)
+    data = serializers.DictField(required=False)
+
+    def validate_at(self, value):
+        if value and value < timezone.now() - MAX_EVENT_AGE:
+            raise serializers.ValidationError("Event is too old.")
+        return value
+
+    def validate_data(self, value):
+        if len(json.dumps(value, default=str)) > 2000:
+            raise serializers.ValidationError("Keep event data under 2000 characters.")
+        return value
+
+
+class LearningEventBatchSerializer(serializers.Serializer):
+    events = serializers.ListField(
+        child=serializers.JSONField(), allow_empty=False, max_length=MAX_BATCH
+    )
+
+class CourseCloneSerializer(serializers.Serializer):
+    title = serializers.CharField(max_length=255, required=False, allow_blank=True,
+                                  help_text="Defaults to the source title with \"(copy)\"")
+    include_assessments = serializers.BooleanField(default=True)
+
+
+class ResourceUploadSerializer(ModelSerializer):
+    checksum = serializers.RegexField(r'^[0-9a-fA-F]{64}$', required=False, allow_blank=True,
+                                      help_text="SHA-256 of the whole file, checked on finalize")
+    chunk_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = ResourceUpload
+        fields = [
+            'id', 'lesson', 'filename', 'size', 'checksum',
+            'chunk_size', 'chunk_count', 'received', 'created_at'
+        ]
+        read_only_fields = ['chunk_size', 'received']
+
+    def validate_size(self, value):
+        if not 0 < value <= max_upload_size():
+            raise serializers.ValidationError(f"Size must be between 1 and {max_upload_size()} bytes.")
+        return value
 
 class EnrollmentSerializer(ModelSerializer):
     class Meta:
@@ -98,11 +240,11 @@ class ReviewRatingSerializer(serializers.ModelSerializer):
         read_only_fields = ['user', 'course', 'created_at']
 
     def create(self, validated_data):
-        return ReviewRating.objects.update_or_create(
-            user=self.context['request'].user,
-            course=self.context['course'],
-            defaults=validated_data
-        )[0]
+        return upsert_rating(
+            self.context['request'].user,
+            self.context['course'].id,
+            validated_data['rating'],
+        )
     
 
 class ContactSerializer(ModelSerializer):
@@ -0,0 +1,226 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
+from django.dispatch import receiver
+
+from users.models import UserAccount
+from .authentication import forget_user
+from .blobs import BLOB_FIELDS, blob_names, stored_blob_names, update_references
+from .cache import bump_catalog_version
+from .enrollments import invalidate_enrollment_count
+from .completion import allocate_progress_slots, lesson_slots, record_completion
+from .ratings import refresh_rating_stats
+from .thumbnails import needs_variants, queue_thumbnail_variants
+from .models import (
+    Category, Course, CourseProgress, Module, Lesson, Enrollment, ReviewRating, UserProgress
+)
+from .outline import drop_outline, refresh_outline
+from .progress import invalidate_progress_summary
+from .search import (
+    refresh_search_index,
+    remove_from_search_index,
+    refresh_lesson_search_index,
+    remove_lessons_from_search_index,
+)
+
+SEARCHABLE_COURSE_FIELDS = {'title', 'description', 'category'}
+OUTLINE_LESSON_FIELDS = {'title', 'order', 'youtube_url', 'resources', 'module'}
+
+
+@receiver(post_save, sender=Course)
+def index_course(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not SEARCHABLE_COURSE_FIELDS & set(update_fields):
+        return
+    refresh_search_index(Course.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Course)
+def render_thumbnail_variants(sender, instance, update_fields=None, **kwargs):
+    if update_fields and 'thumbnail' not in update_fields:
+        return
+    if needs_variants(instance):
+        queue_thumbnail_variants(instance.pk)
+
+
+@receiver(post_delete, sender=Course)
+def unindex_course(sender, instance, **kwargs):
+    remove_from_search_index([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_courses(sender, instance, **kwargs):
+    refresh_search_index(Course.objects.filter(category=instance))
+
+
+@receiver(pre_delete, sender=Category)
+def remember_category_courses(sender, instance, **kwargs):
+    # Course.category is SET_NULL, so the affected ids are gone after delete.
+    instance._course_ids = list(instance.course_set.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Category)
+def reindex_uncategorized_courses(sender, instance, **kwargs):
+    refresh_search_index(Course.objects.filter(pk__in=getattr(instance, '_course_ids', [])))
+
+
+@receiver(post_save, sender=Lesson)
+def index_lesson(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not {'title', 'content'} & set(update_fields):
+        return
+    refresh_lesson_search_index(Lesson.objects.filter(pk=instance.pk))
+
+
+@receiver(post_delete, sender=Lesson)
+def unindex_lesson(sender, instance, **kwargs):
+    remove_lessons_from_search_index([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Course)
+@receiver([post_save, post_delete], sender=Module)
+@receiver([post_save, post_delete], sender=Lesson)
+def invalidate_catalog(sender, **kwargs):
+    bump_catalog_version()
+
+
+@receiver([post_save, post_delete], sender=Module)
+def touch_module_course(sender, instance, **kwargs):
+    Course.touch(pk=instance.course_id)
+
+
+@receiver([post_save, post_delete], sender=Lesson)
+def touch_lesson_course(sender, instance, **kwargs):
+    Course.touch(modules=instance.module_id)
+    Course.refresh_lesson_counts(modules=instance.module_id)
+
+
+@receiver(pre_save, sender=Lesson)
+def remember_lesson_module(sender, instance, **kwargs):
+    if instance.pk:
+        previous = Lesson.objects.filter(
+            pk=instance.pk
+        ).values_list('module_id', 'module__course_id').first()
+        instance._previous_module_id, instance._previous_course_id = previous or (None, None)
+
+
+@receiver(pre_save, sender=Lesson)
+def assign_progress_slot(sender, instance, **kwargs):
+    # Slots are per course, so a lesson moved to another course needs a new one.
+    previous_module = getattr(instance, '_previous_module_id', None)
+    if previous_module and previous_module != instance.module_id:
+        if instance._previous_course_id != instance.module.course_id:
+            instance.progress_slot = None
+    if instance.progress_slot is None:
+        instance.progress_slot = allocate_progress_slots(instance.module.course_id)
+
+
+@receiver(post_save, sender=Lesson)
+def recount_previous_course(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_module_id', None)
+    if previous and previous != instance.module_id:
+        Course.touch(modules=previous)
+        Course.refresh_lesson_counts(modules=previous)
+
+
+def schedule_outline_refresh(course_id):
+    # Drop the stored outline now, so reads in this transaction rebuild it
+    # from what they see, and store a fresh one after commit.
+    drop_outline(course_id)
+    transaction.on_commit(lambda: refresh_outline(course_id))
+
+
+@receiver([post_save, post_delete], sender=Module)
+def refresh_module_outline(sender, instance, **kwargs):
+    schedule_outline_refresh(instance.course_id)
+
+
+@receiver([post_save, post_delete], sender=Lesson)
+def refresh_lesson_outline(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not OUTLINE_LESSON_FIELDS & set(update_fields):
+        return
+    course_ids = set(Module.objects.filter(pk=instance.module_id).values_list('course_id', flat=True))
+    previous = getattr(instance, '_previous_course_id', None)
+    if previous:
+        course_ids.add(previous)
+    for course_id in course_ids:
+        schedule_outline_refresh(course_id)
+
+
+@receiver(post_save, sender=Category)
+def touch_category_courses(sender, instance, created, **kwargs):
+    if not created:
+        Course.touch(category=instance)
+
+
+# Reference counts of content-addressed files (courses.blobs).
+@receiver(pre_save, sender=Course)
+@receiver(pre_save, sender=Lesson)
+def remember_blob_names(sender, instance, update_fields=None, **kwargs):
+    instance._previous_blob_names = None
+    if update_fields and not {*BLOB_FIELDS[sender], 'thumbnail_variants'} & set(update_fields):
+        return
+    # Variants a save does not write (see Course.MAINTAINED_FIELDS) keep
+    # their references; the loaded copy may be stale.
+    instance._counts_variants = not update_fields or 'thumbnail_variants' in update_fields
+    instance._previous_blob_names = stored_blob_names(
+        sender, instance.pk, variants=instance._counts_variants
+    ) if instance.pk else []
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_save, sender=Lesson)
+def count_blob_references(sender, instance, **kwargs):
+    if instance._previous_blob_names is not None:
+        update_references(instance._previous_blob_names,
+                          blob_names(instance, variants=instance._counts_variants))
+
+
+@receiver(post_delete, sender=Course)
+@receiver(post_delete, sender=Lesson)
+def release_blob_references(sender, instance, **kwargs):
+    update_references(blob_names(instance), [])
+
+
+# Counted per course (courses.enrollments); neither the catalog version nor
+# content_version moves, so cached catalog pages and validators survive.
+@receiver([post_save, post_delete], sender=Enrollment)
+def invalidate_enrollment_counts(sender, instance, **kwargs):
+    invalidate_enrollment_count(instance.course_id)
+
+
+# API ratings adjust the aggregates in courses.ratings.upsert_rating; this
+# catches admin edits and deletes.
+@receiver([post_save, post_delete], sender=ReviewRating)
+def refresh_course_ratings(sender, instance, **kwargs):
+    refresh_rating_stats(Course.objects.filter(pk=instance.course_id))
+
+
+@receiver([post_save, post_delete], sender=Enrollment)
+@receiver([post_save, post_delete], sender=UserProgress)
+def invalidate_user_progress_summary(sender, instance, **kwargs):
+    invalidate_progress_summary(instance.user_id)
+
+
+@receiver(post_save, sender=Enrollment)
+def create_course_progress(sender, instance, created, **kwargs):
+    # Spares the first completion in the course the insert.
+    if created:
+        CourseProgress.objects.bulk_create(
+            [CourseProgress(user_id=instance.user_id, course_id=instance.course_id)],
+            ignore_conflicts=True,
+        )
+
+
+# Mirror UserProgress rows into the CourseProgress bitset (courses.completion).
+# Bulk writes call record_completion() themselves.
+@receiver([post_save, post_delete], sender=UserProgress)
+def mirror_user_progress(sender, instance, signal, **kwargs):
+    slot = lesson_slots([instance.course_id])[instance.course_id].get(instance.lesson_id)
+    if slot is not None:
+        completed = instance.completed and signal is post_save
+        record_completion(instance.user_id, instance.course_id, {slot[0]: completed})
+
+
+# Deactivated or deleted accounts lose access to the token-only endpoints.
+@receiver([post_save, post_delete], sender=UserAccount)
+def forget_cached_user(sender, instance, **kwargs):
+    forget_user(instance.pk)
@@ -0,0 +1,99 @@
+"""
+Content-addressed file storage for course uploads.
+
+ContentAddressedStorage hashes an upload while streaming it to a temporary
+file and stores it as ``<upload_to>/<sha256><ext>``. An identical upload
+to the same field finds the blob already there and reuses it, so there are
+no ``_y5OaBhg`` copies. A name never changes content, so the media server
+can cache blob URLs forever.
+
+Every blob has a StoredBlob row whose ``references`` courses.blobs keeps in
+step with the model fields that point at it. ``manage.py collect_blobs``
+recounts and deletes blobs nobody references.
+"""
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+TEMP_DIR = '.incoming'
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        # The final name is decided by the content in _save().
+        return name
+
+    def _save(self, name, content):
+        temp_dir = self.path(TEMP_DIR)
+        os.makedirs(temp_dir, exist_ok=True)
+
+        digest = hashlib.sha256()
+        size = 0
+        if hasattr(content, 'seek') and content.seekable():
+            content.seek(0)
+        with tempfile.NamedTemporaryFile(dir=temp_dir, delete=False) as temp:
+            for chunk in content.chunks():
+                digest.update(chunk)
+                size += len(chunk)
+                temp.write(chunk)
+        return self._place(temp.name, name, digest.hexdigest(), size)
+
+    def store_file(self, path, name, digest, size):
+        """
+        Move the local file at ``path``, whose SHA-256 is ``digest``, into the
+        storage as a save of ``name`` would, without copying it. ``path`` must
+        be on the storage's filesystem, e.g. under its incoming directory.
+        """
+        return self._place(path, name, digest, size)
+
+    def _place(self, temp_path, name, digest, size):
+        directory, basename = os.path.split(name)
+        extension = os.path.splitext(basename)[1].lower()
+        name = posixpath.join(directory, digest + extension)
+
+        # Registered before the file is looked at: a collect_blobs() purging
+        # this blob finishes first, and then the file is written again.
+        # Imported here: models import this module for the field storage.
+        from .blobs import register_blob
+        register_blob(name, digest, size)
+
+        path = self.path(name)
+        if os.path.exists(path):
+            os.unlink(temp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temp_path, path)
+            if self.file_permissions_mode is not None:
+                os.chmod(path, self.file_permissions_mode)
+        return name
+
+    def delete(self, name):
+        # Blobs are shared; FieldFile.delete() must not remove one that
+        # another row still uses. collect_blobs() purges unreferenced ones.
+        pass
+
+    def purge(self, name):
+        super().delete(name)
+
+
+blob_storage = ContentAddressedStorage()
+
+
+def hash_file(path, block_size=64 * 1024):
+    """``(sha256 hex digest, size)`` of a local file."""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+            size += len(block)
+    return digest.hexdigest(), size
+
+
+def get_blob_storage():
+    return blob_storage
@@ -1,3 +1,1874 @@
-from django.test import TestCase
+import datetime
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import zipfile
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from assessments.models import Assessment, Choice, Question
+from users.models import UserAccount
+from .blobs import collect_blobs, referenced_names
+from .cache import catalog_version
+from .cloning import clone_course
+from .completion import load_bits
+from .downloads import content_disposition
+from .events import ensure_partitions, partition_name
+from .lesson_content import parse_youtube_url
+from .models import (
+    Category, Course, CourseOutline, CourseProgress, Module, Lesson, LessonPosition, LearningEvent,
+    LearningEventDaily, Enrollment, ResourceUpload, StoredBlob, UserProgress, ReviewRating,
+)
+from .progress_buffer import pending_for, user_lock as progress_user_lock
+from .serializers import CourseSummarySerializer
+from .storage import TEMP_DIR, blob_storage
+from .transfer import export_course, import_course
+from .views import CourseViewSet
+
+
+def make_course(index, category, user=None, modules=2, lessons=3):
+    course = Course.objects.create(
+        title=f"Course {index}",
+        description=f"Description {index}",
+        category=category,
+        price=10,
+    )
+    for m in range(modules):
+        module = Module.objects.create(course=course, title=f"Module {m}", order=m)
+        for n in range(lessons):
+            lesson = Lesson.objects.create(
+                module=module, title=f"Lesson {m}.{n}", content="Body", order=n
+            )
+            if user is not None:
+                UserProgress.objects.create(
+                    user=user, course=course, module=module, lesson=lesson, completed=True
+                )
+    if user is not None:
+        Enrollment.objects.create(user=user, course=course)
+        ReviewRating.objects.create(user=user, course=course, rating=4)
+    return course
+
+
+@override_settings(CATALOG_CACHE_TIMEOUT=0)
+class CourseListQueryCountTests(TestCase):
+    def setUp(self):
+        self.user = UserAccount.objects.create_user('learner@example.com', 'Learner', 'pass')
+        self.category = Category.objects.create(name='Programming', slug='programming')
+        self.client = APIClient()
+
+    def count_list_queries(self, url='/api/v1/courses/?view=full'):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_query_count_does_not_grow_with_courses(self):
+        self.client.force_authenticate(self.user)
+        for i in range(2):
+            make_course(i, self.category, self.user)
+        small, _ = self.count_list_queries()
+
+        for i in range(2, 8):
+            make_course(i, self.category, self.user)
+        large, response = self.count_list_queries()
+
+        self.assertEqual(small, large)
+        course = response.data['results'][0]
+        self.assertTrue(course['is_enrolled'])
+        self.assertEqual(course['enrollments_count'], 1)
+        self.assertEqual(course['average_rating'], 4)
+        self.assertEqual(len(course['user_progress']), 6)
+
+    def test_anonymous_query_count_does_not_grow_with_courses(self):
+        make_course(0, self.category)
+        small, _ = self.count_list_queries()
+
+        for i in range(1, 6):
+            make_course(i, self.category)
+        large, response = self.count_list_queries()
+
+        self.assertEqual(small, large)
+        self.assertFalse(response.data['results'][0]['is_enrolled'])
+        self.assertEqual(response.data['results'][0]['average_rating'], 0)
+
+
+class CourseSummaryViewTests(TestCase):
+    def setUp(self):
+        self.user = UserAccount.objects.create_user('learner@example.com', 'Learner', 'pass')
+        self.category = Category.objects.create(name='Programming', slug='programming')
+        self.course = make_course(0, self.category, self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_list_defaults_to_summary(self):
+        response = self.client.get('/api/v1/courses/')
+        course = response.data['results'][0]
+        self.assertNotIn('modules', course)
+        self.assertNotIn('description', course)
+        self.assertEqual(course['enrollments_count'], 1)
+        self.assertTrue(course['is_enrolled'])
+
+    def test_search_defaults_to_summary(self):
+        response = self.client.get('/api/v1/courses/search/', {'search': 'Course'})
+        self.assertNotIn('modules', response.data['results'][0])
+
+    def test_view_full_returns_tree(self):
+        response = self.client.get('/api/v1/courses/', {'view': 'full'})
+        self.assertEqual(len(response.data['results'][0]['modules']), 2)
+
+    def test_retrieve_returns_tree(self):
+        response = self.client.get(f'/api/v1/courses/{self.course.id}/')
+        self.assertEqual(len(response.data['modules']), 2)
+        self.assertEqual(len(response.data['modules'][0]['lessons']), 3)
+        self.assertEqual(len(response.data['user_progress']), 6)
+
+    def test_summary_skips_tree_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get('/api/v1/courses/')
+        self.assertFalse(any('courses_lesson' in q['sql'] for q in ctx.captured_queries))
+
+
+class CourseSearchTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Data Science', slug='data-science')
+        self.in_title = Course.objects.create(
+            title='Python for Beginners', description='Start coding today.', price=0
+        )
+        self.in_description = Course.objects.create(
+            title='Automation Basics', description='Scripts written in Python.', price=0
+        )
+        self.in_category = Course.objects.create(
+            title='Statistics', description='Numbers.', category=self.category, price=0
+        )
+        self.client = APIClient()
+
+    def search(self, term):
+        response = self.client.get('/api/v1/courses/search/', {'search': term})
+        self.assertEqual(response.status_code, 200)
+        return [course['id'] for course in response.data['results']]
+
+    def test_title_match_ranks_above_description_match(self):
+        self.assertEqual(self.search('python'), [self.in_title.id, self.in_description.id])
+
+    def test_prefix_matching(self):
+        self.assertEqual(self.search('pyth beg'), [self.in_title.id])
+
+    def test_category_name_is_searchable_and_kept_current(self):
+        self.assertEqual(self.search('science'), [self.in_category.id])
+        self.category.name = 'Analytics'
+        self.category.save()
+        self.assertEqual(self.search('science'), [])
+        self.assertEqual(self.search('analytics'), [self.in_category.id])
+
+    def test_edits_and_deletes_are_reflected(self):
+        self.in_title.title = 'Rust for Beginners'
+        self.in_title.save()
+        self.assertEqual(self.search('python'), [self.in_description.id])
+        self.in_description.delete()
+        self.assertEqual(self.search('python'), [])
+
+    def test_empty_query_returns_everything(self):
+        self.assertEqual(len(self.search('')), 3)
+
+    @skipUnless(connection.vendor == 'postgresql', 'GIN indexes are PostgreSQL only')
+    def test_search_vectors_are_gin_indexed(self):
+        with connection.cursor() as cursor:
+            for model, name in ((Course, 'courses_course_search_gin'),
+                                (Lesson, 'courses_lesson_search_gin')):
+                constraints = connection.introspection.get_constraints(
+                    cursor, model._meta.db_table
+                )
+                self.assertEqual(constraints[name]['type'], 'gin')
+                self.assertEqual(constraints[name]['columns'], ['search_vector'])
+
+
+class LessonSearchTests(TestCase):
+    def setUp(self):
+        self.course = Course.objects.create(title='Web Basics', description='HTML', price=0)
+        self.module = Module.objects.create(course=self.course, title='Markup', order=1)
+        self.lesson = Lesson.objects.create(
+            module=self.module, title='Semantic elements', order=1,
+            content='Headings and paragraphs. ' * 40 + 'Use the article element for '
+                    'self-contained content. ' + 'Lists and tables. ' * 40,
+        )
+        self.title_hit = Lesson.objects.create(
+            module=self.module, title='Article layout', content='Columns.', order=2
+        )
+        other = Course.objects.create(title='Other', description='Other', price=0)
+        other_module = Module.objects.create(course=other, title='Other', order=1)
+        self.other_lesson = Lesson.objects.create(
+            module=other_module, title='News', content='Every article needs a byline.', order=1
+        )
+        self.client = APIClient()
+
+    def search(self, **params):
+        response = self.client.get('/api/v1/lessons/search/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_results_have_breadcrumb_and_highlighted_snippet(self):
+        data = self.search(search='artic', course=self.course.id)
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(data['results'][0]['id'], self.title_hit.id)
+        hit = next(r for r in data['results'] if r['id'] == self.lesson.id)
+        self.assertEqual(hit['module'], {'id': self.module.id, 'title': 'Markup'})
+        self.assertEqual(hit['course'], {'id': self.course.id, 'title': 'Web Basics'})
+        self.assertIn('<mark>article</mark>', hit['snippet'])
+        self.assertLess(len(hit['snippet']), len(self.lesson.content))
+        self.assertNotIn('content', hit)
+
+    def test_pagination_and_course_filter(self):
+        data = self.search(search='article', page_size=1)
+        self.assertEqual(data['count'], 3)
+        self.assertEqual(len(data['results']), 1)
+        self.assertIsNotNone(data['next'])
+        self.assertEqual(self.search(search='byline', course=self.course.id)['count'], 0)
+
+    def test_index_follows_edits(self):
+        self.lesson.content = 'Nothing relevant.'
+        self.lesson.save()
+        self.assertEqual(self.search(search='paragraphs')['count'], 0)
+        self.lesson.delete()
+        self.assertEqual(self.search(search='semantic')['count'], 0)
+
+
+class PaginationTests(TestCase):
+    def setUp(self):
+        self.user = UserAccount.objects.create_user('learner@example.com', 'Learner', 'pass')
+        self.category = Category.objects.create(name='Programming', slug='programming')
+        self.client = APIClient()
+
+    def test_course_list_walks_cursor_pages(self):
+        courses = [
+            Course.objects.create(title=f'Course {i}', description='', price=0)
+            for i in range(5)
+        ]
+        seen = []
+        url = '/api/v1/courses/?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 2)
+            seen += [course['id'] for course in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(seen, [course.id for course in reversed(courses)])
+
+    def test_view_caps_page_size(self):
+        for i in range(60):
+            Course.objects.create(title=f'Course {i}', description='', price=0)
+        response = self.client.get('/api/v1/courses/', {'page_size': 1000})
+        self.assertEqual(len(response.data['results']), CourseViewSet.max_page_size)
+
+    def test_page_numbers_remain_available(self):
+        for i in range(3):
+            Course.objects.create(title=f'Course {i}', description='', price=0)
+        response = self.client.get('/api/v1/courses/', {'page': 2, 'page_size': 2})
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_progress_list_is_paginated(self):
+        make_course(0, self.category, self.user)
+        make_course(1, self.category, self.user)
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/api/v1/progress/', {'page_size': 4})
+        progress = response.data['results']
+        self.assertEqual(sum(len(rows) for rows in progress.values()), 4)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_modules_and_lessons_keep_curriculum_order(self):
+        course = make_course(0, self.category, modules=3, lessons=1)
+        Module.objects.filter(course=course, order=0).update(order=5)
+        for module in Module.objects.filter(course=course):
+            module.lessons.update(order=module.order)
+        response = self.client.get('/api/v1/modules/')
+        self.assertEqual([module['order'] for module in response.data], [1, 2, 5])
+        response = self.client.get('/api/v1/lessons/')
+        self.assertEqual([lesson['title'] for lesson in response.data],
+                         ['Lesson 1.0', 'Lesson 2.0', 'Lesson 0.0'])
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = UserAccount.objects.create_user('learner@example.com', 'Learner', 'pass')
+        self.category = Category.objects.create(name='Programming', slug='programming')
+        self.course = make_course(0, self.category, self.user)
+        self.client = APIClient()
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(ctx.captured_queries)
+
+    def test_anonymous_hit_runs_no_queries(self):
+        self.get('/api/v1/courses/')
+        response, queries = self.get('/api/v1/courses/')
+        self.assertEqual(queries, 0)
+        self.assertFalse(response.data['results'][0]['is_enrolled'])
+
+    def test_enrollment_keeps_cached_pages_but_updates_counts(self):
+        self.get('/api/v1/courses/')
+        version = catalog_version()
+        other = UserAccount.objects.create_user('other@example.com', 'Other', 'pass')
+        Enrollment.objects.create(user=other, course=self.course)
+        self.assertEqual(catalog_version(), version)
+
+        response, queries = self.get('/api/v1/courses/')
+        # The cached page, plus one count for the course whose count moved.
+        self.assertEqual(queries, 1)
+        self.assertEqual(response.data['results'][0]['enrollments_count'], 2)
+
+    def test_content_edits_invalidate(self):
+        url = f'/api/v1/courses/{self.course.id}/'
+        self.get(url)
+        lesson = Lesson.objects.filter(module__course=self.course).first()
+        lesson.title = 'Renamed lesson'
+        lesson.save()
+        response, queries = self.get(url)
+        self.assertGreater(queries, 0)
+        self.assertEqual(response.data['modules'][0]['lessons'][0]['title'], 'Renamed lesson')
+
+        self.get('/api/v1/categories/')
+        self.category.name = 'Code'
+        self.category.save()
+        response, _ = self.get('/api/v1/categories/')
+        self.assertEqual(response.data[0]['name'], 'Code')
+
+    def test_per_user_fields_are_merged_into_shared_payload(self):
+        url = f'/api/v1/courses/{self.course.id}/'
+        anonymous, _ = self.get(url)
+        self.assertFalse(anonymous.data['is_enrolled'])
+        self.assertEqual(anonymous.data['user_progress'], [])
+
+        self.client.force_authenticate(self.user)
+        response, queries = self.get(url)
+        # ETag validators and the last stored resume position (the test cache
+        # is process-local), then enrollment, progress and stored resume
+        # positions for the merge.
+        self.assertEqual(queries, 5)
+        self.assertTrue(response.data['is_enrolled'])
+        self.assertEqual(len(response.data['user_progress']), 6)
+
+        other = UserAccount.objects.create_user('other@example.com', 'Other', 'pass')
+        self.client.force_authenticate(other)
+        response, _ = self.get(url)
+        self.assertFalse(response.data['is_enrolled'])
+        self.assertEqual(response.data['user_progress'], [])
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = UserAccount.objects.create_user('learner@example.com', 'Learner', 'pass')
+        self.category = Category.objects.create(name='Programming', slug='programming')
+        self.course = make_course(0, self.category)
+        self.module = self.course.modules.first()
+        self.lesson = self.module.lessons.first()
+        self.client = APIClient()
+
+    def assert_revalidates(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertFalse(etag.startswith('W/'))
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        return etag
+
+    def test_course_module_and_lesson_answer_304(self):
+        for url in [
+            f'/api/v1/courses/{self.course.id}/',
+            f'/api/v1/modules/{self.module.id}/',
+            f'/api/v1/lessons/{self.lesson.id}/',
+        ]:
+            self.assert_revalidates(url)
+
+    def test_if_modified_since(self):
+        url = f'/api/v1/modules/{self.module.id}/'
+        last_modified = self.client.get(url)['Last-Modified']
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_lesson_edit_changes_course_etag(self):
+        url = f'/api/v1/courses/{self.course.id}/'
+        etag = self.assert_revalidates(url)
+        self.lesson.title = 'Changed'
+        self.lesson.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_enrollment_only_changes_course_etag(self):
+        urls = [f'/api/v1/courses/{self.course.id}/', f'/api/v1/modules/{self.module.id}/']
+        etags = [self.client.get(url)['ETag'] for url in urls]
+        self.course.refresh_from_db(fields=['content_version'])
+        version = self.course.content_version
+        Enrollment.objects.create(user=self.user, course=self.course)
+
+        response = self.client.get(urls[0], HTTP_IF_NONE_MATCH=etags[0])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['enrollments_count'], 1)
+        self.assertEqual(self.client.get(urls[1], HTTP_IF_NONE_MATCH=etags[1]).status_code, 304)
+        self.course.refresh_from_db(fields=['content_version'])
+        self.assertEqual(self.course.content_version, version)
+
+    def test_rating_only_changes_course_etag(self):
+        urls = [f'/api/v1/courses/{self.course.id}/', f'/api/v1/modules/{self.module.id}/']
+        etags = [self.client.get(url)['ETag'] for url in urls]
+        ReviewRating.objects.create(user=self.user, course=self.course, rating=4)
+
+        self.assertEqual(self.client.get(urls[0], HTTP_IF_NONE_MATCH=etags[0]).status_code, 200)
+        self.assertEqual(self.client.get(urls[1], HTTP_IF_NONE_MATCH=etags[1]).status_code, 304)
+
+    def test_user_progress_changes_etag(self):
+        self.client.force_authenticate(self.user)
+        Enrollment.objects.create(user=self.user, course=self.course)
+        url = f'/api/v1/courses/{self.course.id}/'
+        first = self.client.get(url)
+        self.assertNotIn('Last-Modified', first)
+        self.client.post(
+            f'/api/v1/courses/{self.course.id}/toggle_lesson_progress/',
+            {'lesson_id': self.lesson.id},
+        )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['user_progress']), 1)
+
+    def test_learners_cannot_edit_content(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.patch(f'/api/v1/lessons/{self.lesson.id}/', {'title': 'Mine'})
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.client.delete(f'/api/v1/modules/{self.module.id}/').status_code, 403)
+        self.assertTrue(Module.objects.filter(pk=self.module.pk).exists())
+
+        staff = UserAccount.objects.create_superuser('staff@example.com', 'Staff', 'pass')
+        self.client.force_authenticate(staff)
+        response = self.client.patch(f'/api/v1/lessons/{self.lesson.id}/', {'title': 'Loops'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_unknown_course_is_404(self):
+        self.assertEqual(self.client.get('/api/v1/courses/999999/').status_code, 404)
+
+
+class RatingAggregateTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.course = Course.objects.create(title='Course', description='', price=0)
+        self.users = [
+            UserAccount.objects.create_user(f'user{i}@example.com', f'User {i}', 'pass')
+            for i in range(3)
+        ]
+        self.client = APIClient()
+
+    def rate(self, user, rating):
+        self.client.force_authenticate(user)
+        response = self.client.post(f'/api/v1/courses/{self.course.id}/rate/', {'rating': rating})
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_ratings_update_aggregates(self):
+        self.rate(self.users[0], 5)
+        self.rate(self.users[1], 3)
+        self.rate(self.users[1], 4)
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.rating_count, 2)
+        self.assertEqual(self.course.average_rating, 4.5)
+        self.assertEqual(self.course.rating_histogram, {'1': 0, '2': 0, '3': 0, '4': 1, '5': 1})
+        self.assertEqual(ReviewRating.objects.get(user=self.users[1]).rating, 4)
+
+    def test_rerating_keeps_created_at(self):
+        first = self.rate(self.users[0], 2).data
+        second = self.rate(self.users[0], 3).data
+        self.assertEqual(first['id'], second['id'])
+        self.assertEqual(first['created_at'], second['created_at'])
+
+    def test_admin_deletes_and_rebuild_command(self):
+        self.rate(self.users[0], 5)
+        self.rate(self.users[1], 1)
+        ReviewRating.objects.get(user=self.users[1]).delete()
+        self.course.refresh_from_db()
+        self.assertEqual((self.course.rating_count, self.course.rating_sum), (1, 5))
+
+        Course.objects.filter(pk=self.course.pk).update(rating_count=0, rating_sum=0, rating_5_count=0)
+        call_command('rebuild_rating_stats', stdout=StringIO())
+        self.course.refresh_from_db()
+        self.assertEqual((self.course.rating_count, self.course.rating_5_count), (1, 1))
+
+    def test_saving_a_loaded_course_keeps_concurrent_aggregates(self):
+        loaded = Course.objects.get(pk=self.course.pk)
+        self.rate(self.users[0], 5)
+        loaded.title = 'Renamed'
+        loaded.save()
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.title, 'Renamed')
+        self.assertEqual((self.course.rating_count, self.course.rating_5_count), (1, 1))
+        # Ratings are read by the course validators directly (courses.conditional).
+        self.assertEqual(self.course.content_version, loaded.content_version)
+
+    def test_rating_is_read_without_queries(self):
+        self.rate(self.users[0], 4)
+        course = Course.objects.get(pk=self.course.pk)
+        with CaptureQueriesContext(connection) as ctx:
+            data = CourseSummarySerializer(course).data
+        self.assertEqual(data['average_rating'], 4)
+        self.assertFalse(any('reviewrating' in q['sql'] for q in ctx.captured_queries))
+
+
+class ProgressSummaryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = UserAccount.objects.create_user('learner@example.com', 'Learner', 'pass')
+        self.category = Category.objects.create(name='Programming', slug='programming')
+        self.course = make_course(0, self.category, modules=2, lessons=2)
+        self.other = make_course(1, self.category, modules=1, lessons=3)
+        for course in (self.course, self.other):
+            Enrollment.objects.create(user=self.user, course=course)
+        self.lessons = list(Lesson.objects.filter(module__course=self.course).order_by(
+            'module__order', 'order'
+        ))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def summary(self):
+        response = self.client.get('/api/v1/progress/summary/')
+        self.assertEqual(response.status_code, 200)
+        return {row['course_id']: row for row in response.data}
+
+    def toggle(self, lesson):
+        self.client.post(
+            f'/api/v1/courses/{self.course.id}/toggle_lesson_progress/', {'lesson_id': lesson.id}
+        )
+
+    def test_summary_per_enrolled_course(self):
+        self.toggle(self.lessons[0])
+        self.toggle(self.lessons[2])
+        row = self.summary()[self.course.id]
+        self.assertEqual(row['total_lessons'], 4)
+        self.assertEqual(row['completed_lessons'], 2)
+        self.assertEqual(row['percentage'], 50.0)
+        self.assertIsNotNone(row['last_activity'])
+        self.assertEqual(row['next_lesson']['id'], self.lessons[1].id)
+
+        untouched = self.summary()[self.other.id]
+        self.assertEqual((untouched['completed_lessons'], untouched['percentage']), (0, 0))
+
+    def test_summary_is_one_query_and_cached(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.summary()
+        self.assertEqual(len(ctx.captured_queries), 1)
+        with CaptureQueriesContext(connection) as ctx:
+            self.summary()
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+    def test_progress_writes_invalidate(self):
+        self.summary()
+        for lesson in self.lessons:
+            self.toggle(lesson)
+        row = self.summary()[self.course.id]
+        self.assertEqual(row['percentage'], 100.0)
+        self.assertIsNone(row['next_lesson'])
+
+        self.client.post('/api/v1/progress/', {
+            'courseId': self.course.id, 'lessonId': self.lessons[0].id, 'completed': False
+        })
+        self.assertEqual(self.summary()[self.course.id]['completed_lessons'], 3)
+
+    def test_lesson_count_follows_content(self):
+        Lesson.objects.create(module=self.course.modules.first(), title='Extra', content='', order=9)
+        self.assertEqual(self.summary()[self.course.id]['total_lessons'], 5)
+
+
+class ProgressSyncTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = UserAccount.objects.create_user('learner@example.com', 'Learner', 'pass')
+        self.category = Category.objects.create(name='Programming', slug='programming')
+        self.course = make_course(0, self.category, modules=2, lessons=3)
+        self.lessons = list(Lesson.objects.filter(module__course=self.course).order_by('id'))
+        foreign = make_course(1, self.category, modules=1, lessons=1)
+        self.foreign_lesson = Lesson.objects.get(module__course=foreign)
+        Enrollment.objects.create(user=self.user, course=self.course)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def sync(self, items):
+        response = self.client.post(
+            '/api/v1/progress/sync/', {'courseId': self.course.id, 'items': items}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        return [result['status'] for result in response.data['results']]
+
+    def test_batch_is_applied_in_constant_queries(self):
+        items = [
+            {'lessonId': lesson.id, 'completed': True, 'completed_at': '2026-01-01T10:00:00Z'}
+            for lesson in self.lessons
+        ]
+        with CaptureQueriesContext(connection) as ctx:
+            statuses = self.sync(items)
+        self.assertEqual(statuses, ['applied'] * 6)
+        # Two of them lock and rewrite the CourseProgress bitset.
+        self.assertLessEqual(len(ctx.captured_queries), 6)
+        self.assertEqual(
+            UserProgress.objects.filter(user=self.user, completed=True).count(), 6
+        )
+
+    def test_last_writer_wins(self):
+        lesson = self.lessons[0]
+        self.sync([{'lessonId': lesson.id, 'completed': True, 'completed_at': '2026-01-01T10:00:00Z'}])
+        statuses = self.sync([
+            {'lessonId': lesson.id, 'completed': False, 'completed_at': '2026-01-01T09:00:00Z'},
+        ])
+        self.assertEqual(statuses, ['stale'])
+        self.assertTrue(UserProgress.objects.get(user=self.user, lesson=lesson).completed)
+
+        statuses = self.sync([
+            {'lessonId': lesson.id, 'completed': False, 'completed_at': '2026-01-01T12:00:00Z'},
+            {'lessonId': lesson.id, 'completed': True, 'completed_at': '2026-01-01T11:00:00Z'},
+        ])
+        self.assertEqual(statuses, ['applied', 'superseded'])
+        self.assertFalse(UserProgress.objects.get(user=self.user, lesson=lesson).completed)
+
+    def test_per_item_errors(self):
+        statuses = self.sync([
+            {'lessonId': self.lessons[0].id},
+            {'lessonId': self.foreign_lesson.id},
+            {'lessonId': 'abc'},
+            'garbage',
+        ])
+        self.assertEqual(statuses, ['applied', 'not_found', 'invalid', 'invalid'])
+
+    def test_sync_invalidates_summary(self):
+        self.client.get('/api/v1/progress/summary/')
+        self.sync([{'lessonId': self.lessons[0].id}])
+        response = self.client.get('/api/v1/progress/summary/')
+        self.assertEqual(response.data[0]['completed_lessons'], 1)
+
+
+class CompletionBitsetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = UserAccount.objects.create_user('learner@example.com', 'Learner', 'pass')
+        self.category = Category.objects.create(name='Programming', slug='programming')
+        self.course = make_course(0, self.category, modules=2, lessons=3)
+        Enrollment.objects.create(user=self.user, course=self.course)
+        self.lessons = list(Lesson.objects.filter(module__course=self.course).order_by('id'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def toggle(self, lesson):
+        response = self.client.post(
+            f'/api/v1/courses/{self.course.id}/toggle_lesson_progress/', {'lesson_id': lesson.id}
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.data['completed']
+
+    def record(self):
+        return CourseProgress.objects.get(user=self.user, course=self.course)
+
+    def test_lessons_get_stable_slots(self):
+        self.assertEqual([lesson.progress_slot for lesson in self.lessons], list(range(6)))
+        lesson = self.lessons[0]
+        lesson.order = 99
+        lesson.save()
+        lesson.refresh_from_db()
+        self.assertEqual(lesson.progress_slot, 0)
+        self.assertEqual(Lesson.objects.create(
+            module=lesson.module, title='New', content='', order=5
+        ).progress_slot, 6)
+
+    def test_toggle_sets_and_clears_bits(self):
+        self.assertTrue(self.toggle(self.lessons[1]))
+        self.assertTrue(self.toggle(self.lessons[4]))
+        record = self.record()
+        self.assertEqual(record.completed_count, 2)
+        self.assertEqual(load_bits(record.completed_bits)[:6].to01(), '010010')
+
+        self.assertFalse(self.toggle(self.lessons[1]))
+        self.assertEqual(self.record().completed_count, 1)
+
+    def test_progress_reads_bitset(self):
+        self.toggle(self.lessons[2])
+        self.client.post('/api/v1/progress/', {
+            'courseId': self.course.id, 'lessonId': self.lessons[5].id, 'completed': 'False'
+        })
+        self.client.post('/api/v1/progress/', {
+            'courseId': self.course.id, 'lessonId': self.lessons[3].id
+        })
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(f'/api/v1/courses/{self.course.id}/progress/')
+        self.assertEqual(response.data['completed_count'], 2)
+        rows = response.data['progress']
+        self.assertEqual(
+            [(row['lesson']['id'], row['completed']) for row in rows],
+            [(self.lessons[2].id, True), (self.lessons[3].id, True), (self.lessons[5].id, False)],
+        )
+        self.assertEqual(rows[0]['module'], self.lessons[2].module.title)
+        self.assertEqual(set(rows[0]), {'id', 'course', 'completed', 'completed_at', 'lesson', 'module'})
+        self.assertIsNotNone(rows[0]['completed_at'])
+        self.assertLessEqual(len(ctx.captured_queries), 3)
+
+        listed = self.client.get('/api/v1/progress/').data['results'][str(self.course.id)]
+        self.assertEqual(len(listed), 3)
+        completed_at = UserProgress.objects.get(lesson=self.lessons[2]).completed_at
+        self.assertIn({'lesson': {'id': self.lessons[2].id}, 'completed': True,
+                       'updated_at': completed_at.isoformat().replace('+00:00', 'Z')}, listed)
+
+    def test_sync_and_deletes_update_bits(self):
+        self.client.post('/api/v1/progress/sync/', {
+            'courseId': self.course.id,
+            'items': [{'lessonId': lesson.id} for lesson in self.lessons[:3]],
+        }, format='json')
+        self.assertEqual(self.record().completed_count, 3)
+
+        self.lessons[0].delete()
+        self.assertEqual(self.record().completed_count, 2)
+
+    def test_unsetting_without_record_creates_nothing(self):
+        CourseProgress.objects.all().delete()
+        self.client.post('/api/v1/progress/', {
+            'courseId': self.course.id, 'lessonId': self.lessons[0].id, 'completed': False
+        })
+        self.assertFalse(CourseProgress.objects.exists())
+
+    def test_benchmark_runs_and_rolls_back(self):
+        out = StringIO()
+        call_command('benchmark_progress_storage', learners=5, lessons=10, reads=3, stdout=out)
+        self.assertIn('bitset', out.getvalue())
+        self.assertFalse(Course.objects.filter(title='Progress benchmark').exists())
+
+
+class ToggleProgressTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = UserAccount.objects.create_user('learner@example.com', 'Learner', 'pass')
+        self.category = Category.objects.create(name='Programming', slug='programming')
+        self.course = make_course(0, self.category, modules=1, lessons=2)
+        self.lesson = Lesson.objects.filter(module__course=self.course).first()
+        self.foreign_lesson = Lesson.objects.get(
+            module__course=make_course(1, self.category, modules=1, lessons=1)
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def toggle(self, lesson, course=None):
+        return self.client.post(
+            f'/api/v1/courses/{(course or self.course).id}/toggle_lesson_progress/',
+            {'lesson_id': lesson.id},
+        )
+
+    def test_toggle_is_one_upsert(self):
+        self.toggle(self.lesson)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.toggle(self.lesson)
+        self.assertFalse(response.data['completed'])
+        self.assertEqual(response.data['module_id'], self.lesson.module_id)
+        writes = [q['sql'] for q in ctx.captured_queries if 'userprogress' in q['sql']]
+        self.assertEqual(len(writes), 1)
+        self.assertIn('ON CONFLICT', writes[0])
+
+        row = UserProgress.objects.get(user=self.user, lesson=self.lesson)
+        self.assertEqual((row.id, row.completed, row.completed_at), (response.data['id'], False, None))
+        self.assertTrue(self.toggle(self.lesson).data['completed'])
+
+    def test_lesson_outside_course_is_404(self):
+        self.assertEqual(self.toggle(self.foreign_lesson).status_code, 404)
+        self.assertEqual(self.toggle(self.lesson, course=Course(id=999)).status_code, 404)
+        self.assertFalse(UserProgress.objects.exists())
+
+
+@skipUnless(connection.vendor == 'postgresql', 'needs a database that allows concurrent writers')
+class ToggleProgressConcurrencyTests(TransactionTestCase):
+    threads = 16
+
+    def setUp(self):
+        cache.clear()
+        self.user = UserAccount.objects.create_user('learner@example.com', 'Learner', 'pass')
+        self.course = make_course(0, Category.objects.create(name='Programming', slug='programming'))
+        self.lesson = Lesson.objects.filter(module__course=self.course).first()
+
+    def test_concurrent_toggles_are_not_lost(self):
+        barrier = threading.Barrier(self.threads)
+        statuses = []
+
+        def click():
+            client = APIClient()
+            client.force_authenticate(self.user)
+            barrier.wait()
+            try:
+                statuses.append(client.post(
+                    f'/api/v1/courses/{self.course.id}/toggle_lesson_progress/',
+                    {'lesson_id': self.lesson.id},
+                ).status_code)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=click) for _ in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(statuses, [200] * self.threads)
+        row = UserProgress.objects.get(user=self.user, lesson=self.lesson)
+        # An even number of flips from "no row" ends up not completed.
+        self.assertFalse(row.completed)
+        record = CourseProgress.objects.get(user=self.user, course=self.course)
+        self.assertEqual(record.completed_count, 0)
+
+
+@override_settings(PROGRESS_WRITE_BUFFER=True, PROGRESS_BUFFER_MAX_ITEMS=3,
+                   PROGRESS_BUFFER_MAX_DELAY=60)
+class ProgressWriteBufferTests(TestCase):
+    def setUp(self):
+        # The buffer needs a cache shared between processes.
+        shared = tempfile.TemporaryDirectory()
+        self.addCleanup(shared.cleanup)
+        self.enterContext(override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': shared.name,
+        }}))
+        self.user = UserAccount.objects.create_user('learner@example.com', 'Learner', 'pass')
+        self.course = make_course(0, Category.objects.create(name='Programming', slug='programming'))
+        self.lessons = list(Lesson.objects.filter(module__course=self.course).order_by('id'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, lesson, completed=True):
+        response = self.client.post('/api/v1/progress/', {
+            'courseId': self.course.id, 'lessonId': lesson.id, 'completed': completed
+        }, format='json')
+        self.assertIn(response.status_code, (200, 201, 202))
+        return response
+
+    def test_burst_is_collapsed_per_lesson(self):
+        for completed in (True, False, True, False):
+            self.assertEqual(self.post(self.lessons[0], completed).status_code, 202)
+        self.post(self.lessons[1])
+        self.assertFalse(UserProgress.objects.exists())
+        call_command('flush_progress_buffer', stdout=StringIO())
+        self.assertEqual(
+            dict(UserProgress.objects.values_list('lesson_id', 'completed')),
+            {self.lessons[0].id: False, self.lessons[1].id: True},
+        )
+        self.assertEqual(CourseProgress.objects.get(user=self.user).completed_count, 1)
+
+    def test_reads_see_own_buffered_writes(self):
+        self.post(self.lessons[2])
+        response = self.client.get(f'/api/v1/courses/{self.course.id}/progress/')
+        self.assertEqual([row['lesson']['id'] for row in response.data['progress']],
+                         [self.lessons[2].id])
+        # Toggling works on the flushed state too.
+        response = self.client.post(
+            f'/api/v1/courses/{self.course.id}/toggle_lesson_progress/',
+            {'lesson_id': self.lessons[2].id},
+        )
+        self.assertFalse(response.data['completed'])
+
+    def test_item_bound_forces_a_flush(self):
+        for lesson in self.lessons[:3]:
+            self.post(lesson)
+        self.assertEqual(UserProgress.objects.filter(completed=True).count(), 3)
+
+        admin = UserAccount.objects.create_superuser('admin@example.com', 'Admin', 'pass')
+        self.client.force_authenticate(admin)
+        stats = self.client.get('/api/v1/progress/buffer/').data
+        self.assertEqual((stats['depth'], stats['flushes'], stats['last_flush_rows']), (0, 1, 3))
+        self.assertIn('last_flush_seconds', stats)
+
+    @override_settings(PROGRESS_BUFFER_MAX_DELAY=0)
+    def test_delay_bound_forces_a_flush(self):
+        self.post(self.lessons[0])
+        self.assertTrue(UserProgress.objects.get(lesson=self.lessons[0]).completed)
+
+    def test_overdue_buffer_is_flushed_by_any_request(self):
+        self.post(self.lessons[0])
+        with override_settings(PROGRESS_BUFFER_MAX_DELAY=0):
+            APIClient().get('/api/v1/courses/')
+        self.assertTrue(UserProgress.objects.get(lesson=self.lessons[0]).completed)
+
+    def test_busy_user_lock_writes_through(self):
+        with progress_user_lock(self.user.pk):
+            self.assertEqual(self.post(self.lessons[0]).status_code, 201)
+        self.assertTrue(UserProgress.objects.get(lesson=self.lessons[0]).completed)
+        self.assertEqual(pending_for(self.user.pk), {})
+
+    def test_process_local_cache_keeps_the_buffer_off(self):
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }}), mock.patch('courses.progress_buffer._warned_local_cache', False), \
+                self.assertLogs('courses.progress_buffer', 'WARNING'):
+            self.assertEqual(self.post(self.lessons[0]).status_code, 201)
+        self.assertTrue(UserProgress.objects.get(lesson=self.lessons[0]).completed)
+
+    def test_stats_are_staff_only(self):
+        self.assertEqual(self.client.get('/api/v1/progress/buffer/').status_code, 403)
+
+
+class CourseOutlineTests(TestCase):
+    def setUp(self):
+        self.course = make_course(0, Category.objects.create(name='Programming', slug='programming'))
+        self.client = APIClient()
+
+    def outline(self):
+        return self.client.get(f'/api/v1/courses/{self.course.id}/outline/')
+
+    def test_outline_is_stored_and_served_as_is(self):
+        response = self.outline()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        stored = CourseOutline.objects.get(course=self.course)
+        self.assertEqual(response.content, bytes(stored.document))
+        self.assertEqual(response.json()['lesson_count'], 6)
+        self.assertEqual(stored.slots, list(range(6)))
+
+        with CaptureQueriesContext(connection) as ctx:
+            again = self.outline()
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(self.client.get(
+            f'/api/v1/courses/{self.course.id}/outline/', HTTP_IF_NONE_MATCH=again['ETag']
+        ).status_code, 304)
+        self.assertEqual(self.client.get('/api/v1/courses/999/outline/').status_code, 404)
+
+    def test_content_changes_rebuild_the_outline(self):
+        self.outline()
+        lesson = Lesson.objects.filter(module__course=self.course).order_by('id').first()
+        with self.captureOnCommitCallbacks(execute=True):
+            lesson.title = 'Renamed'
+            lesson.youtube_url = 'https://www.youtube.com/watch?v=abc123'
+            lesson.save()
+        self.assertTrue(CourseOutline.objects.filter(course=self.course).exists())
+        first = self.outline().json()['modules'][0]['lessons'][0]
+        self.assertEqual(first['title'], 'Renamed')
+        self.assertEqual(first['video'], 'https://www.youtube.com/embed/abc123')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Module.objects.filter(course=self.course).first().delete()
+        self.assertEqual(self.outline().json()['lesson_count'], 3)
+
+        CourseOutline.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_course_outlines', stdout=out)
+        self.assertIn('1 courses', out.getvalue())
+        self.assertTrue(CourseOutline.objects.filter(course=self.course).exists())
+
+
+class LessonContentTests(TestCase):
+    def setUp(self):
+        self.course = make_course(0, Category.objects.create(name='Programming', slug='programming'))
+        self.lesson = Lesson.objects.filter(module__course=self.course).order_by('id').first()
+
+    def test_youtube_urls_are_parsed(self):
+        cases = {
+            'https://www.youtube.com/watch?v=dQw4w9WgXcQ&list=PL1': ('dQw4w9WgXcQ', None),
+            'https://youtu.be/dQw4w9WgXcQ?si=tracking&t=42': ('dQw4w9WgXcQ', 42),
+            'https://www.youtube.com/shorts/dQw4w9WgXcQ': ('dQw4w9WgXcQ', None),
+            'https://www.youtube.com/embed/dQw4w9WgXcQ?start=90': ('dQw4w9WgXcQ', 90),
+            'https://m.youtube.com/watch?v=dQw4w9WgXcQ&t=1m30s': ('dQw4w9WgXcQ', 90),
+            'https://vimeo.com/123': (None, None),
+            'https://www.youtube.com/watch?v=<script>': (None, None),
+        }
+        for url, expected in cases.items():
+            self.assertEqual(parse_youtube_url(url), expected, url)
+
+    def test_derived_fields_are_stored_on_save(self):
+        self.lesson.youtube_url = 'https://youtu.be/dQw4w9WgXcQ?t=42'
+        self.lesson.content = '# Intro\n\nSome **bold** text<script>alert(1)</script>'
+        self.lesson.save()
+        self.lesson.refresh_from_db()
+        self.assertEqual(self.lesson.video_id, 'dQw4w9WgXcQ')
+        self.assertEqual(self.lesson.video, 'https://www.youtube.com/embed/dQw4w9WgXcQ?start=42')
+        self.assertIn('<h1>Intro</h1>', self.lesson.content_html)
+        self.assertIn('<strong>bold</strong>', self.lesson.content_html)
+        self.assertNotIn('<script>', self.lesson.content_html)
+
+        self.lesson.content = 'Changed'
+        self.lesson.save(update_fields=['content'])
+        self.lesson.refresh_from_db()
+        self.assertEqual(self.lesson.content_html, '<p>Changed</p>')
+        self.assertEqual(self.lesson.video_id, 'dQw4w9WgXcQ')
+
+        data = APIClient().get(f'/api/v1/lessons/{self.lesson.id}/').data
+        self.assertEqual(data['content_html'], '<p>Changed</p>')
+        self.assertEqual(data['video'], self.lesson.video_embed_url)
+
+    def test_resource_metadata_is_recorded(self):
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+            self.lesson.resources = SimpleUploadedFile(
+                'notes.pdf', b'%PDF-1.4 notes', content_type='application/pdf'
+            )
+            self.lesson.save()
+            self.lesson.refresh_from_db()
+            self.assertEqual(self.lesson.resource_size, 14)
+            self.assertEqual(self.lesson.resource_content_type, 'application/pdf')
+
+            self.lesson.resources = None
+            self.lesson.save()
+            self.assertIsNone(self.lesson.resource_size)
+            self.assertEqual(self.lesson.resource_content_type, '')
+
+    def test_backfill_command(self):
+        Lesson.objects.filter(pk=self.lesson.pk).update(
+            youtube_url='https://www.youtube.com/shorts/abc123', content_html='', video_id='',
+            resource_name='removed.pdf',
+        )
+        out = StringIO()
+        call_command('process_lessons', '--batch-size', '2', stdout=out)
+        self.assertIn('Processed 6 lessons in 1 courses', out.getvalue())
+        self.lesson.refresh_from_db()
+        self.assertEqual(self.lesson.video_id, 'abc123')
+        self.assertEqual(self.lesson.content_html, '<p>Body</p>')
+        self.assertEqual(self.lesson.resource_name, '')
+        outline = CourseOutline.objects.get(course=self.course)
+        self.assertIn(b'/embed/abc123', bytes(outline.document))
+
+
+@override_settings(THUMBNAIL_VARIANTS_IN_BACKGROUND=False, THUMBNAIL_WIDTHS=[160, 320, 640],
+                   CATALOG_CACHE_TIMEOUT=0)
+class ThumbnailVariantTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.category = Category.objects.create(name='Programming', slug='programming')
+
+    def upload(self, color='red'):
+        out = BytesIO()
+        Image.new('RGBA', (500, 300), color).save(out, 'PNG')
+        return SimpleUploadedFile('cover.png', out.getvalue(), content_type='image/png')
+
+    def test_variants_are_generated_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            course = Course.objects.create(title='Course', description='', category=self.category,
+                                           thumbnail=self.upload())
+        course.refresh_from_db()
+        variants = course.thumbnail_variants
+        self.assertEqual(variants['source'], course.thumbnail.name)
+        self.assertEqual(list(variants['webp']), ['160', '320'])
+        with course.thumbnail.storage.open(variants['webp']['320']) as f:
+            image = Image.open(f)
+            self.assertEqual((image.format, image.size), ('WEBP', (320, 192)))
+        with course.thumbnail.storage.open(variants['jpeg']['160']) as f:
+            self.assertEqual(Image.open(f).format, 'JPEG')
+
+        srcset = self.client.get('/api/v1/courses/').json()['results'][0]['thumbnail_srcset']
+        self.assertRegex(srcset['webp'], r'^http://testserver/media/course_thumbnails/variants/'
+                                         r'[0-9a-f]{64}\.webp 160w, \S+[0-9a-f]{64}\.webp 320w$')
+
+        # The same picture uploaded again reuses the files.
+        with self.captureOnCommitCallbacks(execute=True):
+            other = Course.objects.create(title='Other', description='', category=self.category,
+                                          thumbnail=self.upload())
+        other.refresh_from_db()
+        self.assertEqual(other.thumbnail_variants['webp'], variants['webp'])
+
+    def test_stale_variants_are_not_served_and_get_regenerated(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            course = Course.objects.create(title='Course', description='', category=self.category,
+                                           thumbnail=self.upload())
+        course.refresh_from_db()
+        first = course.thumbnail_variants
+        course.thumbnail = self.upload('blue')
+        with self.captureOnCommitCallbacks(execute=False):
+            course.save()
+        self.assertIsNone(CourseSummarySerializer(course).data['thumbnail_srcset'])
+
+        out = StringIO()
+        call_command('generate_thumbnails', stdout=out)
+        self.assertIn('for 1 courses', out.getvalue())
+        course.refresh_from_db()
+        self.assertNotEqual(course.thumbnail_variants['webp'], first['webp'])
+
+
+class ResourceDownloadTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.course = make_course(0, Category.objects.create(name='Programming', slug='programming'))
+        self.lesson = Lesson.objects.filter(module__course=self.course).order_by('id').first()
+        self.body = bytes(range(256)) * 4
+        self.lesson.resources = SimpleUploadedFile('slides.pdf', self.body,
+                                                   content_type='application/pdf')
+        self.lesson.save()
+        self.user = UserAccount.objects.create_user('learner@example.com', 'Learner', 'pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/v1/lessons/{self.lesson.id}/resource/'
+
+    def test_enrollment_is_required(self):
+        self.assertEqual(APIClient().get(self.url).status_code, 401)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        Enrollment.objects.create(user=self.user, course=self.course)
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.body)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response['Content-Length'], '1024')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Disposition'],
+                         "attachment; filename=\"slides.pdf\"; filename*=UTF-8''slides.pdf")
+        self.assertEqual(Lesson.objects.get(pk=self.lesson.pk).resource_name, 'slides.pdf')
+
+        data = self.client.get(f'/api/v1/lessons/{self.lesson.id}/').data
+        self.assertEqual(data['resources'], f'http://testserver{self.url}')
+        self.assertEqual(self.client.get(
+            f'/media/{self.lesson.resources.name}'
+        ).status_code, 404)
+
+    def test_range_and_conditional_requests(self):
+        Enrollment.objects.create(user=self.user, course=self.course)
+        partial = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(b''.join(partial.streaming_content), self.body[10:20])
+        self.assertEqual(partial['Content-Range'], 'bytes 10-19/1024')
+        self.assertEqual(partial['Content-Length'], '10')
+
+        tail = self.client.get(self.url, HTTP_RANGE='bytes=-4')
+        self.assertEqual(b''.join(tail.streaming_content), self.body[-4:])
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=2000-').status_code, 416)
+
+        etag = partial['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(
+            self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag
+        ).status_code, 206)
+        self.assertEqual(self.client.get(
+            self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"'
+        ).status_code, 200)
+
+    @override_settings(RESOURCE_SENDFILE='x-accel-redirect')
+    def test_transfer_can_be_handed_to_the_proxy(self):
+        Enrollment.objects.create(user=self.user, course=self.course)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'],
+                         f'/protected-media/{self.lesson.resources.name}')
+        self.assertEqual(response.content, b'')
+
+    def test_content_disposition_has_an_ascii_fallback(self):
+        self.assertEqual(
+            content_disposition('Résumé "final".pdf'),
+            'attachment; filename="Resume _final_.pdf"; '
+            "filename*=UTF-8''R%C3%A9sum%C3%A9%20%22final%22.pdf",
+        )
+        self.assertEqual(
+            content_disposition('講義.pdf'),
+            "attachment; filename=\"download.pdf\"; filename*=UTF-8''%E8%AC%9B%E7%BE%A9.pdf",
+        )
+
+
+class CourseBundleTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media = media.name
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.course = make_course(0, Category.objects.create(name='Programming', slug='programming'))
+        self.lesson = Lesson.objects.filter(module__course=self.course).order_by('id').first()
+        self.lesson.content = '# Intro'
+        self.lesson.resources = SimpleUploadedFile('slides.pdf', b'%PDF-1.4 slides' * 100)
+        self.lesson.save()
+        self.user = UserAccount.objects.create_user('learner@example.com', 'Learner', 'pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/v1/courses/{self.course.id}/bundle/'
+
+    def bundles(self):
+        return sorted(os.listdir(os.path.join(self.media, 'bundles')))
+
+    def test_first_download_streams_and_stores_the_bundle(self):
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        Enrollment.objects.create(user=self.user, course=self.course)
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertNotIn('Content-Length', response)
+        body = b''.join(response.streaming_content)
+        with zipfile.ZipFile(BytesIO(body)) as archive:
+            self.assertIsNone(archive.testzip())
+            names = archive.namelist()
+            self.assertEqual(names[0], 'outline.json')
+            self.assertEqual(len([name for name in names if name.startswith('lessons/')]), 6)
+            self.assertIn('<h1>Intro</h1>', archive.read(f'lessons/{self.lesson.id}.html').decode())
+            resource = f'resources/{self.lesson.id}/slides.pdf'
+            self.assertEqual(archive.read(resource), b'%PDF-1.4 slides' * 100)
+
+        stored = self.bundles()
+        self.assertEqual(len(stored), 1)
+        with open(os.path.join(self.media, 'bundles', stored[0]), 'rb') as file:
+            self.assertEqual(file.read(), body)
+
+        # Unchanged content is served from the stored file, ranges included;
+        # an enrollment or a rating alone does not make a new bundle, and
+        # finding the stored file reads no lesson.
+        other = UserAccount.objects.create_user('other@example.com', 'Other', 'pass')
+        Enrollment.objects.create(user=other, course=self.course)
+        ReviewRating.objects.create(user=other, course=self.course, rating=4)
+        with CaptureQueriesContext(connection) as ctx:
+            again = self.client.get(self.url)
+        self.assertFalse(any('courses_lesson' in q['sql'] for q in ctx.captured_queries))
+        self.assertEqual(again['Content-Length'], str(len(body)))
+        self.assertEqual(b''.join(again.streaming_content), body)
+        partial = self.client.get(self.url, HTTP_RANGE='bytes=0-9')
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(b''.join(partial.streaming_content), body[:10])
+        self.assertEqual(self.bundles(), stored)
+
+    def test_changed_content_replaces_the_bundle(self):
+        Enrollment.objects.create(user=self.user, course=self.course)
+        b''.join(self.client.get(self.url).streaming_content)
+        first = self.bundles()
+
+        self.lesson.content = '# Introduction'
+        self.lesson.save()
+        # A resumed download has no finished file to take the range from
+        # and starts over; nothing is built for it.
+        partial = self.client.get(self.url, HTTP_RANGE='bytes=0-3')
+        self.assertEqual(partial.status_code, 416)
+        self.assertEqual(partial['Content-Range'], 'bytes */*')
+        self.assertEqual(self.bundles(), first)
+
+        body = b''.join(self.client.get(self.url).streaming_content)
+        self.assertEqual(body[:4], b'PK\x03\x04')
+        self.assertEqual(len(self.bundles()), 1)
+        self.assertNotEqual(self.bundles(), first)
+        self.assertEqual(self.client.get(f'/media/bundles/{self.bundles()[0]}').status_code, 404)
+
+
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.course = make_course(0, Category.objects.create(name='Programming', slug='programming'))
+        self.lessons = list(Lesson.objects.filter(module__course=self.course).order_by('id'))
+
+    def attach(self, lesson, body=b'%PDF-1.4 shared handout'):
+        lesson.resources = SimpleUploadedFile('Handout Final.PDF', body)
+        lesson.save()
+        return lesson.resources.name
+
+    def test_identical_uploads_share_one_blob(self):
+        first = self.attach(self.lessons[0])
+        second = self.attach(self.lessons[1])
+        self.assertEqual(first, second)
+        self.assertRegex(first, r'^lessons/resources/[0-9a-f]{64}\.pdf$')
+        blob = StoredBlob.objects.get()
+        self.assertEqual((blob.name, blob.references, blob.size), (first, 2, 23))
+        self.assertEqual(len(os.listdir(os.path.dirname(self.lessons[0].resources.path))), 1)
+
+        other = self.attach(self.lessons[2], b'another file')
+        self.assertNotEqual(other, first)
+        self.assertEqual(StoredBlob.objects.get(name=other).references, 1)
+
+    def test_references_follow_saves_and_deletes(self):
+        name = self.attach(self.lessons[0])
+        self.attach(self.lessons[1])
+        self.lessons[0].resources.delete()  # Still used by the other lesson.
+        self.assertTrue(os.path.exists(self.lessons[1].resources.path))
+        self.assertEqual(StoredBlob.objects.get(name=name).references, 1)
+
+        self.lessons[1].delete()
+        self.assertEqual(StoredBlob.objects.get(name=name).references, 0)
+
+    def test_collect_blobs_deletes_unreferenced_blobs(self):
+        kept = self.attach(self.lessons[0])
+        dropped = self.attach(self.lessons[1], b'old slides')
+        path = self.lessons[1].resources.path
+        self.lessons[1].resources = None
+        self.lessons[1].save()
+        # A drifted count is repaired before anything is deleted.
+        StoredBlob.objects.filter(name=kept).update(references=0)
+
+        out = StringIO()
+        call_command('collect_blobs', '--grace-hours', '0', stdout=out)
+        self.assertIn('Corrected 1 reference counts; deleted 1 blobs', out.getvalue())
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(StoredBlob.objects.filter(name=dropped).exists())
+        self.assertEqual(StoredBlob.objects.get(name=kept).references, 1)
+
+        call_command('collect_blobs', stdout=StringIO())
+        self.assertTrue(os.path.exists(self.lessons[0].resources.path))
+
+    def test_storing_an_old_blob_again_protects_it(self):
+        name = self.attach(self.lessons[0])
+        self.lessons[0].resources = None
+        self.lessons[0].save()
+        old = timezone.now() - datetime.timedelta(days=2)
+        StoredBlob.objects.filter(name=name).update(created_at=old)
+
+        self.assertEqual(self.attach(self.lessons[1]), name)
+        self.assertGreater(StoredBlob.objects.get(name=name).created_at, old)
+        call_command('collect_blobs', stdout=StringIO())
+        self.assertTrue(os.path.exists(self.lessons[1].resources.path))
+
+        # Stored again after collect_blobs picked its candidates.
+        self.lessons[1].resources = None
+        self.lessons[1].save()
+        StoredBlob.objects.filter(name=name).update(created_at=old)
+
+        def upload_meanwhile(names):
+            self.attach(self.lessons[2])
+            return referenced_names(names)
+
+        with mock.patch('courses.blobs.referenced_names', upload_meanwhile):
+            self.assertEqual(collect_blobs(), (0, 0))
+        self.assertTrue(os.path.exists(self.lessons[2].resources.path))
+        self.assertEqual(StoredBlob.objects.get(name=name).references, 1)
+
+
+@override_settings(UPLOAD_CHUNK_SIZE=100)
+class ResumableUploadTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.course = make_course(0, Category.objects.create(name='Programming', slug='programming'))
+        self.lesson = Lesson.objects.filter(module__course=self.course).order_by('id').first()
+        self.user = UserAccount.objects.create_superuser('author@example.com', 'Author', 'pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.body = bytes(range(256)) + b'tail'
+
+    def open(self, **extra):
+        response = self.client.post('/api/v1/uploads/', {
+            'lesson': self.lesson.id, 'filename': 'big deck.pdf', 'size': len(self.body),
+            'checksum': hashlib.sha256(self.body).hexdigest(), **extra,
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data
+
+    def put(self, upload, number, data=None, checksum=None):
+        data = self.body[number * 100:(number + 1) * 100] if data is None else data
+        return self.client.put(
+            f"/api/v1/uploads/{upload['id']}/chunks/{number}/", data,
+            content_type='application/octet-stream',
+            HTTP_X_CHUNK_SHA256=checksum or hashlib.sha256(data).hexdigest(),
+        )
+
+    def test_chunks_in_any_order_then_finalize(self):
+        upload = self.open()
+        self.assertEqual((upload['chunk_size'], upload['chunk_count']), (100, 3))
+        self.assertEqual(self.put(upload, 2).data['received'], [2])
+        # A bad re-send of a received chunk leaves the good bytes alone.
+        self.assertEqual(self.put(upload, 2, data=b'x' * 60, checksum='0' * 64).status_code, 400)
+        self.assertEqual(self.put(upload, 0, checksum='0' * 64).status_code, 400)
+        self.assertEqual(self.put(upload, 1, data=b'short').status_code, 400)
+        self.put(upload, 0)
+
+        resumed = self.client.get(f"/api/v1/uploads/{upload['id']}/").data
+        self.assertEqual(resumed['received'], [0, 2])
+        self.assertEqual(self.client.post(
+            f"/api/v1/uploads/{upload['id']}/finalize/"
+        ).status_code, 409)
+
+        self.put(upload, 1)
+        response = self.client.post(f"/api/v1/uploads/{upload['id']}/finalize/")
+        self.assertEqual(response.status_code, 200)
+        self.lesson.refresh_from_db()
+        with self.lesson.resources.open('rb') as f:
+            self.assertEqual(f.read(), self.body)
+        self.assertEqual(self.lesson.resource_size, len(self.body))
+        self.assertEqual(self.lesson.resource_content_type, 'application/pdf')
+        self.assertEqual(self.lesson.resource_name, 'big deck.pdf')
+        self.assertEqual(os.listdir(blob_storage.path(TEMP_DIR)), [])
+        self.assertFalse(ResourceUpload.objects.exists())
+        self.assertEqual(StoredBlob.objects.get(name=self.lesson.resources.name).references, 1)
+
+    def test_learners_cannot_upload(self):
+        learner = APIClient()
+        learner.force_authenticate(UserAccount.objects.create_user('l@example.com', 'L', 'pass'))
+        response = learner.post('/api/v1/uploads/', {
+            'lesson': self.lesson.id, 'filename': 'x.pdf', 'size': 10,
+        }, format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(ResourceUpload.objects.exists())
+
+    def test_whole_file_checksum_and_ownership(self):
+        upload = self.open(checksum='f' * 64)
+        for number in range(3):
+            self.put(upload, number)
+        response = self.client.post(f"/api/v1/uploads/{upload['id']}/finalize/")
+        self.assertEqual(response.status_code, 400)
+        self.lesson.refresh_from_db()
+        self.assertFalse(self.lesson.resources)
+
+        stranger = APIClient()
+        stranger.force_authenticate(UserAccount.objects.create_superuser('x@example.com', 'X', 'pass'))
+        self.assertEqual(stranger.get(f"/api/v1/uploads/{upload['id']}/").status_code, 404)
+        self.assertEqual(self.client.delete(f"/api/v1/uploads/{upload['id']}/").status_code, 204)
+        self.assertFalse(ResourceUpload.objects.exists())
+
+
+class CourseTransferTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.course = make_course(0, Category.objects.create(name='Programming', slug='programming'))
+        self.lesson = Lesson.objects.filter(module__course=self.course).order_by('id').last()
+        self.lesson.content = '**Loops**'
+        self.lesson.youtube_url = 'https://youtu.be/dQw4w9WgXcQ'
+        self.lesson.resources = SimpleUploadedFile('loops.pdf', b'%PDF-1.4 loops')
+        self.lesson.save()
+        quiz = Assessment.objects.create(title='Loops quiz', assessment_type='quiz', duration=5,
+                                         lesson=self.lesson, module=self.lesson.module)
+        Assessment.objects.create(title='Final', assessment_type='final-exam', duration=60,
+                                  course=self.course)
+        question = Question.objects.create(assessment=quiz, text='for or while?',
+                                           question_type='MCQ', order=1)
+        Choice.objects.create(question=question, text='for', is_correct=True)
+        Choice.objects.create(question=question, text='while')
+        self.admin = UserAccount.objects.create_user('admin@example.com', 'Admin', 'pass')
+        self.admin.is_staff = True
+        self.admin.save()
+
+    def large_document(self, lessons):
+        return {'format': 'course-tree', 'version': 1, 'course': {
+            'title': 'Large', 'description': 'Many lessons',
+            'modules': [{'key': 'm', 'title': 'Only module', 'lessons': [
+                {'key': f'l{n}', 'title': f'Lesson {n}', 'content': f'Step *{n}*'}
+                for n in range(lessons)
+            ]}],
+            'assessments': [{'lesson': 'l0', 'title': 'Quiz', 'duration': 5, 'questions': [
+                {'text': 'Ready?', 'question_type': 'TF', 'choices': [{'text': 'Yes'}]}
+            ]}],
+        }}
+
+    def test_round_trip(self):
+        document = export_course(self.course.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            copy, counts = import_course(json.loads(json.dumps(document)))
+        self.assertEqual(counts, {'modules': 2, 'lessons': 6, 'assessments': 2,
+                                  'questions': 1, 'choices': 2})
+        self.assertEqual(copy.lesson_count, 6)
+        self.assertEqual(copy.category_id, self.course.category_id)
+
+        lessons = list(Lesson.objects.filter(module__course=copy).order_by('id'))
+        self.assertEqual(sorted(lesson.progress_slot for lesson in lessons), list(range(6)))
+        self.assertEqual(Course.objects.get(pk=copy.pk).next_progress_slot, 6)
+        lesson = lessons[-1]
+        self.assertEqual(lesson.content_html, '<p><strong>Loops</strong></p>')
+        self.assertEqual(lesson.video_id, 'dQw4w9WgXcQ')
+        self.assertEqual(lesson.resources.name, self.lesson.resources.name)
+        self.assertEqual((lesson.resource_size, lesson.resource_name), (14, 'loops.pdf'))
+        self.assertEqual(StoredBlob.objects.get(name=lesson.resources.name).references, 2)
+
+        quiz = Assessment.objects.get(lesson__module__course=copy)
+        self.assertEqual((quiz.lesson_id, quiz.module_id, quiz.course_id),
+                         (lesson.id, lesson.module_id, None))
+        self.assertEqual(Assessment.objects.get(course=copy).title, 'Final')
+        self.assertEqual(
+            list(Choice.objects.filter(question__assessment=quiz).values_list('text', 'is_correct')),
+            [('for', True), ('while', False)],
+        )
+        self.assertTrue(CourseOutline.objects.filter(course=copy).exists())
+
+        # Apart from the keys, the copy exports exactly like the original.
+        def without_keys(value):
+            if isinstance(value, dict):
+                return {key: without_keys(item) for key, item in value.items()
+                        if key not in ('key', 'module', 'lesson')}
+            if isinstance(value, list):
+                return [without_keys(item) for item in value]
+            return value
+        self.assertEqual(without_keys(export_course(copy.pk)), without_keys(document))
+
+    def test_import_queries_do_not_grow_with_lessons(self):
+        with CaptureQueriesContext(connection) as small:
+            import_course(self.large_document(2))
+        with CaptureQueriesContext(connection) as large:
+            course, counts = import_course(self.large_document(300))
+        # SQLite splits inserts by its variable limit; PostgreSQL does not.
+        self.assertLessEqual(len(large), len(small) + (5 if connection.vendor == 'sqlite' else 0))
+        self.assertEqual(counts['lessons'], 300)
+        self.assertEqual(Lesson.objects.filter(module__course=course).count(), 300)
+        self.assertEqual(Lesson.objects.get(module__course=course, order=7).content_html,
+                         '<p>Step <em>7</em></p>')
+
+    def test_api_export_and_ndjson_import(self):
+        client = APIClient()
+        client.force_authenticate(UserAccount.objects.create_user('u@example.com', 'User', 'pass'))
+        self.assertEqual(client.get(f'/api/v1/courses/{self.course.id}/export/').status_code, 403)
+
+        client.force_authenticate(self.admin)
+        exported = client.get(f'/api/v1/courses/{self.course.id}/export/?as=ndjson')
+        self.assertEqual(exported.status_code, 200)
+        self.assertEqual(exported['Content-Type'], 'application/x-ndjson')
+        records = [json.loads(line) for line in exported.content.decode().splitlines()]
+        self.assertEqual([record['type'] for record in records[:3]], ['course', 'module', 'lesson'])
+        self.assertEqual(len(records), 1 + 2 + 6 + 2 + 1 + 2)
+
+        response = client.post('/api/v1/courses/import/', exported.content,
+                               content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['lessons'], 6)
+        self.assertEqual(Course.objects.get(pk=response.data['id']).title, 'Course 0')
+
+    def test_commands(self):
+        path = os.path.join(settings.MEDIA_ROOT, 'course.ndjson')
+        call_command('export_course', self.course.id, format='ndjson', output=path, stdout=StringIO())
+        out = StringIO()
+        call_command('import_course', path, stdout=out)
+        self.assertIn('with 2 modules, 6 lessons and 2 assessments', out.getvalue())
+        self.assertEqual(Course.objects.filter(title='Course 0').count(), 2)
+
+    def test_invalid_document_imports_nothing(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        document = self.large_document(3)
+        del document['course']['assessments'][0]['duration']
+        courses = Course.objects.count()
+        response = client.post('/api/v1/courses/import/', document, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('assessments[0]: duration', response.data['error'])
+        self.assertEqual(Course.objects.count(), courses)
+
+        response = client.post('/api/v1/courses/import/', b'{"type": "lesson", "module": 1}\n',
+                               content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 400)
+
+
+class CourseCloneTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.category = Category.objects.create(name='Programming', slug='programming')
+        self.course = make_course(0, self.category)
+        self.lesson = Lesson.objects.filter(module__course=self.course).order_by('id').last()
+        self.lesson.content = '**Loops**'
+        self.lesson.resources = SimpleUploadedFile('loops.pdf', b'%PDF-1.4 loops')
+        self.lesson.save()
+        quiz = Assessment.objects.create(title='Loops quiz', assessment_type='quiz', duration=5,
+                                         lesson=self.lesson)
+        Assessment.objects.create(title='Final', assessment_type='final-exam', duration=60,
+                                  course=self.course)
+        question = Question.objects.create(assessment=quiz, text='for or while?', question_type='MCQ')
+        Choice.objects.create(question=question, text='for', is_correct=True)
+        Choice.objects.create(question=question, text='while')
+        self.admin = UserAccount.objects.create_user('admin@example.com', 'Admin', 'pass')
+        self.admin.is_staff = self.admin.is_superuser = True
+        self.admin.save()
+
+    def test_clone_copies_the_tree_and_shares_files(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(f'/api/v1/courses/{self.course.id}/clone/',
+                                   {'title': 'Course 0, spring term'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        counts = {'modules': 2, 'lessons': 6, 'assessments': 2, 'questions': 1, 'choices': 2}
+        self.assertEqual({key: response.data[key] for key in counts}, counts)
+        copy = Course.objects.get(pk=response.data['id'])
+        self.assertEqual((copy.title, copy.lesson_count, copy.next_progress_slot),
+                         ('Course 0, spring term', 6, 6))
+
+        lesson = Lesson.objects.get(module__course=copy, title=self.lesson.title)
+        self.assertEqual(lesson.content_html, '<p><strong>Loops</strong></p>')
+        self.assertEqual(lesson.resources.name, self.lesson.resources.name)
+        self.assertEqual(StoredBlob.objects.get(name=lesson.resources.name).references, 2)
+        self.assertEqual(Assessment.objects.get(lesson=lesson).questions.get().choices.count(), 2)
+        self.assertTrue(CourseOutline.objects.filter(course=copy).exists())
+
+        original, cloned = export_course(self.course.id)['course'], export_course(copy.pk)['course']
+        for document in (original, cloned):
+            del document['title']
+            for module in document['modules']:
+                del module['key']
+                for item in module['lessons']:
+                    del item['key']
+            for assessment in document['assessments']:
+                del assessment['key'], assessment['module'], assessment['lesson']
+        self.assertEqual(cloned, original)
+
+    def test_queries_do_not_grow_with_rows(self):
+        large = make_course(1, self.category, modules=4, lessons=25)
+        with CaptureQueriesContext(connection) as small_queries:
+            clone_course(self.course.id, include_assessments=False)
+        with CaptureQueriesContext(connection) as large_queries:
+            course, counts = clone_course(large.id, include_assessments=False)
+        self.assertEqual(counts, {'modules': 4, 'lessons': 100})
+        self.assertLessEqual(len(large_queries),
+                             len(small_queries) + (2 if connection.vendor == 'sqlite' else 0))
+        self.assertFalse(Assessment.objects.filter(lesson__module__course=course).exists())
+
+    def test_admin_action(self):
+        self.client.force_login(self.admin)
+        response = self.client.post('/admin/courses/course/', {
+            'action': 'clone_without_assessments', '_selected_action': [self.course.id],
+        }, follow=True)
+        self.assertContains(response, 'Created &quot;Course 0 (copy)&quot; with 2 modules and 6 lessons.')
+        copy = Course.objects.get(title='Course 0 (copy)')
+        self.assertFalse(Assessment.objects.filter(course=copy).exists())
+
+
+class CoursePlayerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = UserAccount.objects.create_user('learner@example.com', 'Learner', 'pass')
+        category = Category.objects.create(name='Programming', slug='programming')
+        # Outlines are stored after commit, as in production.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course = make_course(0, category, modules=4, lessons=10)
+            self.other = make_course(1, category)
+        self.lessons = list(Lesson.objects.filter(module__course=self.course)
+                            .order_by('module__order', 'order'))
+        Enrollment.objects.create(user=self.user, course=self.course)
+        UserProgress.objects.create(user=self.user, course=self.course,
+                                    module=self.lessons[0].module, lesson=self.lessons[0],
+                                    completed=True)
+        quiz = Assessment.objects.create(title='Check', assessment_type='quiz',
+                                         lesson=self.lessons[1], duration=5)
+        question = Question.objects.create(assessment=quiz, text='2 + 2?', question_type='MCQ')
+        Choice.objects.create(question=question, text='4', is_correct=True)
+        Choice.objects.create(question=question, text='5')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_player_stays_within_query_budget(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(f'/api/v1/courses/{self.course.id}/player/')
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(ctx.captured_queries), 5)
+
+        data = response.data
+        self.assertTrue(data['course']['is_enrolled'])
+        self.assertFalse(data['has_rated'])
+        self.assertEqual(data['completed_lessons'], [self.lessons[0].id])
+        self.assertEqual(len(data['modules']), 4)
+        self.assertEqual(sum(len(module['lessons']) for module in data['modules']), 40)
+        self.assertNotIn('content', data['modules'][0]['lessons'][0])
+        # The first lesson not yet completed is opened by default.
+        self.assertEqual(data['lesson']['id'], self.lessons[1].id)
+        self.assertEqual(data['lesson']['content'], 'Body')
+        self.assertEqual(data['quizzes'][0]['questions'][0]['choices'],
+                         [{'id': choice.id, 'text': choice.text}
+                          for choice in Choice.objects.order_by('id')])
+
+    def test_player_opens_the_requested_lesson(self):
+        ReviewRating.objects.create(user=self.user, course=self.course, rating=5)
+        response = self.client.get(
+            f'/api/v1/courses/{self.course.id}/player/?lesson={self.lessons[5].id}'
+        )
+        self.assertEqual(response.data['lesson']['id'], self.lessons[5].id)
+        self.assertEqual(response.data['quizzes'], [])
+        self.assertTrue(response.data['has_rated'])
+        self.assertEqual(response.data['rating'], 5)
+
+        foreign = Lesson.objects.filter(module__course=self.other).first()
+        self.assertEqual(self.client.get(
+            f'/api/v1/courses/{self.course.id}/player/?lesson={foreign.id}'
+        ).status_code, 404)
+        self.assertEqual(self.client.get('/api/v1/courses/999/player/').status_code, 404)
+
+    def test_player_requires_enrollment(self):
+        client = APIClient()
+        client.force_authenticate(UserAccount.objects.create_user('guest@example.com', 'Guest', 'pass'))
+        response = client.get(f'/api/v1/courses/{self.course.id}/player/?lesson={self.lessons[1].id}')
+        self.assertEqual(response.status_code, 403)
+        self.assertNotIn('lesson', response.data)
+        self.assertNotIn('quizzes', response.data)
+
+    def test_staff_and_active_flags_come_from_the_user_row(self):
+        staff = UserAccount.objects.create_superuser('staff@example.com', 'Staff', 'pass')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(staff).access_token}')
+        url = f'/api/v1/courses/{self.course.id}/player/'
+        self.assertEqual(client.get(url).status_code, 200)
+
+        UserAccount.objects.filter(pk=staff.pk).update(is_active=False)
+        self.assertEqual(client.get(url).status_code, 401)
+
+
+class LessonPositionTests(TestCase):
+    def setUp(self):
+        # Heartbeats are buffered in a cache shared between processes.
+        shared = tempfile.TemporaryDirectory()
+        self.addCleanup(shared.cleanup)
+        self.enterContext(override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': shared.name,
+        }}))
+        self.user = UserAccount.objects.create_user('learner@example.com', 'Learner', 'pass')
+        self.course = make_course(0, Category.objects.create(name='Programming', slug='programming'))
+        self.lessons = list(Lesson.objects.filter(module__course=self.course).order_by('id'))
+        Enrollment.objects.create(user=self.user, course=self.course)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def beat(self, lesson, position, duration=600):
+        return self.client.post(f'/api/v1/lessons/{lesson.id}/position/', {
+            'position': position, 'duration': duration
+        }, format='json')
+
+    def outline_positions(self):
+        outline = self.client.get(f'/api/v1/courses/{self.course.id}/')
+        return {
+            item['id']: item['resume_position']
+            for module in outline.data['modules'] for item in module['lessons']
+        }
+
+    def test_heartbeat_writes_nothing_to_the_database(self):
+        self.beat(self.lessons[0], 1)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.beat(self.lessons[0], 5)
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertFalse(LessonPosition.objects.exists())
+
+        self.assertEqual(self.beat(self.lessons[0], -1).status_code, 400)
+        self.assertEqual(self.client.post('/api/v1/lessons/999/position/', {
+            'position': 1
+        }, format='json').status_code, 404)
+
+    def test_positions_are_read_back_and_flushed(self):
+        self.beat(self.lessons[0], 30)
+        self.beat(self.lessons[0], 45.5)
+        self.beat(self.lessons[1], 9999, duration=120)
+
+        positions = self.outline_positions()
+        self.assertEqual(positions[self.lessons[0].id], 45.5)
+        self.assertEqual(positions[self.lessons[1].id], 120)
+        self.assertIsNone(positions[self.lessons[2].id])
+
+        # The first flush only marks the log; the next one writes it.
+        call_command('flush_lesson_positions', stdout=StringIO())
+        call_command('flush_lesson_positions', stdout=StringIO())
+        self.assertEqual(
+            dict(LessonPosition.objects.values_list('lesson_id', 'position')),
+            {self.lessons[0].id: 45.5, self.lessons[1].id: 120},
+        )
+        cache.clear()
+        self.assertEqual(self.outline_positions()[self.lessons[0].id], 45.5)
+
+    def test_log_grows_per_user_not_per_heartbeat(self):
+        for position in range(20):
+            self.beat(self.lessons[position % 2], position)
+        self.assertEqual(cache.get('position:seq'), 1)
+
+        call_command('flush_lesson_positions', stdout=StringIO())
+        call_command('flush_lesson_positions', stdout=StringIO())
+        self.assertEqual(LessonPosition.objects.count(), 2)
+        self.beat(self.lessons[0], 300)
+        self.assertEqual(cache.get('position:seq'), 2)
+
+    def test_process_local_cache_writes_through(self):
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }}):
+            self.assertEqual(self.beat(self.lessons[0], 42).status_code, 204)
+            self.assertEqual(self.outline_positions()[self.lessons[0].id], 42)
+        self.assertEqual(LessonPosition.objects.get(lesson=self.lessons[0]).position, 42)
+
+    def test_heartbeat_keeps_lesson_etag(self):
+        url = f'/api/v1/lessons/{self.lessons[0].id}/'
+        response = self.client.get(url)
+        self.assertNotIn('resume_position', response.data)
+        self.beat(self.lessons[0], 12)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_heartbeats_need_enrollment_and_an_active_account(self):
+        other = UserAccount.objects.create_user('other@example.com', 'Other', 'pass')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.beat(self.lessons[0], 5).status_code, 403)
+
+        self.client.force_authenticate(None)
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}'
+        )
+        self.assertEqual(self.beat(self.lessons[0], 5).status_code, 204)
+        UserAccount.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.beat(self.lessons[0], 6).status_code, 401)
+
+
+class LearningEventTests(TestCase):
+    def setUp(self):
+        self.user = UserAccount.objects.create_user('learner@example.com', 'Learner', 'pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_batch_is_one_insert(self):
+        long_ago = (timezone.now() - datetime.timedelta(days=30)).isoformat()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/v1/events/', {'events': [
+                {'type': 'lesson_opened', 'course': 1, 'lesson': 2},
+                {'type': 'video_watched', 'lesson': 2, 'data': {'seconds': 30}},
+                {'type': 'nap_taken'},
+                {'type': 'lesson_opened', 'at': long_ago},
+            ]}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['accepted'], 2)
+        self.assertEqual([item['index'] for item in response.data['rejected']], [2, 3])
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+        event = LearningEvent.objects.get(type='video_watched')
+        self.assertEqual((event.user_id, event.lesson_id, event.data), (self.user.id, 2, {'seconds': 30}))
+        self.assertEqual(event.day, event.occurred_at.date())
+
+    def test_deactivated_and_deleted_accounts_are_refused(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        batch = {'events': [{'type': 'lesson_opened', 'lesson': 2}]}
+        self.assertEqual(client.post('/api/v1/events/', batch, format='json').status_code, 202)
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(client.post('/api/v1/events/', batch, format='json').status_code, 401)
+        self.user.delete()
+        self.assertEqual(client.post('/api/v1/events/', batch, format='json').status_code, 401)
+        self.assertEqual(LearningEvent.objects.count(), 1)
+
+    def test_rollup_and_retention(self):
+        yesterday = timezone.now() - datetime.timedelta(days=1)
+        other = UserAccount.objects.create_user('other@example.com', 'Other', 'pass')
+        old = timezone.now() - datetime.timedelta(days=200)
+        LearningEvent.objects.bulk_create([
+            LearningEvent(user_id=user.id, type='lesson_opened', lesson_id=7, course_id=1,
+                          occurred_at=at, received_at=at, day=at.date())
+            for user, at in ((self.user, yesterday), (self.user, yesterday),
+                             (other, yesterday), (other, old))
+        ])
+        call_command('rollup_learning_events', stdout=StringIO())
+        total = LearningEventDaily.objects.get(day=yesterday.date())
+        self.assertEqual((total.type, total.lesson_id, total.events, total.learners),
+                         ('lesson_opened', 7, 3, 2))
+        self.assertEqual(LearningEvent.objects.count(), 3)
+
+        # Re-running is idempotent.
+        call_command('rollup_learning_events', stdout=StringIO())
+        self.assertEqual(LearningEventDaily.objects.filter(day=yesterday.date()).count(), 1)
+
+    @skipUnless(connection.vendor == 'postgresql', 'partitioning is PostgreSQL only')
+    def test_rows_move_into_new_day_partition(self):
+        self.client.post('/api/v1/events/', {'events': [{'type': 'lesson_opened'}]}, format='json')
+        today = timezone.now().date()
+        self.assertEqual(ensure_partitions(today, 2), [
+            partition_name(today), partition_name(today + datetime.timedelta(days=1))
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM {partition_name(today)}')
+            self.assertEqual(cursor.fetchone()[0], 1)
+        self.assertEqual(LearningEvent.objects.count(), 1)
+        self.assertEqual(ensure_partitions(today, 2), [])
@@ -0,0 +1,142 @@
+"""
+Responsive variants of Course.thumbnail.
+
+When a course gets a new thumbnail, every width in THUMBNAIL_WIDTHS is
+rendered as WebP and JPEG under course_thumbnails/variants/. The storage is
+content-addressed (courses.storage), so identical renders share files and
+the URLs can be cached forever. The names are stored in Course.thumbnail_variants, which
+the course serializers turn into ``thumbnail_srcset``.
+
+Variants are generated after commit on a background thread
+(THUMBNAIL_VARIANTS_IN_BACKGROUND), so the upload request does not wait for
+Pillow. ``manage.py generate_thumbnails`` catches up on courses whose
+variants are missing or stale, e.g. after a restart dropped queued work.
+"""
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from django.db.models import Q
+from PIL import Image, ImageOps
+
+from .blobs import update_references, variant_names
+from .cache import bump_catalog_version
+from .models import Course
+
+logger = logging.getLogger(__name__)
+
+VARIANT_DIR = 'course_thumbnails/variants'
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 6}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='thumbnails')
+
+
+def thumbnail_widths():
+    return sorted(getattr(settings, 'THUMBNAIL_WIDTHS', (160, 320, 640, 960)))
+
+
+def in_background():
+    return getattr(settings, 'THUMBNAIL_VARIANTS_IN_BACKGROUND', True)
+
+
+def needs_variants(course):
+    return (course.thumbnail_variants or {}).get('source') != (course.thumbnail.name or None)
+
+
+def render_variant(image, width, fmt):
+    format_name, options = FORMATS[fmt]
+    height = max(round(image.height * width / image.width), 1)
+    resized = image.resize((width, height), Image.Resampling.LANCZOS)
+    if fmt == 'jpeg' and resized.mode == 'RGBA':
+        background = Image.new('RGB', resized.size, 'white')
+        background.paste(resized, mask=resized.getchannel('A'))
+        resized = background
+    out = io.BytesIO()
+    resized.save(out, format_name, **options)
+    return out.getvalue()
+
+
+def build_variants(field):
+    """
+    Write the variants of an image field's file and return
+    ``{'source': name, 'width': w, 'webp': {width: name}, 'jpeg': {...}}``.
+    The field's content-addressed storage names each file after its hash.
+    """
+    storage = field.storage
+    with field.open('rb') as source:
+        image = ImageOps.exif_transpose(Image.open(source))
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        transparent = 'transparency' in image.info or 'A' in image.getbands()
+        image = image.convert('RGBA' if transparent else 'RGB')
+
+    # Never upscale; a source narrower than every width gets one variant.
+    widths = [width for width in thumbnail_widths() if width <= image.width] or [image.width]
+    variants = {'source': field.name, 'width': image.width}
+    for fmt in FORMATS:
+        variants[fmt] = {}
+        for width in widths:
+            content = ContentFile(render_variant(image, width, fmt))
+            variants[fmt][str(width)] = storage.save(f'{VARIANT_DIR}/{width}.{fmt}', content)
+    return variants
+
+
+def generate_thumbnail_variants(course_id):
+    """Generate and store the course's variants; returns True if it stored any."""
+    course = Course.objects.filter(pk=course_id).only('id', 'thumbnail', 'thumbnail_variants').first()
+    if course is None or not needs_variants(course):
+        return False
+    variants = build_variants(course.thumbnail) if course.thumbnail else {}
+    # Only if the thumbnail is still the one rendered.
+    current = Q(thumbnail=course.thumbnail.name or '')
+    if not course.thumbnail:
+        current |= Q(thumbnail__isnull=True)
+    with transaction.atomic():
+        stored = Course.objects.filter(current, pk=course_id).update(thumbnail_variants=variants)
+        if stored:
+            # update() sends no signals; see courses.blobs.
+            update_references(variant_names(course.thumbnail_variants), variant_names(variants))
+    if stored:
+        Course.touch(pk=course_id)
+        bump_catalog_version()
+    return bool(stored)
+
+
+def run_in_background(course_id):
+    try:
+        generate_thumbnail_variants(course_id)
+    except Exception:
+        logger.exception('Generating thumbnail variants for course %s failed', course_id)
+    finally:
+        # The worker thread has its own connection; don't leave it open.
+        connections.close_all()
+
+
+def queue_thumbnail_variants(course_id):
+    """Generate the course's variants once the current transaction commits."""
+    def submit():
+        if in_background():
+            executor.submit(run_in_background, course_id)
+        else:
+            generate_thumbnail_variants(course_id)
+    transaction.on_commit(submit)
+
+
+def thumbnail_srcset(course, build_url):
+    """``{'webp': srcset, 'jpeg': srcset}`` for the course, or None without variants."""
+    variants = course.thumbnail_variants or {}
+    if not variants.get('webp') or variants.get('source') != (course.thumbnail.name or None):
+        return None
+    storage = course.thumbnail.storage
+    return {
+        fmt: ', '.join(
+            f'{build_url(storage.url(name))} {width}w' for width, name in variants[fmt].items()
+        )
+        for fmt in FORMATS
+    }
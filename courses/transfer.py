@@ -0,0 +1,366 @@
+"""
+Course tree import and export.
+
+A course travels as one document: the course with its category, its
+modules with their lessons, and its assessments with their questions and
+choices::
+
+    {"format": "course-tree", "version": 1, "course": {
+        "title": ..., "category": {"slug": ..., "name": ...},
+        "modules": [{"key": 1, "title": ..., "lessons": [{"key": 7, ...}]}],
+        "assessments": [{"course": true, "module": 1, "lesson": 7, ...,
+                         "questions": [{..., "choices": [...]}]}]}}
+
+``key`` values only link assessments to the module and lesson they belong
+to; exports use the database ids, imports accept any string or number. As
+NDJSON the same tree is one record per line, parents first, each with a
+``type`` and a reference to its parent's key (see iter_records).
+
+Imports run in one transaction with one bulk_create per level, so the
+number of queries does not grow with the number of lessons. bulk_create
+skips Lesson.save() and the signals, so import_course() derives the lesson
+fields, hands out progress slots and refreshes counts, search documents,
+the outline and blob references itself. Thumbnails and resources are
+exported by blob name and only kept on import if that blob is stored here.
+"""
+import json
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+from assessments.models import Assessment, Choice, Question
+from .blobs import update_references
+from .cache import bump_catalog_version
+from .completion import allocate_progress_slots
+from .lesson_content import prepare_lesson
+from .models import Category, Course, Lesson, Module, StoredBlob
+from .outline import refresh_outline
+from .search import refresh_lesson_search_index
+
+FORMAT = 'course-tree'
+VERSION = 1
+BATCH_SIZE = 500
+
+COURSE_FIELDS = ('title', 'description', 'price')
+MODULE_FIELDS = ('title', 'description', 'order')
+LESSON_FIELDS = ('title', 'content', 'youtube_url', 'order')
+ASSESSMENT_FIELDS = ('title', 'assessment_type', 'duration', 'passing_score', 'max_attempts')
+QUESTION_FIELDS = ('text', 'question_type', 'marks', 'order')
+CHOICE_FIELDS = ('text', 'is_correct')
+
+
+class CourseImportError(Exception):
+    pass
+
+
+def export_course(course_id):
+    """The course's tree as a document, or None if the course does not exist."""
+    course = Course.objects.filter(pk=course_id).select_related('category').first()
+    if course is None:
+        return None
+
+    lessons = {}
+    for lesson in Lesson.objects.filter(module__course=course).order_by('order', 'id').values(
+        'id', 'module_id', *LESSON_FIELDS, 'resources', 'resource_name'
+    ):
+        lessons.setdefault(lesson['module_id'], []).append({
+            'key': lesson['id'], **{field: lesson[field] for field in LESSON_FIELDS},
+            'resources': lesson['resources'] or None,
+            'resource_name': lesson['resource_name'],
+        })
+    modules = [
+        {'key': module['id'], **{field: module[field] for field in MODULE_FIELDS},
+         'lessons': lessons.get(module['id'], [])}
+        for module in Module.objects.filter(course=course).order_by('order', 'id').values(
+            'id', *MODULE_FIELDS
+        )
+    ]
+
+    assessments = list(Assessment.objects.filter(
+        Q(course=course) | Q(module__course=course) | Q(lesson__module__course=course)
+    ).order_by('id').values('id', 'course_id', 'module_id', 'lesson_id', *ASSESSMENT_FIELDS))
+    questions = list(Question.objects.filter(
+        assessment__in=[assessment['id'] for assessment in assessments]
+    ).order_by('order', 'id').values('id', 'assessment_id', *QUESTION_FIELDS))
+    choices = {}
+    for choice in Choice.objects.filter(
+        question__in=[question['id'] for question in questions]
+    ).order_by('id').values('question_id', *CHOICE_FIELDS):
+        choices.setdefault(choice['question_id'], []).append(
+            {field: choice[field] for field in CHOICE_FIELDS}
+        )
+    by_assessment = {}
+    for question in questions:
+        by_assessment.setdefault(question['assessment_id'], []).append({
+            **{field: question[field] for field in QUESTION_FIELDS},
+            'choices': choices.get(question['id'], []),
+        })
+
+    return {'format': FORMAT, 'version': VERSION, 'course': {
+        'title': course.title,
+        'description': course.description,
+        'price': str(course.price) if course.price is not None else None,
+        'category': {'slug': course.category.slug, 'name': course.category.name}
+        if course.category else None,
+        'thumbnail': course.thumbnail.name or None,
+        'modules': modules,
+        'assessments': [
+            {
+                'key': assessment['id'],
+                'course': assessment['course_id'] is not None,
+                'module': assessment['module_id'],
+                'lesson': assessment['lesson_id'],
+                **{field: assessment[field] for field in ASSESSMENT_FIELDS},
+                'questions': by_assessment.get(assessment['id'], []),
+            }
+            for assessment in assessments
+        ],
+    }}
+
+
+def iter_records(document):
+    """The document as flat NDJSON records, parents before children."""
+    course = dict(document['course'])
+    modules, assessments = course.pop('modules', []), course.pop('assessments', [])
+    yield {'type': 'course', 'format': document.get('format', FORMAT),
+           'version': document.get('version', VERSION), **course}
+    for index, module in enumerate(modules):
+        module = dict(module)
+        module.setdefault('key', f'module-{index}')
+        lessons = module.pop('lessons', [])
+        yield {'type': 'module', **module}
+        for lesson in lessons:
+            yield {'type': 'lesson', **lesson, 'module': module['key']}
+    for index, assessment in enumerate(assessments):
+        assessment = dict(assessment)
+        assessment.setdefault('key', f'assessment-{index}')
+        questions = assessment.pop('questions', [])
+        yield {'type': 'assessment', **assessment}
+        for position, question in enumerate(questions):
+            question = dict(question)
+            question.setdefault('key', f"{assessment['key']}.{position}")
+            choices = question.pop('choices', [])
+            yield {'type': 'question', **question, 'assessment': assessment['key']}
+            for choice in choices:
+                yield {'type': 'choice', **choice, 'question': question['key']}
+
+
+def document_from_records(records):
+    """Rebuild the document from iter_records() output."""
+    document, course = None, None
+    parents = {'module': {}, 'assessment': {}, 'question': {}}
+    children = {'lesson': ('module', 'lessons'), 'question': ('assessment', 'questions'),
+                'choice': ('question', 'choices')}
+    for line, record in enumerate(records, 1):
+        if not isinstance(record, dict):
+            raise CourseImportError(f'line {line}: expected an object')
+        record = dict(record)
+        kind = record.pop('type', None)
+        if kind == 'course':
+            if document is not None:
+                raise CourseImportError(f'line {line}: a second course record')
+            document = {'format': record.pop('format', FORMAT),
+                        'version': record.pop('version', VERSION)}
+            course = document['course'] = {**record, 'modules': [], 'assessments': []}
+        elif document is None:
+            raise CourseImportError(f'line {line}: the course record must come first')
+        elif kind == 'module':
+            course['modules'].append({**record, 'lessons': []})
+            parents['module'][str(record.get('key'))] = course['modules'][-1]
+        elif kind == 'assessment':
+            course['assessments'].append({**record, 'questions': []})
+            parents['assessment'][str(record.get('key'))] = course['assessments'][-1]
+        elif kind in children:
+            parent_kind, collection = children[kind]
+            parent = parents[parent_kind].get(str(record.get(parent_kind)))
+            if parent is None:
+                raise CourseImportError(f'line {line}: unknown {parent_kind} {record.get(parent_kind)!r}')
+            record.pop(parent_kind)
+            if kind == 'question':
+                record['choices'] = []
+                parents['question'][str(record.get('key'))] = record
+            parent[collection].append(record)
+        else:
+            raise CourseImportError(f'line {line}: unknown record type {kind!r}')
+    if document is None:
+        raise CourseImportError('no course record')
+    return document
+
+
+def parse_ndjson(lines):
+    records = []
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            records.append(json.loads(line))
+        except ValueError as error:
+            raise CourseImportError(f'line {number}: {error}') from None
+    return document_from_records(records)
+
+
+class NDJSONParser(BaseParser):
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return parse_ndjson(line.decode() for line in stream)
+        except (CourseImportError, UnicodeDecodeError) as error:
+            raise ParseError(f'NDJSON parse error - {error}')
+
+
+def build(model, data, fields, where, **links):
+    """An unsaved ``model`` from ``data``, validated without queries."""
+    if not isinstance(data, dict):
+        raise CourseImportError(f'{where}: expected an object')
+    instance = model(**{field: data[field] for field in fields if field in data}, **links)
+    try:
+        instance.clean_fields(exclude=['id', *links])
+    except ValidationError as error:
+        problems = '; '.join(
+            f"{field}: {' '.join(messages)}" for field, messages in error.message_dict.items()
+        )
+        raise CourseImportError(f'{where}: {problems}') from None
+    return instance
+
+
+def with_default_order(data, position):
+    return {'order': position, **data} if isinstance(data, dict) else data
+
+
+def insert(model, instances, created):
+    """
+    bulk_create ``instances``; on backends that cannot return the new ids,
+    read them back from ``created`` (a queryset of just these rows).
+    """
+    model.objects.bulk_create(instances, batch_size=BATCH_SIZE)
+    if instances and instances[0].pk is None:
+        for instance, pk in zip(instances, created.order_by('pk').values_list('pk', flat=True)):
+            instance.pk = pk
+    return instances
+
+
+def lookup(keys, key, where, kind):
+    if key is None:
+        return None
+    if str(key) not in keys:
+        raise CourseImportError(f'{where}: unknown {kind} {key!r}')
+    return keys[str(key)]
+
+
+@transaction.atomic
+def import_course(document):
+    """
+    Create a new course from an export_course() document. Returns the
+    course and ``{'modules': n, 'lessons': n, 'assessments': n, ...}``.
+    """
+    if not isinstance(document, dict) or not isinstance(document.get('course'), dict):
+        raise CourseImportError('expected a document with a "course" object')
+    if document.get('format', FORMAT) != FORMAT or document.get('version', VERSION) != VERSION:
+        raise CourseImportError(f'expected a {FORMAT} document, version {VERSION}')
+    data = document['course']
+    module_data = [with_default_order(module, position)
+                   for position, module in enumerate(data.get('modules') or [])]
+
+    category = None
+    if data.get('category'):
+        slug = data['category'].get('slug')
+        if not slug:
+            raise CourseImportError('course.category: slug is required')
+        category = Category.objects.get_or_create(
+            slug=slug, defaults={'name': data['category'].get('name') or slug}
+        )[0]
+
+    # Files are shared by name (courses.storage); keep the ones stored here.
+    names = {data.get('thumbnail')} | {
+        lesson.get('resources') for module in module_data if isinstance(module, dict)
+        for lesson in module.get('lessons') or [] if isinstance(lesson, dict)
+    }
+    stored = set(StoredBlob.objects.filter(
+        name__in=[name for name in names if isinstance(name, str) and name]
+    ).values_list('name', flat=True))
+
+    course = build(Course, data, COURSE_FIELDS, 'course', category=category)
+    course.thumbnail = data.get('thumbnail') if data.get('thumbnail') in stored else None
+    course.save()  # One row; its signals index it and count the thumbnail.
+
+    modules = [build(Module, module, MODULE_FIELDS, f'modules[{i}]', course=course)
+               for i, module in enumerate(module_data)]
+    insert(Module, modules, Module.objects.filter(course=course))
+
+    lessons, lesson_keys, module_keys = [], {}, {}
+    for i, (module, source) in enumerate(zip(modules, module_data)):
+        module_keys[str(source.get('key', i))] = module
+        for j, lesson_data in enumerate(source.get('lessons') or []):
+            lesson_data = with_default_order(lesson_data, j)
+            lesson = build(Lesson, lesson_data, LESSON_FIELDS,
+                           f'modules[{i}].lessons[{j}]', module=module)
+            resources = lesson_data.get('resources')
+            lesson.resources = resources if resources in stored else None
+            if lesson.resources:
+                lesson.resource_name = str(lesson_data.get('resource_name') or '')[:255]
+            prepare_lesson(lesson)
+            lessons.append(lesson)
+            if 'key' in lesson_data:
+                lesson_keys[str(lesson_data['key'])] = lesson
+    if lessons:
+        first = allocate_progress_slots(course.pk, len(lessons))
+        for slot, lesson in enumerate(lessons, first):
+            lesson.progress_slot = slot
+    insert(Lesson, lessons, Lesson.objects.filter(module__course=course))
+    update_references([], [lesson.resources.name for lesson in lessons if lesson.resources])
+
+    assessments, question_data = [], []
+    for i, source in enumerate(data.get('assessments') or []):
+        where = f'assessments[{i}]'
+        if not isinstance(source, dict):
+            raise CourseImportError(f'{where}: expected an object')
+        lesson = lookup(lesson_keys, source.get('lesson'), where, 'lesson')
+        module = lookup(module_keys, source.get('module'), where, 'module')
+        linked = source.get('course', not (lesson or module))
+        assessments.append(build(
+            Assessment, source, ASSESSMENT_FIELDS, where,
+            course=course if linked else None, module=module, lesson=lesson,
+        ))
+        question_data.append(source.get('questions') or [])
+    insert(Assessment, assessments, Assessment.objects.filter(
+        Q(course=course) | Q(module__course=course) | Q(lesson__module__course=course)
+    ))
+
+    questions, choice_data = [], []
+    for i, (assessment, sources) in enumerate(zip(assessments, question_data)):
+        for j, source in enumerate(sources):
+            source = with_default_order(source, j)
+            questions.append(build(Question, source, QUESTION_FIELDS,
+                                   f'assessments[{i}].questions[{j}]', assessment=assessment))
+            choice_data.append((f'assessments[{i}].questions[{j}]', source.get('choices') or []))
+    insert(Question, questions, Question.objects.filter(assessment__in=assessments))
+
+    choices = [
+        build(Choice, source, CHOICE_FIELDS, f'{where}.choices[{k}]', question=question)
+        for question, (where, sources) in zip(questions, choice_data)
+        for k, source in enumerate(sources)
+    ]
+    Choice.objects.bulk_create(choices, batch_size=BATCH_SIZE)
+
+    refresh_lesson_search_index(Lesson.objects.filter(module__course=course))
+    Course.refresh_lesson_counts(pk=course.pk)
+    Course.touch(pk=course.pk)
+    transaction.on_commit(lambda: refresh_outline(course.pk))
+    bump_catalog_version()
+    course.refresh_from_db(fields=['lesson_count', 'content_version', 'updated_at'])
+    return course, {
+        'modules': len(modules), 'lessons': len(lessons), 'assessments': len(assessments),
+        'questions': len(questions), 'choices': len(choices),
+    }
+
+
+def dump_document(document, ndjson=False):
+    """The document serialised as JSON, or as NDJSON lines."""
+    if ndjson:
+        return ''.join(json.dumps(record) + '\n' for record in iter_records(document))
+    return json.dumps(document, indent=2) + '\n'
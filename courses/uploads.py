@@ -0,0 +1,148 @@
+"""
+Resumable, chunked uploads of lesson resources.
+
+1. ``POST /uploads/`` with the lesson, file name, size and optionally the
+   file's SHA-256 opens a session and answers with ``chunk_size``.
+2. ``PUT /uploads/<id>/chunks/<n>/`` sends chunk ``n`` (0-based) as the raw
+   body with its SHA-256 in ``X-Chunk-SHA256``. The body is streamed in small
+   blocks to a scratch file and, once its checksum matches, copied to its
+   offset in a pre-sized part file, so a request is bounded by one chunk and
+   memory by one block. A chunk that does not match never reaches the part
+   file, is not recorded and can simply be sent again, in any order.
+3. ``GET /uploads/<id>/`` lists the chunks received, to resume after a drop.
+4. ``POST /uploads/<id>/finalize/`` hashes the part file, checks the
+   whole-file SHA-256 and moves it into the content-addressed storage
+   (courses.storage) without copying it, then attaches it to the lesson
+   under the file name it was uploaded with.
+
+Part files live under the storage's incoming directory; collect_blobs drops
+them, and their sessions, once they are older than its grace period.
+"""
+import hashlib
+import os
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import ResourceUpload
+from .storage import TEMP_DIR, blob_storage, hash_file
+
+BLOCK_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def chunk_size_setting():
+    return getattr(settings, 'UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024)
+
+
+def max_upload_size():
+    return getattr(settings, 'UPLOAD_MAX_SIZE', 2 * 1024 ** 3)
+
+
+def part_path(upload):
+    return blob_storage.path(f'{TEMP_DIR}/upload-{upload.pk}.part')
+
+
+def open_upload(user, lesson, filename, size, checksum=''):
+    upload = ResourceUpload.objects.create(
+        user=user, lesson=lesson, filename=os.path.basename(filename), size=size,
+        chunk_size=chunk_size_setting(), checksum=checksum.lower(),
+    )
+    path = part_path(upload)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as part:
+        # Sparse on most filesystems; chunks are written at their offsets.
+        part.truncate(size)
+    return upload
+
+
+def chunk_length(upload, number):
+    if number == upload.chunk_count - 1:
+        return upload.size - number * upload.chunk_size
+    return upload.chunk_size
+
+
+def write_chunk(upload, number, stream, length, checksum):
+    """Stream chunk ``number`` from ``stream`` to the part file and record it."""
+    if not 0 <= number < upload.chunk_count:
+        raise UploadError('No such chunk', status=404)
+    expected = chunk_length(upload, number)
+    if length != expected:
+        raise UploadError(f'Chunk {number} must be {expected} bytes')
+    path = part_path(upload)
+    if not os.path.exists(path):
+        raise UploadError('Upload expired', status=410)
+
+    # Verified in a scratch file first: a bad re-send of a chunk that has
+    # already arrived must not overwrite the good bytes.
+    scratch_path = f'{path}.{number}.{uuid.uuid4().hex}.chunk'
+    try:
+        digest = hashlib.sha256()
+        remaining = expected
+        with open(scratch_path, 'w+b') as scratch:
+            while remaining:
+                block = stream.read(min(BLOCK_SIZE, remaining))
+                if not block:
+                    raise UploadError('Chunk ended early')
+                digest.update(block)
+                scratch.write(block)
+                remaining -= len(block)
+            if digest.hexdigest() != checksum.lower():
+                raise UploadError('Chunk checksum mismatch')
+
+            scratch.seek(0)
+            with open(path, 'r+b') as part:
+                part.seek(number * upload.chunk_size)
+                for block in iter(lambda: scratch.read(BLOCK_SIZE), b''):
+                    part.write(block)
+    finally:
+        os.unlink(scratch_path)
+
+    with transaction.atomic():
+        # Chunks may arrive in parallel; serialise the bookkeeping only.
+        upload = ResourceUpload.objects.select_for_update().get(pk=upload.pk)
+        if number not in upload.received:
+            upload.received = sorted([*upload.received, number])
+            upload.save(update_fields=['received', 'updated_at'])
+    return upload
+
+
+def finalize_upload(upload):
+    """Store the assembled file and attach it to the lesson; returns the lesson."""
+    missing = sorted(set(range(upload.chunk_count)) - set(upload.received))
+    if missing:
+        raise UploadError(f'Missing chunks: {missing[:20]}', status=409)
+    path = part_path(upload)
+    if not os.path.exists(path):
+        raise UploadError('Upload expired', status=410)
+
+    digest, size = hash_file(path)
+    if upload.checksum and digest != upload.checksum:
+        raise UploadError('File checksum mismatch')
+
+    lesson = upload.lesson
+    field = lesson.resources
+    # The part file becomes the blob; nothing is copied.
+    name = field.storage.store_file(
+        path, field.field.generate_filename(lesson, upload.filename), digest, size
+    )
+    lesson.resources = name
+    lesson.resource_name = upload.filename
+    lesson.resource_size = None  # Measured again on save.
+    lesson.save(update_fields=['resources', 'resource_name'])
+    discard_upload(upload)
+    return lesson
+
+
+def discard_upload(upload):
+    try:
+        os.unlink(part_path(upload))
+    except FileNotFoundError:
+        pass
+    upload.delete()
@@ -1,102 +1,290 @@
-from rest_framework import viewsets, permissions, status
+from rest_framework import viewsets, permissions, status, fields
 from rest_framework.decorators import action
-from django.db.models import Count
+from rest_framework.parsers import JSONParser
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from django.db import transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.db.models import Count, Exists, OuterRef, Prefetch, Subquery, Value, BooleanField
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.db.models import Case, When, F
 from django.core.exceptions import ObjectDoesNotExist
+from django.contrib.auth.models import AnonymousUser
 from django.db.models import *
 
 
 from rest_framework.response import Response
-from .models import Category, Course, Module, Lesson, Enrollment, UserProgress, ReviewRating, Contact
+from .models import (
+    Category, Course, CourseProgress, Module, Lesson, Enrollment, ResourceUpload, UserProgress,
+    ReviewRating, Contact
+)
+from .search import search_courses, search_lessons, lesson_snippets
+from .authentication import ActiveTokenUserAuthentication
+from .enrollments import enrollment_counts
+from .permissions import IsAdminOrReadOnly
+from .pagination import CatalogPagination, KeysetPagination, LessonSearchPagination
+from .conditional import (
+    ConditionalRetrieveMixin, course_validators, module_validators, lesson_validators
+)
+from .progress import progress_summary, sync_progress, toggle_progress
+from .bundles import bundle_entries, bundle_name, write_bundle
+from .downloads import content_disposition, serve_file
+from .events import ingest_events
+from .outline import course_outline, outline_etag
+from .player import current_lesson, lesson_quizzes, player_course, player_outline
+from .positions import lesson_access, record_position, resume_positions
+from .progress_buffer import (
+    FlushBufferedProgressMixin, buffer_enabled, buffer_progress, buffer_stats
+)
+from .cloning import clone_course
+from .cache import catalog_cache_key, catalog_cache_timeout, get_catalog_entry, set_catalog_entry
+from .storage import blob_storage
+from .transfer import CourseImportError, NDJSONParser, dump_document, export_course, import_course
+from .uploads import UploadError, discard_upload, finalize_upload, open_upload, write_chunk
 from .serializers import (
     CategorySerializer,
     CourseSerializer,
+    CourseCloneSerializer,
+    CourseSummarySerializer,
     CourseCreateSerializer,
     ModuleSerializer,
     LessonSerializer,
+    LessonSearchResultSerializer,
+    LessonPositionSerializer,
+    LearningEventSerializer,
+    LearningEventBatchSerializer,
+    ResourceUploadSerializer,
     UserProgressSerializer,
+    ProgressSyncSerializer,
+    ProgressSyncItemSerializer,
     EnrollmentSerializer,
     ReviewRatingSerializer,
     ContactSerializer
 
 )
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CatalogCacheMixin:
+    """
+    Serves list and retrieve from the versioned catalog cache (courses.cache).
+    Cached payloads are always built as the anonymous user; views with
+    per-user fields put them back in merge_user_fields().
+    """
+    building_shared_payload = False
+
+    def get_catalog_user(self):
+        if self.building_shared_payload:
+            return AnonymousUser()
+        return self.request.user
+
+    def merge_user_fields(self, data):
+        return data
+
+    def merge_live_fields(self, data):
+        """Per-user fields no serializer fills in, cache or not."""
+        return data
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if not catalog_cache_timeout():
+            response = handler(request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                self.merge_live_fields(response.data)
+            return response
+
+        key = catalog_cache_key(request, f'{self.basename}-{self.action}')
+        data = get_catalog_entry(key)
+        if data is None:
+            self.building_shared_payload = True
+            try:
+                response = handler(request, *args, **kwargs)
+            finally:
+                self.building_shared_payload = False
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            data = response.data
+            set_catalog_entry(key, data)
+        return Response(self.merge_live_fields(self.merge_user_fields(data)))
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+
+class CategoryViewSet(CatalogCacheMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
-class CourseViewSet(viewsets.ModelViewSet):
-    queryset = Course.objects.all()
+class CourseViewSet(FlushBufferedProgressMixin, ConditionalRetrieveMixin, CatalogCacheMixin,
+                    viewsets.ModelViewSet):
+    queryset = Course.objects.order_by('-id')
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = KeysetPagination
+    max_page_size = 50
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action not in ['list', 'retrieve', 'search']:
+            return queryset
+
+        user = self.get_catalog_user()
+        enrollments_count = Enrollment.objects.filter(
+            course=OuterRef('pk')
+        ).order_by().values('course').annotate(total=Count('id')).values('total')
+        queryset = queryset.select_related('category').annotate(
+            enrollments_count=Coalesce(Subquery(enrollments_count), 0),
+        )
+        full_tree = self.wants_full_tree()
+        if full_tree:
+            queryset = queryset.prefetch_related(
+                Prefetch('modules', queryset=Module.objects.prefetch_related('lessons')),
+            )
+
+        # Per-user fields are resolved here so the serializer never has to
+        # query once per course.
+        if user.is_authenticated:
+            queryset = queryset.annotate(
+                is_enrolled=Exists(
+                    Enrollment.objects.filter(course=OuterRef('pk'), user=user)
+                ),
+            )
+            if full_tree:
+                queryset = queryset.prefetch_related(
+                    Prefetch(
+                        'userprogress_set',
+                        queryset=UserProgress.objects.filter(user=user).select_related('module'),
+                        to_attr='user_progress_list',
+                    ),
+                )
+        else:
+            queryset = queryset.annotate(
+                is_enrolled=Value(False, output_field=BooleanField()),
+            )
+        return queryset
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
         context['request'] = self.request
+        context['user'] = self.get_catalog_user()
         return context
 
+    def get_validators(self):
+        return course_validators(self.kwargs['pk'], self.request.user)
+
+    def merge_user_fields(self, data):
+        user = self.request.user
+        if not user.is_authenticated:
+            return data
+
+        if isinstance(data, dict) and 'results' in data:
+            courses = data['results']
+        elif isinstance(data, list):
+            courses = data
+        else:
+            courses = [data]
+        course_ids = [course['id'] for course in courses]
+        enrolled = set(Enrollment.objects.filter(
+            user=user, course_id__in=course_ids
+        ).values_list('course_id', flat=True))
+
+        progress = {}
+        tree_ids = [course['id'] for course in courses if 'user_progress' in course]
+        if tree_ids:
+            for row in UserProgress.objects.filter(
+                user=user, course_id__in=tree_ids
+            ).select_related('module'):
+                progress.setdefault(row.course_id, []).append(row)
+
+        for course in courses:
+            course['is_enrolled'] = course['id'] in enrolled
+            if 'user_progress' in course:
+                course['user_progress'] = UserProgressSerializer(
+                    progress.get(course['id'], []), many=True
+                ).data
+        return data
+
+    def merge_live_fields(self, data):
+        courses = data.get('results', [data]) if isinstance(data, dict) else data
+        if catalog_cache_timeout() and courses:
+            # Enrollments do not orphan cached pages, so counts come from
+            # courses.enrollments.
+            counts = enrollment_counts([course['id'] for course in courses])
+            for course in courses:
+                course['enrollments_count'] = counts[course['id']]
+
+        # Video resume positions move every few seconds, so they are read
+        # from courses.positions on every request.
+        user = self.request.user
+        if not user.is_authenticated:
+            return data
+        lessons = [
+            lesson for course in courses for module in course.get('modules', [])
+            for lesson in module['lessons']
+        ]
+        if lessons:
+            positions = resume_positions(user.pk, [lesson['id'] for lesson in lessons])
+            for lesson in lessons:
+                lesson['resume_position'] = positions.get(lesson['id'])
+        return data
+
+    @property
+    def paginator(self):
+        # The catalog can still be browsed by page number with ?page=N.
+        if 'page' in self.request.query_params and not hasattr(self, '_paginator'):
+            self._paginator = CatalogPagination()
+        return super().paginator
+
+    def wants_full_tree(self):
+        """
+        retrieve always returns the nested module/lesson tree; list and search
+        return catalog cards unless the client asks for ?view=full.
+        """
+        if self.action == 'retrieve':
+            return True
+        return self.request.query_params.get('view', 'summary') == 'full'
+
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
             return CourseCreateSerializer
+        if self.action in ['list', 'search'] and not self.wants_full_tree():
+            return CourseSummarySerializer
         return CourseSerializer
     @action(detail=True, methods=['post'],
             permission_classes=[permissions.IsAuthenticated],
             url_path='toggle_lesson_progress',
             url_name='toggle-lesson-progress')
     def toggle_lesson_progress(self, request, pk=None):
-        course = self.get_object()
-        lesson_id = request.data.get('lesson_id')
+        lesson_id = str(request.data.get('lesson_id') or '')
 
         if not lesson_id:
             return Response(
                 {"error": "lesson_id parameter is required"},
                 status=status.HTTP_400_BAD_REQUEST
             )
-
-        try:
-            # Verify lesson exists and belongs to course
-            lesson = Lesson.objects.get(
-                id=lesson_id,
-                module__course=course
-            )
-
-            # Get or create progress entry
-            progress, created = UserProgress.objects.get_or_create(
-                user=request.user,
-                course=course,
-                lesson=lesson,
-                defaults={
-                    'module': lesson.module,
-                    'completed': True,
-                    'completed_at': timezone.now()
-                }
-            )
-
-            # Toggle if existing entry
-            if not created:
-                progress.completed = not progress.completed
-                progress.completed_at = timezone.now() if progress.completed else None
-                progress.save()
-
-            return Response({
-                "id": progress.id,
-                "completed": progress.completed,
-                "lesson_id": lesson.id,
-                "module_id": lesson.module.id
-            }, status=status.HTTP_200_OK)
-
-        except ObjectDoesNotExist:
+        if not lesson_id.isdigit() or not str(pk).isdigit():
             return Response(
                 {"error": "Lesson not found in this course"},
                 status=status.HTTP_404_NOT_FOUND
             )
-        except Exception as e:
+
+        # One upsert checks membership and flips the flag atomically
+        toggled = toggle_progress(request.user, int(pk), int(lesson_id))
+        if toggled is None:
             return Response(
-                {"error": str(e)},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                {"error": "Lesson not found in this course"},
+                status=status.HTTP_404_NOT_FOUND
             )
 
+        progress_id, completed, module_id = toggled
+        return Response({
+            "id": progress_id,
+            "completed": completed,
+            "lesson_id": int(lesson_id),
+            "module_id": module_id
+        }, status=status.HTTP_200_OK)
+
     @action(detail=True, methods=['get'],
             permission_classes=[permissions.IsAuthenticated],
             url_path='progress',
@@ -106,13 +294,186 @@ class CourseViewSet(viewsets.ModelViewSet):
         progress = UserProgress.objects.filter(
             user=request.user,
             course=course
-        ).select_related('lesson', 'module')
+        ).select_related('module').order_by('module__order', 'lesson__order', 'lesson_id')
         serializer = UserProgressSerializer(progress, many=True)
+        # The count and last change come from the CourseProgress bitset.
+        record = CourseProgress.objects.filter(user=request.user, course=course).only(
+            'completed_count', 'updated_at'
+        ).first()
         return Response({
             'course_id': course.id,
+            'completed_count': record.completed_count if record else 0,
+            'updated_at': record.updated_at if record else None,
             'progress': serializer.data
         })
 
+    @action(detail=True, methods=['get'],
+            permission_classes=[permissions.AllowAny],
+            authentication_classes=[],
+            url_path='outline')
+    def outline(self, request, pk=None):
+        """The stored module/lesson outline (courses.outline), sent as stored."""
+        outline = course_outline(int(pk)) if str(pk).isdigit() else None
+        if outline is None:
+            return Response({"error": "Course not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        document = outline[0]
+        etag = outline_etag(document)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(document, content_type='application/json')
+        response['ETag'] = etag
+        patch_cache_control(response, no_cache=True)
+        return response
+
+    @action(detail=True, methods=['get'],
+            permission_classes=[permissions.IsAuthenticated],
+            url_path='bundle')
+    def bundle(self, request, pk=None):
+        """
+        The course as a zip for offline use (courses.bundles); learners must
+        be enrolled. Served from the stored bundle, with Range and conditional
+        support, once one exists for the current content; until then a Range
+        request gets 416 and the client starts over with a plain download.
+        """
+        course = Course.objects.filter(pk=pk).annotate(
+            is_enrolled=Exists(Enrollment.objects.filter(user=request.user, course=OuterRef('pk'))),
+        ).values(
+            'id', 'is_enrolled', 'content_version', 'updated_at'
+        ).first() if str(pk).isdigit() else None
+        if course is None:
+            return Response({"error": "Course not found"}, status=status.HTTP_404_NOT_FOUND)
+        if not (course['is_enrolled'] or request.user.is_staff):
+            return Response(
+                {"error": "Enroll in the course to download it"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        name = bundle_name(course['id'], course['content_version'], course['updated_at'])
+        if not blob_storage.exists(name):
+            if 'Range' in request.headers:
+                response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+                response['Content-Range'] = 'bytes */*'
+                patch_cache_control(response, private=True, no_cache=True)
+                return response
+            response = StreamingHttpResponse(write_bundle(name, bundle_entries(course['id'])),
+                                             content_type='application/zip')
+            response['Content-Disposition'] = content_disposition(name)
+            patch_cache_control(response, private=True, no_cache=True)
+            patch_vary_headers(response, ['Authorization'])
+            return response
+        return serve_file(request, blob_storage, name, 'application/zip')
+
+    @action(detail=True, methods=['post'],
+            permission_classes=[permissions.IsAdminUser],
+            url_path='clone')
+    def clone(self, request, pk=None):
+        """
+        Copy the course with its modules and lessons, and by default its
+        assessments, questions and choices (courses.cloning).
+        """
+        serializer = CourseCloneSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        cloned = clone_course(int(pk), **serializer.validated_data) if str(pk).isdigit() else None
+        if cloned is None:
+            return Response({"error": "Course not found"}, status=status.HTTP_404_NOT_FOUND)
+        course, counts = cloned
+        return Response({"id": course.pk, "title": course.title, **counts},
+                        status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['get'],
+            permission_classes=[permissions.IsAdminUser],
+            url_path='export')
+    def export_tree(self, request, pk=None):
+        """
+        The course with its modules, lessons, assessments, questions and
+        choices (courses.transfer); ?as=ndjson for one record per line.
+        """
+        document = export_course(int(pk)) if str(pk).isdigit() else None
+        if document is None:
+            return Response({"error": "Course not found"}, status=status.HTTP_404_NOT_FOUND)
+        ndjson = request.query_params.get('as') == 'ndjson'
+        response = HttpResponse(
+            dump_document(document, ndjson=ndjson),
+            content_type='application/x-ndjson' if ndjson else 'application/json',
+        )
+        response['Content-Disposition'] = content_disposition(
+            f"course-{pk}.{'ndjson' if ndjson else 'json'}"
+        )
+        return response
+
+    @action(detail=False, methods=['post'],
+            permission_classes=[permissions.IsAdminUser],
+            parser_classes=[JSONParser, NDJSONParser],
+            url_path='import')
+    def import_tree(self, request):
+        """Create a course from an export document, sent as JSON or NDJSON."""
+        try:
+            course, counts = import_course(request.data)
+        except CourseImportError as error:
+            return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"id": course.pk, **counts}, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['get'],
+            permission_classes=[permissions.IsAuthenticated],
+            authentication_classes=[JWTStatelessUserAuthentication],
+            url_path='player')
+    def player(self, request, pk=None):
+        """
+        Everything needed to open a lesson: outline, current lesson body,
+        completion set, lesson quizzes (no answers) and rating status, in at
+        most five queries (courses.player). ?lesson=<id> picks the lesson; by
+        default it is the first one not yet completed. Learners must be
+        enrolled in the course.
+        """
+        lesson_id = request.query_params.get('lesson')
+        if not str(pk).isdigit() or (lesson_id is not None and not lesson_id.isdigit()):
+            return Response({"error": "Not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        user_id = request.user.pk
+        course = player_course(user_id, int(pk))
+        if course is None:
+            return Response({"error": "Course not found"}, status=status.HTTP_404_NOT_FOUND)
+        # The token carries no staff or active flag; both come from the row.
+        if not course['user_is_active']:
+            return Response({"error": "User is inactive"}, status=status.HTTP_401_UNAUTHORIZED)
+        if not (course['is_enrolled'] or course['user_is_staff']):
+            return Response(
+                {"error": "Enroll in the course to open its lessons"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        modules, completed_ids = player_outline(course)
+        for field in ('completed_bits', 'outline_document', 'outline_slots',
+                      'user_is_staff', 'user_is_active'):
+            del course[field]
+        outline = [lesson for module in modules for lesson in module['lessons']]
+
+        if lesson_id is None:
+            pending = [lesson for lesson in outline if not lesson['completed']]
+            lesson_id = (pending or outline or [{'id': None}])[0]['id']
+        lesson = current_lesson(course['id'], lesson_id) if lesson_id else None
+        if lesson_id and lesson is None:
+            return Response(
+                {"error": "Lesson not found in this course"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        positions = resume_positions(user_id, [item['id'] for item in outline])
+        for item in outline:
+            item['resume_position'] = positions.get(item['id'])
+        user_rating = course.pop('user_rating')
+        return Response({
+            'course': course,
+            'modules': modules,
+            'lesson': LessonSerializer(lesson, context={
+                'request': request, 'resume_positions': positions,
+            }).data if lesson else None,
+            'quizzes': lesson_quizzes(lesson.id) if lesson else [],
+            'completed_lessons': completed_ids,
+            'has_rated': user_rating is not None,
+            'rating': user_rating,
+        })
+
     @action(detail=True, methods=['post'],
             permission_classes=[permissions.IsAuthenticated],
             url_path='enroll')
@@ -155,14 +516,16 @@ class CourseViewSet(viewsets.ModelViewSet):
             )
 
 
-    @action(detail=False, methods=['get'], permission_classes=[permissions.AllowAny])
+    @action(detail=False, methods=['get'],
+            permission_classes=[permissions.AllowAny],
+            pagination_class=CatalogPagination)
     def search(self, request):
-        """Search courses by title or description"""
+        """Full-text search over course title, category and description"""
+        return self.cached_response(self.search_response, request)
+
+    def search_response(self, request):
         search_term = request.query_params.get('search', '')
-        queryset = self.get_queryset().filter(
-            Q(title__icontains=search_term) |
-            Q(description__icontains=search_term)
-        ).distinct()
+        queryset = search_courses(self.get_queryset(), search_term)
 
         page = self.paginate_queryset(queryset)
         if page is not None:
@@ -173,16 +536,18 @@ class CourseViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 # views.py
-class UserProgressViewSet(viewsets.ModelViewSet):
+class UserProgressViewSet(FlushBufferedProgressMixin, viewsets.ModelViewSet):
     serializer_class = UserProgressSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    buffered_progress_actions = ('create', 'buffer')
 
     def get_queryset(self):
-        return UserProgress.objects.filter(user=self.request.user)
+        return UserProgress.objects.filter(user=self.request.user).select_related('module')
 
     def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(page, many=True)
         result = {}
         for progress in serializer.data:
             course_id = str(progress['course'])
@@ -193,13 +558,13 @@ class UserProgressViewSet(viewsets.ModelViewSet):
                 "completed": progress['completed'],
                 "updated_at": progress['completed_at']
             })
-        print(f"Returning progress: {result}")  # Debug log
-        return Response(result)
+        return self.get_paginated_response(result)
 
     def create(self, request, *args, **kwargs):
         course_id = request.data.get('courseId')
         lesson_id = request.data.get('lessonId')
-        completed = request.data.get('completed', True)
+        # Form posts send "False" as a string, which is truthy
+        completed = str(request.data.get('completed', True)).lower() not in fields.BooleanField.FALSE_VALUES
 
         if not course_id or not lesson_id:
             return Response(
@@ -210,6 +575,18 @@ class UserProgressViewSet(viewsets.ModelViewSet):
         try:
             course = Course.objects.get(id=course_id)
             lesson = Lesson.objects.get(id=lesson_id, module__course=course)
+            if buffer_enabled() and buffer_progress(
+                request.user.pk, course.id, lesson.module_id, lesson.id, completed
+            ):
+                # Acknowledged now, written by the next buffer flush
+                return Response({
+                    "course": course.id,
+                    "lesson": {"id": lesson.id},
+                    "completed": completed,
+                    "completed_at": timezone.now() if completed else None,
+                    "buffered": True
+                }, status=status.HTTP_202_ACCEPTED)
+            # update_or_create is atomic, so the CourseProgress bit moves with the row
             progress, created = UserProgress.objects.update_or_create(
                 user=request.user,
                 course=course,
@@ -221,7 +598,6 @@ class UserProgressViewSet(viewsets.ModelViewSet):
                 }
             )
             serializer = self.get_serializer(progress)
-            print(f"Saved progress: {serializer.data}")  # Debug log
             return Response(serializer.data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
         except (Course.DoesNotExist, Lesson.DoesNotExist):
             return Response(
@@ -229,13 +605,61 @@ class UserProgressViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
         except Exception as e:
-            print(f"Error saving progress: {e}")
             return Response(
                 {"error": str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=False, methods=['post'])
+    def sync(self, request):
+        """
+        Apply a batch of offline progress events:
+        {"courseId": 1, "items": [{"lessonId": 2, "completed": true, "completed_at": "..."}]}
+        Every item gets a result: applied, stale (a newer write is stored),
+        superseded (a newer item for the same lesson is in the batch),
+        not_found (lesson is not in the course) or invalid.
+        """
+        serializer = ProgressSyncSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        course_id = serializer.validated_data['courseId']
+
+        items, results = [], []
+        for raw in serializer.validated_data['items']:
+            item = ProgressSyncItemSerializer(data=raw)
+            if item.is_valid():
+                items.append(item.validated_data)
+                results.append(None)
+            else:
+                results.append({
+                    'lessonId': raw.get('lessonId') if isinstance(raw, dict) else None,
+                    'status': 'invalid',
+                    'errors': item.errors,
+                })
+
+        outcomes = zip(items, sync_progress(request.user, course_id, items))
+        for position, result in enumerate(results):
+            if result is not None:
+                continue
+            item, (outcome, row) = next(outcomes)
+            result = {'lessonId': item['lessonId'], 'status': outcome}
+            if row is not None:
+                result['completed'] = row.completed
+                result['completed_at'] = row.completed_at
+            results[position] = result
+        return Response({'course_id': course_id, 'results': results})
+
+    @action(detail=False, methods=['get'])
+    def summary(self, request):
+        """Completion percentage, last activity and next lesson per enrolled course"""
+        return Response(progress_summary(request.user))
+
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAdminUser])
+    def buffer(self, request):
+        """Write-behind buffer depth and flush latency"""
+        return Response(buffer_stats())
+
     @action(detail=True, methods=['put'])
+    @transaction.atomic
     def toggle_complete(self, request, pk=None):
         progress = self.get_object()
         progress.completed = not progress.completed
@@ -243,32 +667,210 @@ class UserProgressViewSet(viewsets.ModelViewSet):
         progress.save()
         return Response(self.get_serializer(progress).data)
 
-class ModuleViewSet(viewsets.ModelViewSet):
+class ModuleViewSet(ConditionalRetrieveMixin, viewsets.ModelViewSet):
     serializer_class = ModuleSerializer
-    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    permission_classes = [IsAdminOrReadOnly]
 
     def get_queryset(self):
-        return Module.objects.filter(course_id=self.kwargs['course_pk'])
+        queryset = Module.objects.prefetch_related('lessons')
+        # Only filtered when mounted under a course route.
+        if 'course_pk' in self.kwargs:
+            queryset = queryset.filter(course_id=self.kwargs['course_pk'])
+        return queryset
+
+    def get_validators(self):
+        return module_validators(self.kwargs['pk'])
 
     def perform_create(self, serializer):
         course = Course.objects.get(pk=self.kwargs['course_pk'])
         serializer.save(course=course)
 
-class LessonViewSet(viewsets.ModelViewSet):
+class LessonViewSet(ConditionalRetrieveMixin, viewsets.ModelViewSet):
     serializer_class = LessonSerializer
-    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    permission_classes = [IsAdminOrReadOnly]
 
     def get_queryset(self):
-        return Lesson.objects.filter(module_id=self.kwargs['module_pk'])
+        queryset = Lesson.objects.all()
+        # Only filtered when mounted under a module route.
+        if 'module_pk' in self.kwargs:
+            queryset = queryset.filter(module_id=self.kwargs['module_pk'])
+        return queryset
+
+    def get_validators(self):
+        return lesson_validators(self.kwargs['pk'])
 
     def perform_create(self, serializer):
         module = Module.objects.get(pk=self.kwargs['module_pk'])
         serializer.save(module=module)
 
+    @action(detail=True, methods=['post'],
+            permission_classes=[permissions.IsAuthenticated],
+            url_path='position')
+    def position(self, request, pk=None):
+        """
+        Playback heartbeat: {"position": 93.5, "duration": 600}. Stored in the
+        cache only; flush_lesson_positions persists it. Learners must be
+        enrolled in the course; the check is cached, so a warm heartbeat only
+        loads the (active) user.
+        """
+        serializer = LessonPositionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        access = lesson_access(request.user, int(pk)) if str(pk).isdigit() else None
+        if access is None:
+            return Response({"error": "Lesson not found"}, status=status.HTTP_404_NOT_FOUND)
+        if not access:
+            return Response(
+                {"error": "Enroll in the course to save your place in its videos"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        position = serializer.validated_data['position']
+        duration = serializer.validated_data.get('duration')
+        if duration:
+            position = min(position, duration)
+        record_position(request.user.pk, int(pk), position, duration)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['get'],
+            permission_classes=[permissions.IsAuthenticated],
+            url_path='resource')
+    def resource(self, request, pk=None):
+        """
+        Download the lesson's resource file; learners must be enrolled in the
+        course. Supports Range and conditional requests (courses.downloads).
+        """
+        lesson = Lesson.objects.filter(pk=pk).annotate(
+            is_enrolled=Exists(Enrollment.objects.filter(
+                user=request.user, course=OuterRef('module__course')
+            )),
+        ).only(
+            'id', 'resources', 'resource_content_type', 'resource_name'
+        ).first() if str(pk).isdigit() else None
+        if lesson is None or not lesson.resources:
+            return Response({"error": "Resource not found"}, status=status.HTTP_404_NOT_FOUND)
+        if not (lesson.is_enrolled or request.user.is_staff):
+            return Response(
+                {"error": "Enroll in the course to download its resources"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        return serve_file(request, lesson.resources.storage, lesson.resources.name,
+                          lesson.resource_content_type, lesson.resource_name)
+
+    @action(detail=False, methods=['get'],
+            permission_classes=[permissions.AllowAny],
+            pagination_class=LessonSearchPagination)
+    def search(self, request):
+        """Full-text search over lesson titles and content, optionally within one course"""
+        search_term = request.query_params.get('search', '')
+        course_id = request.query_params.get('course')
+        if course_id is not None and not course_id.isdigit():
+            return Response(
+                {"error": "course must be a course id"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Lesson bodies are never loaded; the snippet is cut by the database.
+        queryset = Lesson.objects.select_related('module__course').only(
+            'id', 'title', 'order',
+            'module', 'module__title', 'module__course', 'module__course__title',
+        )
+        if course_id:
+            queryset = queryset.filter(module__course_id=course_id)
+        queryset = search_lessons(queryset, search_term)
+
+        page = self.paginate_queryset(queryset)
+        serializer = LessonSearchResultSerializer(page, many=True, context={
+            'request': request,
+            'snippets': lesson_snippets([lesson.id for lesson in page], search_term),
+        })
+        return self.get_paginated_response(serializer.data)
+
+
+class LearningEventViewSet(viewsets.GenericViewSet):
+    """
+    Batched activity ingest: {"events": [{"type": "lesson_opened", "course": 1,
+    "lesson": 2, "at": "...", "data": {...}}]}. Ids are stored as sent, without
+    lookups, and the batch is one insert, so the SPA can report every
+    interaction.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    authentication_classes = [ActiveTokenUserAuthentication]
+    serializer_class = LearningEventBatchSerializer
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        events, rejected = [], []
+        for index, raw in enumerate(serializer.validated_data['events']):
+            event = LearningEventSerializer(data=raw)
+            if event.is_valid():
+                events.append(event.validated_data)
+            else:
+                rejected.append({'index': index, 'errors': event.errors})
+
+        accepted = ingest_events(request.user.pk, events) if events else 0
+        return Response(
+            {'accepted': accepted, 'rejected': rejected},
+            status=status.HTTP_202_ACCEPTED
+        )
+
+
+class ResourceUploadViewSet(viewsets.GenericViewSet):
+    """
+    Resumable chunked uploads of lesson resources, for staff; see
+    courses.uploads for the protocol. Sessions are only visible to the user
+    who opened them.
+    """
+    serializer_class = ResourceUploadSerializer
+    permission_classes = [permissions.IsAdminUser]
+
+    def get_queryset(self):
+        return ResourceUpload.objects.filter(user=self.request.user).select_related('lesson')
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        upload = open_upload(request.user, data['lesson'], data['filename'], data['size'],
+                             data.get('checksum', ''))
+        return Response(self.get_serializer(upload).data, status=status.HTTP_201_CREATED)
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(self.get_serializer(self.get_object()).data)
+
+    def destroy(self, request, *args, **kwargs):
+        discard_upload(self.get_object())
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['put'], url_path=r'chunks/(?P<number>\d+)')
+    def chunk(self, request, pk=None, number=None):
+        """Raw chunk body with its SHA-256 in X-Chunk-SHA256; never parsed by DRF."""
+        upload = self.get_object()
+        checksum = request.headers.get('X-Chunk-SHA256', '')
+        if not checksum:
+            return Response({"error": "X-Chunk-SHA256 header is required"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+        try:
+            upload = write_chunk(upload, int(number), request.stream, length, checksum)
+        except UploadError as e:
+            return Response({"error": str(e)}, status=e.status)
+        return Response({'received': upload.received, 'chunk_count': upload.chunk_count})
+
+    @action(detail=True, methods=['post'])
+    def finalize(self, request, pk=None):
+        try:
+            lesson = finalize_upload(self.get_object())
+        except UploadError as e:
+            return Response({"error": str(e)}, status=e.status)
+        return Response(LessonSerializer(lesson, context={'request': request}).data)
+
 
 class EnrollmentViewSet(viewsets.ModelViewSet):
     serializer_class = EnrollmentSerializer  # Create this serializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         return Enrollment.objects.filter(user=self.request.user)
@@ -278,6 +880,7 @@ class ContactViewSet(viewsets.ModelViewSet):
     queryset = Contact.objects.all()
     serializer_class = ContactSerializer
     permission_classes = [permissions.AllowAny]  # Allow anyone to submit
+    pagination_class = KeysetPagination
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)